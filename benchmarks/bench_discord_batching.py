@@ -0,0 +1,133 @@
+"""
+Log storm benchmark for discord handler batching.
+
+Feeds a failed build worth of stderr lines through MessageBatcher, the old merge loop it replaced and the whole
+BufferedDiscordHandler with a fake webhook session. Run with: python -m benchmarks.bench_discord_batching
+"""
+
+import argparse
+import collections
+import logging
+import time
+
+from typing import Any
+
+from usautobuild.batching import MessageBatcher
+from usautobuild.logger import BufferedDiscordHandler
+
+LIMIT = BufferedDiscordHandler.DISCORD_MESSAGE_LEN_LIMIT
+
+
+def make_storm(lines: int) -> list[str]:
+    return [
+        f"[24-10-19 12:00:00::usautobuild::ERROR] Assets/Scripts/Core/Thing{i}.cs(12,{i % 80}): error CS0246: "
+        f"The type or namespace name 'Foo{i}' could not be found"
+        for i in range(lines)
+    ]
+
+
+def legacy_batches(messages: list[str]) -> int:
+    """Merge loop BufferedDiscordHandler used before MessageBatcher, without waiting"""
+
+    pending = collections.deque((message, True) for message in messages)
+    batches = 0
+
+    while pending:
+        message, malf = pending.popleft()
+        if len(message) > LIMIT:
+            pending.appendleft((message[LIMIT:], malf))
+            message = message[:LIMIT]
+        else:
+            while pending:
+                next_message, next_malf = pending.popleft()
+                if next_malf != malf or len(message) + len(next_message) + 1 > LIMIT:
+                    pending.appendleft((next_message, next_malf))
+                    break
+
+                message = f"{message}\n{next_message}"
+
+        batches += 1
+
+    return batches
+
+
+def batcher_batches(messages: list[str]) -> int:
+    batcher = MessageBatcher(LIMIT, max_age=1)
+    batches = 0
+
+    for message in messages:
+        batcher.add(message, True)
+        while batcher.pop_ready() is not None:
+            batches += 1
+
+    batcher.seal()
+    while batcher.pop_ready() is not None:
+        batches += 1
+
+    return batches
+
+
+class FakeResponse:
+    status_code = 204
+    headers: dict[str, str] = {}  # noqa: RUF012
+
+
+class FakeSession:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def post(self, *_args: Any, **_kwargs: Any) -> FakeResponse:
+        self.calls += 1
+
+        return FakeResponse()
+
+    def close(self) -> None: ...
+
+
+def bench_handler(messages: list[str]) -> tuple[float, int, int]:
+    # measure handler overhead, not discord pacing
+    BufferedDiscordHandler.MIN_SEND_INTERVAL = 0
+
+    handler = BufferedDiscordHandler("http://localhost/webhook", queue_size=len(messages) + 1)
+    session = FakeSession()
+    handler._session = session  # type: ignore[assignment]
+
+    logger = logging.Logger("bench", logging.INFO)
+    logger.addHandler(handler)
+
+    start = time.perf_counter()
+    for message in messages:
+        logger.error(message)
+    handler.stop()
+
+    return time.perf_counter() - start, session.calls, handler.dropped
+
+
+def report(name: str, elapsed: float, count: int, calls: int) -> None:
+    print(f"{name:<10} {elapsed * 1000:10.1f} ms  {count / elapsed:12.0f} msg/s  {calls:6} webhook calls")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--lines", type=int, default=20_000, help="amount of log lines in storm")
+    args = ap.parse_args()
+
+    messages = make_storm(args.lines)
+    # a single huge record, like stderr dumped in one message
+    dump = ["\n".join(messages)]
+
+    for name, func in (("legacy", legacy_batches), ("batcher", batcher_batches)):
+        for storm_name, storm in (("lines", messages), ("dump", dump)):
+            start = time.perf_counter()
+            calls = func(storm)
+            report(f"{name}/{storm_name}", time.perf_counter() - start, len(messages), calls)
+
+    elapsed, calls, dropped = bench_handler(messages)
+    report("handler", elapsed, len(messages), calls)
+
+    if dropped:
+        print(f"handler dropped {dropped} messages")
+
+
+if __name__ == "__main__":
+    main()
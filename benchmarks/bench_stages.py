@@ -0,0 +1,311 @@
+"""
+End to end benchmark of pipeline stages on synthetic builds.
+
+Builder and Dockerizer run against fake docker executable that sleeps for simulated time and writes synthetic builds,
+GoodFiles and archiving run on those builds and Uploader uploads archives to in-process FTP server. Reported overhead
+is wall time minus what stand-ins slept, that is time spent by this project. Run from repository root with:
+python -m benchmarks.bench_stages
+
+Results saved with --save can be passed as --baseline to later runs, which then fail if overhead of any stage grew
+more than tolerance.
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from collections.abc import Callable, Iterator
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+from benchmarks import fake_docker
+from benchmarks.synthetic import TARGETS, make_builds, make_workspace, tree_size
+from tests.ftp_server import FTPServer
+from usautobuild.config import Config
+
+STAGES = ("build", "verify", "good_files", "archive", "good_files_archive", "upload", "good_files_upload", "docker")
+
+_MB = 1024 * 1024
+# regressions smaller than this are noise whatever the tolerance
+_SLACK = 0.05
+
+
+@dataclass
+class StageResult:
+    stage: str
+    seconds: float = 0.0
+    # input size of stage
+    bytes: int = 0
+    # time stand-ins spent sleeping
+    simulated: float = 0.0
+    skipped: Optional[str] = None
+
+    @property
+    def overhead(self) -> float:
+        return max(0.0, self.seconds - self.simulated)
+
+    @property
+    def throughput(self) -> Optional[float]:
+        """Megabytes per second of overhead"""
+
+        if not self.bytes or not self.overhead:
+            return None
+
+        return self.bytes / _MB / self.overhead
+
+    def as_dict(self) -> dict[str, object]:
+        return {**asdict(self), "overhead": self.overhead, "throughput": self.throughput}
+
+
+@contextlib.contextmanager
+def workspace(path: Optional[Path]) -> Iterator[Path]:
+    """Temporary working directory, stages read and write relative to it"""
+
+    with tempfile.TemporaryDirectory(prefix="usautobuild-bench-") as tmp:
+        root = Path(tmp) if path is None else path
+        root.mkdir(parents=True, exist_ok=True)
+
+        previous = Path.cwd()
+        os.chdir(root)
+        try:
+            yield root
+        finally:
+            os.chdir(previous)
+
+
+def make_config(root: Path, ftp_port: int, targets: tuple[str, ...], connections: int = 1) -> Config:
+    return Config.resolve(
+        {
+            "config_file": root / "config.json",
+            "do_good_files": True,
+            "cdn_host": "127.0.0.1",
+            "cdn_port": ftp_port,
+            "cdn_connections": connections,
+            "cdn_user": "bench",
+            "cdn_password": "bench",
+            "docker_password": "bench",
+            "docker_username": "bench",
+            "changelog_api_url": "http://127.0.0.1/",
+            "changelog_api_key": "bench",
+            "changelog_webhook": "http://127.0.0.1/",
+            "newest_build_api_url": "http://127.0.0.1/",
+            "target_platforms": list(targets),
+            "output_dir": root / "builds",
+            "project_path": root / "local_repo" / "UnityProject",
+            "license_file": root / "UnityLicense.ulf",
+            "state_file": root / "logs" / "run-state.json",
+        },
+        environ={},
+    )
+
+
+def measure(stage: str, run: Callable[[], None], size: int = 0, simulated: float = 0.0) -> StageResult:
+    start = time.perf_counter()
+    try:
+        run()
+    except ImportError as e:
+        return StageResult(stage, skipped=f"missing dependency {e.name}")
+
+    return StageResult(stage, time.perf_counter() - start, size, simulated)
+
+
+def run_stages(root: Path, args: argparse.Namespace) -> list[StageResult]:
+    timings = fake_docker.DockerTimings(
+        pull=args.pull_time,
+        editor=args.editor_time,
+        image_build=args.image_build_time,
+        push=args.push_time,
+        build_mb=args.size,
+    )
+    fake_docker.install(root / "bin", timings)
+    os.environ["PATH"] = f"{root / 'bin'}{os.pathsep}{os.environ['PATH']}"
+
+    targets = tuple(args.targets)
+    player_targets = [target for target in targets if target != "linuxserver"]
+    results = []
+
+    (root / "config.json").write_text("{}")
+
+    with contextlib.ExitStack() as stack:
+        server = stack.enter_context(FTPServer(root / "cdn", latency=args.latency, discard=args.discard))
+        config = make_config(root, server.port, targets, args.connections)
+        make_workspace(root, config.unity_version)
+        (root / "builds").mkdir(exist_ok=True)
+        (root / "cdn" / "unitystation").mkdir(exist_ok=True)
+
+        def build() -> None:
+            from usautobuild.actions.builder import Builder
+
+            builder = Builder(config)
+            builder.create_builds_folders()
+            for target in targets:
+                builder.build(target)
+
+        result = measure("build", build, simulated=len(targets) * (timings.pull + timings.editor))
+        results.append(result)
+        if result.skipped is not None:
+            make_builds(root / "builds", targets, args.size)
+
+        builds_size = {target: tree_size(root / "builds" / target) for target in targets}
+
+        def verify() -> None:
+            from usautobuild.actions.verifier import Verifier
+
+            Verifier(config).start_verifying()
+
+        results.append(measure("verify", verify, sum(builds_size.values())))
+
+        # setting up GoodFiles reads workspace, uploader connects on use only
+        from usautobuild.actions.good_files import GoodFiles
+        from usautobuild.actions.uploader import Uploader
+
+        uploader = Uploader(config)
+        stack.callback(uploader.sessions.close)
+        good_files = root / "builds" / "good_files"
+        version = "bench"
+
+        results.append(
+            measure(
+                "good_files",
+                GoodFiles(config).make_good_files_build,
+                sum(builds_size[target] for target in player_targets),
+            )
+        )
+
+        def archive() -> None:
+            for target in targets:
+                uploader.zip_build_folder(target)
+
+        results.append(measure("archive", archive, sum(builds_size.values())))
+
+        archives: list[Path] = []
+
+        def good_files_archive() -> None:
+            for target in player_targets:
+                archives.append(uploader.zip_directory(good_files / target, target, version))
+
+        results.append(
+            measure(
+                "good_files_archive",
+                good_files_archive,
+                sum(tree_size(good_files / target) for target in player_targets),
+            )
+        )
+
+        # latency of concurrent connections overlaps, simulated time is then an upper bound
+        def ftp_measure(stage: str, run: Callable[[], None], size: int) -> StageResult:
+            replies = server.stats.replies
+            result = measure(stage, run, size)
+            result.simulated = server.latency * (server.stats.replies - replies)
+
+            return result
+
+        results.append(
+            ftp_measure(
+                "upload",
+                uploader.upload_to_cdn,
+                sum(uploader.archive_path(target).stat().st_size for target in targets),
+            )
+        )
+
+        def good_files_upload() -> None:
+            with uploader.sessions.connection() as ftp:
+                for path in archives:
+                    uploader.upload_file_to_ftp(ftp, path, f"/unitystation/GoodFiles/{version}/{path.name}")
+
+        archives_size = sum(path.stat().st_size for path in archives)
+        results.append(ftp_measure("good_files_upload", good_files_upload, archives_size))
+
+        if "linuxserver" in targets:
+            from usautobuild.actions.dockerizer import Dockerizer
+
+            results.append(
+                measure(
+                    "docker",
+                    Dockerizer(config).start_dockering,
+                    builds_size["linuxserver"],
+                    simulated=timings.image_build + 2 * timings.push,
+                )
+            )
+        else:
+            results.append(StageResult("docker", skipped="linuxserver is not built"))
+
+    return results
+
+
+def report(results: list[StageResult]) -> None:
+    print(f"{'stage':<20} {'wall':>9} {'overhead':>9} {'size':>10} {'throughput':>12}")
+
+    for result in results:
+        if result.skipped is not None:
+            print(f"{result.stage:<20} {'-':>9} {'-':>9} {'-':>10} {'-':>12}  skipped: {result.skipped}")
+            continue
+
+        throughput = "-" if result.throughput is None else f"{result.throughput:.1f}MB/s"
+        print(
+            f"{result.stage:<20} {result.seconds:8.2f}s {result.overhead:8.2f}s "
+            f"{result.bytes / _MB:8.1f}MB {throughput:>12}"
+        )
+
+
+def regressions(results: list[StageResult], baseline: dict[str, dict[str, float]], tolerance: float) -> list[str]:
+    found = []
+
+    for result in results:
+        if result.skipped is not None or (previous := baseline.get(result.stage)) is None:
+            continue
+
+        limit = previous["overhead"] * (1 + tolerance) + _SLACK
+        if result.overhead > limit:
+            found.append(f"{result.stage}: overhead {result.overhead:.2f}s, baseline {previous['overhead']:.2f}s")
+
+    return found
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", type=float, default=64.0, help="megabytes of every synthetic build")
+    ap.add_argument("--targets", nargs="+", default=list(TARGETS), help="targets to build")
+    ap.add_argument("--editor-time", type=float, default=2.0, help="simulated seconds of every editor run")
+    ap.add_argument("--pull-time", type=float, default=0.5, help="simulated seconds of every image pull")
+    ap.add_argument("--image-build-time", type=float, default=0.5, help="simulated seconds of docker build")
+    ap.add_argument("--push-time", type=float, default=0.5, help="simulated seconds of every docker push")
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds FTP server waits before every reply")
+    ap.add_argument("--connections", type=int, default=1, help="CDN connections uploads run over")
+    ap.add_argument("--discard", action="store_true", help="do not write uploads to disk")
+    ap.add_argument("--workdir", type=Path, help="keep workspace in this directory instead of a temporary one")
+    ap.add_argument("--save", type=Path, help="write results as json")
+    ap.add_argument("--baseline", type=Path, help="results of earlier run to check for regressions")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed overhead growth over baseline")
+    ap.add_argument("-v", "--verbose", action="store_true", help="show log of stages")
+    args = ap.parse_args()
+
+    if unknown := set(args.targets) - set(TARGETS):
+        ap.error(f"unknown targets: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    with workspace(args.workdir) as root:
+        results = run_stages(root, args)
+
+    report(results)
+
+    if args.save is not None:
+        args.save.write_text(json.dumps({result.stage: result.as_dict() for result in results}, indent=2))
+
+    if args.baseline is not None:
+        found = regressions(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Cold start benchmark of build script commands.
+
+Every sample is a fresh interpreter importing main and whatever the command imports before doing actual work, time
+includes interpreter startup. Also lists which of the slow third party libraries got imported. Run from repository
+root with: python -m benchmarks.bench_startup
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY = ("git", "requests", "humanize")
+
+# modules imported by each command path on top of main
+COMMANDS = {
+    "help": [],
+    "submit": [],
+    "get-license": ["usautobuild.actions.licenser"],
+    "stable": ["usautobuild.actions.stable_tagger"],
+    # logs its version on start
+    "daemon": ["git", "humanize"],
+    "worker": ["usautobuild.actions.gitter", "usautobuild.actions.builder"],
+    "build": [
+        "usautobuild.actions.api_caller",
+        "usautobuild.actions.builder",
+        "usautobuild.actions.discord_changelog_poster",
+        "usautobuild.actions.dockerizer",
+        "usautobuild.actions.gitter",
+        "usautobuild.actions.good_files",
+        "usautobuild.actions.uploader",
+    ],
+}
+
+_SNIPPET = """
+import importlib, json, sys, time
+start = time.perf_counter()
+import main
+for name in {modules!r}:
+    importlib.import_module(name)
+imports = time.perf_counter() - start
+print(json.dumps({{"imports": imports, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def sample(modules: list[str], importtime: bool = False) -> subprocess.CompletedProcess[str]:
+    argv = [sys.executable, "-X", "importtime"] if importtime else [sys.executable]
+
+    return subprocess.run(
+        [*argv, "-c", _SNIPPET.format(modules=modules, heavy=HEAVY)],  # noqa: S603
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+
+def bench(modules: list[str], runs: int) -> tuple[float, float, list[str]]:
+    """Median process and import time in milliseconds and heavy modules loaded"""
+
+    totals = []
+    imports = []
+    heavy: list[str] = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = sample(modules)
+        totals.append(time.perf_counter() - start)
+
+        if proc.returncode:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+        result = json.loads(proc.stdout)
+        imports.append(result["imports"])
+        heavy = result["heavy"]
+
+    return statistics.median(totals) * 1000, statistics.median(imports) * 1000, heavy
+
+
+def top_imports(modules: list[str], count: int) -> list[tuple[int, str]]:
+    """Modules with largest own import time in microseconds"""
+
+    timings = []
+
+    for line in sample(modules, importtime=True).stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+
+        self_time, _, name = line.removeprefix("import time:").split("|")
+        timings.append((int(self_time), name.strip()))
+
+    return sorted(timings, reverse=True)[:count]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--runs", type=int, default=10, help="samples per command")
+    ap.add_argument("--top", type=int, default=0, help="show this many slowest imports of every command")
+    ap.add_argument("commands", nargs="*", help=f"commands to measure, all by default: {', '.join(COMMANDS)}")
+    args = ap.parse_args()
+
+    if unknown := set(args.commands) - COMMANDS.keys():
+        ap.error(f"unknown commands: {', '.join(sorted(unknown))}")
+
+    print(f"{'command':<12} {'process':>10} {'imports':>10}  heavy modules")
+
+    for command in args.commands or COMMANDS:
+        modules = COMMANDS[command]
+
+        try:
+            total, imports, heavy = bench(modules, args.runs)
+        except RuntimeError as e:
+            print(f"{command:<12} {'-':>10} {'-':>10}  failed: {e}")
+            continue
+
+        print(f"{command:<12} {total:8.1f}ms {imports:8.1f}ms  {', '.join(heavy) or '-'}")
+
+        for self_time, name in top_imports(modules, args.top):
+            print(f"{'':<12} {self_time / 1000:8.1f}ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
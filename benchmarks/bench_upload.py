@@ -0,0 +1,90 @@
+"""
+FTP upload data path benchmark.
+
+Uploads a synthetic archive to the local FTP server the way the uploader does, hashing every block, with default
+storbinary, storbinary with large blocks and store_file. Client CPU is time spent by the uploading thread alone,
+server threads are not counted. Run with: python -m benchmarks.bench_upload
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from collections.abc import Callable
+from ftplib import FTP
+from pathlib import Path
+
+from tests.ftp_server import FTPServer
+from usautobuild.cdn import BLOCK_SIZE, store_file
+from usautobuild.integrity import StreamDigest
+
+MB = 1024 * 1024
+
+
+def make_file(path: Path, size_mb: int) -> None:
+    block = os.urandom(MB)
+    with path.open("wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+
+def storbinary(blocksize: int) -> Callable[[FTP, Path, StreamDigest], None]:
+    def upload(ftp: FTP, path: Path, digest: StreamDigest) -> None:
+        with path.open("rb") as f:
+            ftp.storbinary("STOR archive.zip", f, blocksize, callback=digest.update)
+
+    return upload
+
+
+def stored(ftp: FTP, path: Path, digest: StreamDigest) -> None:
+    store_file(ftp, "archive.zip", path, digest.update)
+
+
+METHODS = {
+    "storbinary 8KiB": storbinary(8192),
+    f"storbinary {BLOCK_SIZE // MB}MiB": storbinary(BLOCK_SIZE),
+    f"store_file {BLOCK_SIZE // MB}MiB": stored,
+}
+
+
+def bench(server: FTPServer, path: Path, upload: Callable[[FTP, Path, StreamDigest], None]) -> tuple[float, float]:
+    """Wall and client thread CPU seconds of a single upload"""
+
+    ftp = FTP()  # noqa: S321
+    ftp.connect(server.host, server.port)
+    ftp.login("bench", "bench")
+
+    digest = StreamDigest()
+    wall, cpu = time.perf_counter(), time.thread_time()
+    upload(ftp, path, digest)
+    wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+
+    assert digest.size == path.stat().st_size
+    ftp.quit()
+
+    return wall, cpu
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--size", type=int, default=512, help="archive size in MB")
+    ap.add_argument("--repeat", type=int, default=3, help="best of this many uploads is reported")
+    ap.add_argument("--keep", action="store_true", help="write uploads to disk instead of discarding them")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_upload_") as tmp:
+        root = Path(tmp)
+        path = root / "archive.zip"
+        make_file(path, args.size)
+        (root / "cdn").mkdir()
+
+        print(f"{args.size}MB archive, best of {args.repeat}")
+        with FTPServer(root / "cdn", discard=not args.keep) as server:
+            for name, upload in METHODS.items():
+                wall, cpu = min(bench(server, path, upload) for _ in range(args.repeat))
+                print(f"{name:<24} {wall:8.2f}s {args.size / wall:10.1f} MB/s {cpu * 1000 / args.size:8.2f} ms CPU/MB")
+
+
+if __name__ == "__main__":
+    main()
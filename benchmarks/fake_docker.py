@@ -0,0 +1,169 @@
+"""
+Stand-in for docker command line used by Builder and Dockerizer benchmarks.
+
+Understands only commands this project runs. Editor runs write unity-like log and synthetic build into mounted builds
+folder, everything sleeps for configured simulated time. Installed as docker executable by install(), pulled images and
+built image sizes are remembered in state file next to it.
+"""
+
+import json
+import os
+import secrets
+import sys
+import time
+
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from benchmarks.synthetic import make_build, tree_size
+
+__all__ = (
+    "DockerTimings",
+    "install",
+)
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+@dataclass
+class DockerTimings:
+    """Simulated seconds spent by docker commands"""
+
+    pull: float = 2.0
+    pull_cached: float = 0.1
+    editor: float = 5.0
+    image_build: float = 2.0
+    push: float = 2.0
+    # size of build produced by every editor run
+    build_mb: float = 64.0
+
+
+def install(bin_dir: Path, timings: DockerTimings) -> Path:
+    """Write docker executable into bin_dir, put bin_dir first in PATH for it to be used"""
+
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    executable = bin_dir / "docker"
+    executable.write_text(
+        "#!/bin/sh\n"
+        f"export PYTHONPATH='{_ROOT}'\n"
+        f"export FAKE_DOCKER_TIMINGS='{json.dumps(asdict(timings))}'\n"
+        f"export FAKE_DOCKER_STATE='{bin_dir / 'docker-state.json'}'\n"
+        f"exec '{sys.executable}' -m benchmarks.fake_docker \"$@\"\n"
+    )
+    executable.chmod(0o755)
+
+    return executable
+
+
+def _option(args: Sequence[str], name: str) -> str:
+    return args[args.index(name) + 1]
+
+
+def _to_host(path: str, mounts: dict[str, str]) -> Path:
+    for container, host in sorted(mounts.items(), key=lambda item: -len(item[0])):
+        if path == container or path.startswith(f"{container}/"):
+            return Path(host + path[len(container) :])
+
+    raise SystemExit(f"fake docker: {path} is not mounted")
+
+
+def _log(logfile: Path, line: str) -> None:
+    with logfile.open("a") as f:
+        f.write(f"{line}\n")
+
+
+def _run(args: list[str], timings: DockerTimings) -> int:
+    mounts = {}
+    i = 0
+    while not args[i].startswith("unity"):
+        if args[i] == "-v":
+            host, container = args[i + 1].split(":", 1)
+            mounts[container] = host
+            i += 1
+        i += 1
+
+    Path(_option(args, "--cidfile")).write_text(secrets.token_hex(32))
+
+    editor_args = args[i:]
+    logfile = _to_host(_option(editor_args, "-logfile"), mounts)
+    build_path = _to_host(_option(editor_args, "-customBuildPath"), mounts)
+    target = build_path.parent.name
+
+    # editor phases take fixed shares of the simulated time
+    phases = [
+        (0.1, f"- Completed reload, in {timings.editor * 0.1:.3f} seconds"),
+        (0.2, f"- Finished script compilation in {timings.editor * 0.2:.3f} seconds"),
+        (0.3, f"Asset Pipeline Refresh: Total: {timings.editor * 0.3:.3f} seconds - Initiated by InitialRefreshV2"),
+        (0.4, "Compiling shader variants for Standard"),
+    ]
+    for share, line in phases:
+        time.sleep(timings.editor * share)
+        _log(logfile, line)
+
+    size = make_build(build_path.parent, target, timings.build_mb)
+    _log(logfile, f"Complete build size {size / 1024 / 1024:.1f} mb")
+    _log(logfile, "Build Finished, Result: Success.")
+
+    return 0
+
+
+def main(argv: list[str]) -> int:
+    timings = DockerTimings(**json.loads(os.environ["FAKE_DOCKER_TIMINGS"]))
+    state_file = Path(os.environ["FAKE_DOCKER_STATE"])
+    state = json.loads(state_file.read_text()) if state_file.exists() else {"pulled": [], "images": {}}
+
+    command, args = argv[0], argv[1:]
+
+    if command == "pull":
+        image = args[-1]
+        if image in state["pulled"]:
+            time.sleep(timings.pull_cached)
+            print(f"Status: Image is up to date for {image}")
+        else:
+            time.sleep(timings.pull)
+            state["pulled"].append(image)
+            print(f"Status: Downloaded newer image for {image}")
+    elif command == "run":
+        return _run(args, timings)
+    elif command == "build":
+        context = Path(args[-1])
+        tags = [args[i + 1] for i, arg in enumerate(args) if arg == "-t"]
+        size = tree_size(context)
+        cached = tags[0] in state["images"]
+
+        print(f"#1 transferring context: {size / 1024 / 1024:.1f}MB")
+        print("#2 [1/3] FROM docker.io/library/ubuntu:22.04")
+        print("#2 CACHED")
+        time.sleep(timings.image_build)
+        print("#3 [2/3] COPY server /server")
+        if cached:
+            print("#3 CACHED")
+        print("#4 [3/3] RUN chmod +x /server/Unitystation")
+
+        for tag in tags:
+            state["images"][tag] = size + 80 * 1024 * 1024
+    elif command == "login":
+        sys.stdin.read()
+        print("Login Succeeded")
+    elif command == "push":
+        time.sleep(timings.push)
+        print(f"{args[-1].rsplit(':', 1)[-1]}: digest: sha256:{secrets.token_hex(32)} size: 1234")
+    elif command == "image" and args[0] == "inspect":
+        if (size := state["images"].get(args[-1])) is None:
+            print(f"Error: No such image: {args[-1]}", file=sys.stderr)
+            return 1
+        print(size)
+    elif command == "rm":
+        print(args[-1])
+    else:
+        print(f"fake docker: unsupported command {command}", file=sys.stderr)
+        return 1
+
+    state_file.write_text(json.dumps(state))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
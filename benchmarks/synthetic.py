@@ -0,0 +1,166 @@
+"""
+Synthetic Unity player builds.
+
+Trees follow layout of real builds of every target: few large asset files holding most of the size, a couple hundred
+small managed dlls, native player libraries and OSX .app bundle. Asset data is half incompressible so archiving costs
+about as much as on real builds, content is derived from seed so the same tree is generated every time.
+"""
+
+import json
+import random
+
+from pathlib import Path
+
+__all__ = (
+    "TARGETS",
+    "make_build",
+    "make_builds",
+    "make_workspace",
+    "tree_size",
+)
+
+TARGETS = ("linuxserver", "StandaloneWindows64", "StandaloneOSX", "StandaloneLinux64")
+
+_BLOCK = 1024 * 1024
+_MB = 1024 * 1024
+
+# share of total size
+_ASSETS_SHARE = 0.8
+_NATIVE_SHARE = 0.12
+_MANAGED_SHARE = 0.08
+
+_MANAGED_DLLS = 180
+_KEPT_DLLS = ("Assembly-CSharp", "Mirror", "UnityEngine.CoreModule", "Newtonsoft.Json")
+_BUNDLED_DLLS = ("Assembly-CSharp", "Mirror")
+
+
+class _Filler:
+    """Writes seeded data where every second block is random and every other one is text-like"""
+
+    def __init__(self, seed: int) -> None:
+        rng = random.Random(seed)
+        self.random = rng.randbytes(_BLOCK)
+        words = (b"m_Name: ", b"m_Script: ", b"fileID: ", b"guid: ", b"\n  ")
+        self.text = b"".join(rng.choice(words) for _ in range(_BLOCK // 3))[:_BLOCK]
+
+    def write(self, path: Path, size: int) -> int:
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with path.open("wb") as f:
+            written = 0
+            block = 0
+            while written < size:
+                data = self.random if block % 2 else self.text
+                chunk = data[: min(_BLOCK, size - written)]
+                f.write(chunk)
+                written += len(chunk)
+                block += 1
+
+        return size
+
+
+def _data_dir(root: Path, target: str) -> Path:
+    if target == "StandaloneOSX":
+        return root / "Unitystation.app" / "Contents" / "Resources" / "Data"
+
+    return root / "Unitystation_Data"
+
+
+def _native_files(root: Path, target: str) -> list[Path]:
+    if target == "StandaloneWindows64":
+        return [
+            root / "Unitystation.exe",
+            root / "UnityPlayer.dll",
+            root / "MonoBleedingEdge" / "EmbedRuntime" / "mono-2.0-bdwgc.dll",
+        ]
+
+    if target == "StandaloneOSX":
+        contents = root / "Unitystation.app" / "Contents"
+        return [
+            contents / "MacOS" / "Unitystation",
+            contents / "Frameworks" / "UnityPlayer.dylib",
+            contents / "Frameworks" / "MonoBleedingEdge" / "MonoEmbedRuntime" / "osx" / "libmonobdwgc-2.0.dylib",
+        ]
+
+    return [root / "Unitystation", root / "UnityPlayer.so", root / "GameAssembly.so"]
+
+
+def make_build(root: Path, target: str, size_mb: float = 64.0, seed: int = 0) -> int:
+    """Generate build of target in root, returns total size in bytes"""
+
+    filler = _Filler(seed)
+    size = int(size_mb * _MB)
+    data = _data_dir(root, target)
+    total = 0
+
+    if target == "StandaloneOSX":
+        contents = root / "Unitystation.app" / "Contents"
+        contents.mkdir(parents=True, exist_ok=True)
+        (contents / "Info.plist").write_text(
+            '<?xml version="1.0" encoding="UTF-8"?>\n<plist version="1.0"><dict>'
+            "<key>CFBundleExecutable</key><string>Unitystation</string></dict></plist>\n"
+        )
+        filler.write(contents / "Resources" / "PlayerIcon.icns", 64 * 1024)
+
+    assets = [("data.unity3d", 0.45), ("sharedassets0.assets", 0.25), ("resources.assets", 0.2)]
+    assets += [(f"sharedassets{i}.assets", 0.1 / 8) for i in range(1, 9)]
+    for name, share in assets:
+        total += filler.write(data / name, int(size * _ASSETS_SHARE * share))
+
+    natives = _native_files(root, target)
+    for path in natives:
+        total += filler.write(path, int(size * _NATIVE_SHARE / len(natives)))
+
+    if target == "linuxserver":
+        # server is built with il2cpp, code is compiled into native library and metadata
+        total += filler.write(data / "il2cpp_data" / "Metadata" / "global-metadata.dat", int(size * _MANAGED_SHARE))
+    else:
+        # managed dlls are small and many, sizes vary the way real assemblies do
+        rng = random.Random(seed)
+        weights = [rng.paretovariate(1.5) for _ in range(_MANAGED_DLLS)]
+        scale = size * _MANAGED_SHARE / sum(weights)
+        for i, weight in enumerate(weights):
+            name = _KEPT_DLLS[i] if i < len(_KEPT_DLLS) else f"Unity.Module{i}"
+            total += filler.write(data / "Managed" / f"{name}.dll", max(4096, int(weight * scale)))
+
+    for name in ("app.info", "boot.config", "globalgamemanagers", "level0"):
+        total += filler.write(data / name, 16 * 1024)
+
+    for i in range(20):
+        total += filler.write(data / "StreamingAssets" / "Config" / f"config{i}.json", 2048)
+    total += filler.write(data / "Resources" / "unity default resources", 512 * 1024)
+
+    return total
+
+
+def make_builds(output_dir: Path, targets: tuple[str, ...] = TARGETS, size_mb: float = 64.0) -> int:
+    """Generate build of every target in its folder of output_dir, returns total size in bytes"""
+
+    return sum(make_build(output_dir / target, target, size_mb, seed=i) for i, target in enumerate(targets))
+
+
+def make_workspace(root: Path, unity_version: str) -> None:
+    """Files of cloned game repository and bundled dlls that GoodFiles and Dockerizer read from working directory"""
+
+    code_scan = root / "local_repo/Tools/CodeScanning/CodeScan/CodeScan/bin/Debug/net7.0"
+    code_scan.mkdir(parents=True, exist_ok=True)
+    (code_scan / "FilesToMoveToManaged.json").write_text(json.dumps(list(_KEPT_DLLS)))
+
+    bundled = root / "bundledDLL"
+    bundled.mkdir(parents=True, exist_ok=True)
+    (bundled / "version.json").write_text(json.dumps({"Version": unity_version}))
+
+    filler = _Filler(0)
+    for target in TARGETS:
+        for name in _BUNDLED_DLLS:
+            filler.write(bundled / target / f"{name}.dll", 256 * 1024)
+
+    docker = root / "local_repo" / "Docker"
+    docker.mkdir(parents=True, exist_ok=True)
+    (docker / "Dockerfile").write_text("FROM ubuntu:22.04\nCOPY server /server\nCMD /server/Unitystation\n")
+
+    (root / "logs").mkdir(exist_ok=True)
+
+
+def tree_size(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
@@ -1,77 +1,353 @@
+from __future__ import annotations
+
 import logging
+import os
+import sys
+
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any
 
-from usautobuild.actions import (
-    ApiCaller,
-    Builder,
-    DiscordChangelogPoster,
-    Dockerizer,
-    Gitter,
-    Licenser,
-    Uploader,
-    tag_as_stable,
-    GoodFiles
-)
-from usautobuild.cli import args
-from usautobuild.config import Config
+from usautobuild.cli import parse_args
+from usautobuild.config import Config, current_build_number
 from usautobuild.logger import Logger
 from usautobuild.utils import git_version
 
+if TYPE_CHECKING:
+    from usautobuild.cdn import FTPSessionManager
+    from usautobuild.checkpoint import RunState
+    from usautobuild.daemon import BuildJob
+
 log = logging.getLogger("usautobuild")
 
 WARNING_GIF = "https://tenor.com/view/14422456"
 
 
+# modules are imported by the modes using them, actions depend on slow to import libraries and every mode only needs
+# a few of the rest
+
+
 def main() -> None:
+    args = parse_args()
+    # exported config writes its values to os.environ, the rest are resolved from environment as it was given
+    environ = dict(os.environ)
+
+    artifact = None
+    if args["worker"]:
+        from usautobuild.distributed import artifact_output
+
+        # artifact goes to stdout of worker, it has to be taken over before anything is logged there
+        artifact = artifact_output()
+
     with Logger(args["log_level"]) as logger:
-        config = Config(args)
+        if artifact is not None:
+            _run_worker(logger, args, artifact, environ)
+            return
+
+        if _is_build(args):
+            _build(logger, args, environ)
+            return
+
+        if args["get_license"] or args["stable"]:
+            _run_tool(logger, args)
+            return
+
+        config = Config.resolve(args, environ)
+
+        if args["submit"]:
+            _submit_job(args, config)
+            return
+
+        if args["plan"]:
+            _plan(args, config)
+            return
+
+        # only daemon and watch modes are left
         logger.configure(config)
+        _run_daemon(logger, args, config, environ)
+
 
-        _real_main(config)
+def _is_build(args: dict[str, Any]) -> bool:
+    """Whether arguments ask for a build on this host rather than one of the other modes"""
 
+    return not any(args[mode] for mode in ("worker", "submit", "plan", "daemon", "watch", "get_license", "stable"))
+
+
+def _run_tool(logger: Logger, args: dict[str, Any]) -> None:
+    config = Config(args)
+    logger.configure(config)
 
-def _real_main(config: Config) -> None:
     if args["get_license"]:
+        from usautobuild.actions import Licenser
+
         Licenser(config)
-        return
+    else:
+        from usautobuild.actions import tag_as_stable
 
-    if args["stable"]:
         tag_as_stable()
-        return
+
+
+def _build(logger: Logger, args: dict[str, Any], environ: dict[str, str]) -> None:
+    from usautobuild.cdn import FTPSessionManager
+
+    # build number of resumed run has to be known before it is exported and anything is logged under it
+    preview = Config.resolve(args, environ)
+    logger.configure(preview)
+
+    run_state = _load_run_state(args, preview)
+    config = Config({**args, "build_number": run_state.build_number})
+    logger.start_run(config)
 
     log.info("Launched Build Bot version %s", git_version())
 
+    with FTPSessionManager.from_config(config) as sessions:
+        _run(config, run_state, sessions)
+
+
+def _run_worker(logger: Logger, args: dict[str, Any], artifact: IO[bytes], environ: dict[str, str]) -> None:
+    """Build single target of coordinator's run"""
+
+    from usautobuild.actions import Builder, Gitter
+    from usautobuild.distributed import TargetJob, pack_artifact
+    from usautobuild.events import stage
+
+    job = TargetJob.from_json(sys.stdin.read())
+    config = Config.resolve(
+        args,
+        environ,
+        overrides={
+            "branch": job.branch,
+            "pr": job.pr,
+            "build_number": job.build_number,
+            # repo is reset to coordinator's commit regardless
+            "allow_no_changes": True,
+            "build_workers": [],
+        },
+    )
+    logger.start_run(config)
+
+    log.info("Launched Build Bot worker version %s, building %s at %s", git_version(), job.target, job.commit)
+
+    gitter = Gitter(config)
+    with stage("gitting"):
+        gitter.start_gitting()
+        gitter.checkout(job.commit)
+
+    builder = Builder(config)
+    builder.check_license()
+    builder.clean_builds_folder([job.target])
+    builder.create_builds_folders()
+    builder.prepare_project()
+
+    with stage("build", target=job.target):
+        builder.build(job.target)
+
+    metrics = builder.log_metrics.get(job.target)
+    with artifact:
+        pack_artifact(
+            artifact, job.target, config.output_dir, Path.cwd() / "logs", {} if metrics is None else metrics.as_dict()
+        )
+
+
+def _submit_job(args: dict[str, Any], config: Config) -> None:
+    from usautobuild.daemon import BuildJob, Spool
+
+    job = BuildJob(
+        # explicit branch so that job coalesces with ones of watcher
+        branch=None if args["pr"] else config.git_branch,
+        pr=args["pr"],
+        release=config.release,
+        dry_run=config.dry_run,
+        priority=args["priority"],
+    )
+    path = Spool(config.spool_dir).submit(job)
+
+    log.info("Submitted job %s as %s", job, path)
+
+
+def _plan(args: dict[str, Any], config: Config) -> None:
+    """Log what build of config would run and how long it would take, nothing is executed"""
+
+    from usautobuild.planner import CACHES, History, build_plan, default_limits, format_plan
+
+    history = History.load(config.events_dir, config.plan_history)
+
+    cache_hits = {cache: rate for cache in CACHES if (rate := history.hit_rate(cache)) is not None}
+    cache_hits.update(args["plan_cache_hit"])
+    limits = {**default_limits(config), **dict(args["plan_limit"])}
+
+    stages = build_plan(config, history, cache_hits)
+    log.info("Plan of build %s:\n%s", config.build_number, format_plan(stages, history, cache_hits, limits))
+
+
+def _run_daemon(logger: Logger, args: dict[str, Any], config: Config, environ: dict[str, str]) -> None:
+    from usautobuild.cdn import FTPSessionManager
+    from usautobuild.checkpoint import RunState
+    from usautobuild.daemon import Daemon, Spool
+    from usautobuild.resources import recorder
+    from usautobuild.tracing import tracer
+    from usautobuild.watcher import RefWatcher
+
+    log.info("Launched Build Bot daemon version %s", git_version())
+
+    last_build_number = 0
+
+    def run_job(job: BuildJob) -> None:
+        nonlocal last_build_number
+
+        # several builds an hour are common in daemon mode, numbers still have to be unique
+        last_build_number = max(current_build_number(), last_build_number + 1)
+
+        # job configs leave os.environ alone, values that would be exported go to environment of their commands
+        job_config = Config.resolve(args, environ, overrides={**job.as_args(), "build_number": last_build_number})
+
+        tracer.reset()
+        recorder.clear()
+        logger.start_run(job_config)
+        sessions.new_run()
+
+        _run(job_config, RunState(job_config.state_file, job_config.build_number), sessions)
+
+    watcher = None
+    if args["watch"]:
+        watcher = RefWatcher(
+            config.git_url,
+            config.git_branch,
+            include_prs=config.watch_prs,
+            interval=config.watch_interval,
+            debounce=config.watch_debounce,
+            release=config.release,
+            dry_run=config.dry_run,
+        )
+
+    # jobs only override what and how to build, CDN settings are the same for all of them
+    with FTPSessionManager.from_config(config) as sessions:
+        Daemon(Spool(config.spool_dir), run_job, config.daemon_poll_interval, watcher).run()
+
+
+def _load_run_state(args: dict[str, Any], config: Config) -> RunState:
+    """Previous run state if resuming, fresh state otherwise. Resumed run keeps its build number unless one is given"""
+
+    from usautobuild.checkpoint import RunState
+
+    if config.resume:
+        if (run_state := RunState.load(config.state_file)) is not None:
+            if args["build_number"] is not None:
+                run_state.build_number = config.build_number
+
+            completed = ", ".join(run_state.completed) or "nothing"
+            log.info("Resuming build %s, completed: %s", run_state.build_number, completed)
+
+            return run_state
+
+        log.warning("No state of previous run found at %s, starting from scratch", config.state_file)
+
+    return RunState(config.state_file, config.build_number)
+
+
+def _run(config: Config, run_state: RunState, sessions: FTPSessionManager) -> None:
+    from usautobuild.events import recorded_events, run_id, stage
+    from usautobuild.metrics import metrics_from_events, write_textfile
+    from usautobuild.resources import format_usage_table, recorder
+    from usautobuild.tracing import tracer
+
     if not config.release:
         log.warning("Running a debug build that will not be registered")
         log.warning("If this is a mistake make sure to ping whoever started it to add --release flag %s", WARNING_GIF)
 
+    try:
+        with stage("run", release=config.release, dry_run=config.dry_run):
+            _run_pipeline(config, run_state, sessions)
+    finally:
+        if usages := recorder.usages:
+            log.info("Resource usage of external commands:\n%s", format_usage_table(usages), extra={"discord": False})
+
+        trace_path = config.trace_dir / f"{run_id() or config.build_number}.json"
+        tracer.export_chrome_trace(trace_path)
+        log.debug("Trace saved to %s", trace_path)
+
+        if (metrics_file := config.metrics_file) is not None:
+            previous = metrics_file.read_text() if metrics_file.is_file() else ""
+            write_textfile(metrics_file, metrics_from_events(recorded_events(), previous))
+            log.debug("Metrics saved to %s", metrics_file)
+
+
+def _run_pipeline(config: Config, run_state: RunState, sessions: FTPSessionManager) -> None:
+    from usautobuild.actions import (
+        ApiCaller,
+        Builder,
+        DiscordChangelogPoster,
+        Dockerizer,
+        Gitter,
+        GoodFiles,
+        Uploader,
+        Verifier,
+    )
+    from usautobuild.events import emit, stage
+
     gitter = Gitter(config)
-    builder = Builder(config)
-    uploader = Uploader(config)
-    dockerizer = Dockerizer(config)
+    builder = Builder(config, run_state)
+    uploader = Uploader(config, run_state, sessions)
+    dockerizer = Dockerizer(config, run_state)
+    verifier = Verifier(config)
+
+    source = {"branch": config.git_branch, "pr": config.github_pr_number}
 
+    if not config.dry_run or config.do_good_files:
+        # bad credentials should fail in seconds, not after hours of building
+        with stage("cdn_login"):
+            sessions.login()
+        sessions.start_keepalive()
 
+    with stage("gitting"):
+        # fetching would move resumed run to a different commit
+        gitter.start_gitting(update=not run_state.is_complete("gitting", run_state.fingerprint(**source)))
 
-    gitter.start_gitting()
+        if run_state.commit not in (None, gitter.head_commit):
+            log.warning(
+                "Repository moved from %s to %s since last run, redoing everything",
+                run_state.commit,
+                gitter.head_commit,
+            )
+
+        run_state.commit = gitter.head_commit
+        run_state.complete("gitting", run_state.fingerprint(**source))
 
     do_good_files = GoodFiles(config)
 
-    builder.start_building()
+    with stage("building"):
+        builder.start_building()
+
+    with stage("verifying"):
+        verifier.start_verifying(target for target in config.target_platforms if target not in builder.failed_targets)
 
-    if (config.do_good_files):
+    if config.do_good_files:
         tag = gitter.get_Good_file_tag().replace("good-file-", "")
-        if not uploader.check_good_file_version_folder_exists(tag):
-            do_good_files.make_good_files_build()
-            uploader.Zip_And_Upload_Good_files(tag)
-    
-    uploader.start_upload()
-    dockerizer.start_dockering()
+        good_files_exist = uploader.check_good_file_version_folder_exists(tag)
+        emit("cache", cache="good_files", hits=int(good_files_exist), lookups=1)
 
+        if not good_files_exist:
+            with stage("good_files", tag=tag):
+                do_good_files.make_good_files_build()
+                uploader.Zip_And_Upload_Good_files(tag)
+
+    with stage("uploading"):
+        uploader.start_upload(broken={*builder.failed_targets, *verifier.failed_targets})
+
+    with stage("dockering"):
+        dockerizer.start_dockering()
 
     if config.release:
-        api_caller = ApiCaller(config)
-        api_caller.post_new_version()
-        changelog_poster = DiscordChangelogPoster(config)
-        changelog_poster.start_posting()
+        if run_state.is_complete("changelog", run_state.fingerprint()):
+            log.info("Changelog was already posted")
+            return
+
+        with stage("changelog"):
+            api_caller = ApiCaller(config)
+            api_caller.post_new_version()
+            changelog_poster = DiscordChangelogPoster(config)
+            changelog_poster.start_posting()
+
+        run_state.complete("changelog", run_state.fingerprint())
 
 
 if __name__ == "__main__":
@@ -24,3 +24,18 @@ from usautobuild.config import Config
 )
 def config() -> Config:
     return Config({"config_file": Path()})
+
+
+class FakeClock:
+    """Monotonic clock replacement only moving when test sets now"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
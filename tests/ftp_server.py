@@ -0,0 +1,388 @@
+"""
+Minimal in-process FTP server for benchmarks and tests.
+
+Implements commands ftplib client and Uploader use, passive mode only. Files live under root directory, or are only
+counted when discard is set so that disk speed does not get in the way of measuring transfer. Latency is added before
+every reply to imitate round trips to remote CDN.
+"""
+
+import contextlib
+import posixpath
+import socket
+import socketserver
+import threading
+import time
+
+from collections import Counter
+from collections.abc import Callable
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, Optional
+
+__all__ = (
+    "FTPServer",
+    "FTPStats",
+)
+
+_BUFFER = 256 * 1024
+_FEATURES = ("EPSV", "MDTM", "MLST type*;size*;modify*;", "PASV", "REST STREAM", "SIZE")
+
+
+class FTPStats:
+    """Counters of everything server has seen, shared by all connections"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.commands: Counter[str] = Counter()
+        self.connections = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        # every reply is delayed by latency
+        self.replies = 0
+
+    def add(self, **values: int) -> None:
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def command(self, name: str) -> None:
+        with self._lock:
+            self.commands[name] += 1
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "_TCPServer"
+
+    def setup(self) -> None:
+        super().setup()
+        self.cwd = "/"
+        self.passive: Optional[socket.socket] = None
+        self.rename_from: Optional[Path] = None
+        self.offset = 0
+
+    def reply(self, line: str) -> None:
+        self.server.ftp.stats.add(replies=1)
+        if latency := self.server.ftp.latency:
+            time.sleep(latency)
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        self.server.ftp.stats.add(connections=1)
+        self.reply("220 usautobuild benchmark FTP")
+
+        while raw := self.rfile.readline():
+            command, _, argument = raw.decode(errors="replace").rstrip("\r\n").partition(" ")
+            command = command.upper()
+            self.server.ftp.stats.command(command)
+
+            if (method := getattr(self, f"ftp_{command}", None)) is None:
+                self.reply(f"502 {command} not implemented")
+                continue
+
+            try:
+                if method(argument) is False:
+                    break
+            except OSError as e:
+                self.reply(f"550 {e.strerror or e}")
+
+        if self.passive is not None:
+            self.passive.close()
+
+    def local(self, path: str) -> Path:
+        """Local path of client path, clients can not escape root"""
+
+        parts = [part for part in self.virtual(path).split("/") if part]
+
+        return self.server.ftp.root.joinpath(*parts)
+
+    def virtual(self, path: str) -> str:
+        return posixpath.normpath(posixpath.join(self.cwd, path))
+
+    @contextlib.contextmanager
+    def data_connection(self) -> Any:
+        if self.passive is None:
+            self.reply("425 Use PASV or EPSV first")
+            yield None
+            return
+
+        self.reply("150 Opening data connection")
+        try:
+            conn, _ = self.passive.accept()
+        finally:
+            self.passive.close()
+            self.passive = None
+
+        with conn:
+            yield conn
+
+        self.reply("226 Transfer complete")
+
+    def open_passive(self) -> int:
+        if self.passive is not None:
+            self.passive.close()
+
+        self.passive = socket.create_server((self.server.ftp.host, 0))
+        self.passive.settimeout(30)
+
+        return int(self.passive.getsockname()[1])
+
+    def ftp_USER(self, _: str) -> None:  # noqa: N802
+        self.reply("331 Password required")
+
+    def ftp_PASS(self, password: str) -> None:  # noqa: N802
+        if self.server.ftp.password not in (None, password):
+            self.reply("530 Login incorrect")
+            return
+
+        self.reply("230 Logged in")
+
+    def ftp_SYST(self, _: str) -> None:  # noqa: N802
+        self.reply("215 UNIX Type: L8")
+
+    def ftp_FEAT(self, _: str) -> None:  # noqa: N802
+        self.reply("211-Features:\r\n" + "".join(f" {feature}\r\n" for feature in _FEATURES) + "211 End")
+
+    def ftp_OPTS(self, _: str) -> None:  # noqa: N802
+        self.reply("200 OK")
+
+    def ftp_TYPE(self, _: str) -> None:  # noqa: N802
+        self.reply("200 Type set")
+
+    def ftp_NOOP(self, _: str) -> None:  # noqa: N802
+        self.reply("200 NOOP ok")
+
+    def ftp_QUIT(self, _: str) -> bool:  # noqa: N802
+        self.reply("221 Bye")
+        return False
+
+    def ftp_PWD(self, _: str) -> None:  # noqa: N802
+        self.reply(f'257 "{self.cwd}" is current directory')
+
+    def ftp_CWD(self, path: str) -> None:  # noqa: N802
+        if not self.local(path).is_dir():
+            self.reply(f"550 {path}: No such directory")
+            return
+
+        self.cwd = self.virtual(path)
+        self.reply("250 Directory changed")
+
+    def ftp_CDUP(self, _: str) -> None:  # noqa: N802
+        self.ftp_CWD("..")
+
+    def ftp_MKD(self, path: str) -> None:  # noqa: N802
+        local = self.local(path)
+        if local.exists():
+            self.reply(f"550 {path}: File exists")
+            return
+
+        local.mkdir(parents=True)
+        self.reply(f'257 "{self.virtual(path)}" created')
+
+    def ftp_RMD(self, path: str) -> None:  # noqa: N802
+        self.local(path).rmdir()
+        self.reply("250 Directory removed")
+
+    def ftp_DELE(self, path: str) -> None:  # noqa: N802
+        self.local(path).unlink()
+        self.reply("250 File removed")
+
+    def ftp_RNFR(self, path: str) -> None:  # noqa: N802
+        if not (local := self.local(path)).exists():
+            self.reply(f"550 {path}: No such file")
+            return
+
+        self.rename_from = local
+        self.reply("350 Ready for RNTO")
+
+    def ftp_RNTO(self, path: str) -> None:  # noqa: N802
+        if self.rename_from is None:
+            self.reply("503 RNFR required first")
+            return
+
+        self.rename_from.replace(self.local(path))
+        self.rename_from = None
+        self.reply("250 Renamed")
+
+    def ftp_SIZE(self, path: str) -> None:  # noqa: N802
+        if (size := self.server.ftp.size(self.local(path))) is None:
+            self.reply(f"550 {path}: No such file")
+            return
+
+        self.reply(f"213 {size}")
+
+    def ftp_MDTM(self, path: str) -> None:  # noqa: N802
+        if not (local := self.local(path)).is_file():
+            self.reply(f"550 {path}: No such file")
+            return
+
+        modified = datetime.fromtimestamp(local.stat().st_mtime, tz=UTC)
+        self.reply(f"213 {modified:%Y%m%d%H%M%S}")
+
+    def ftp_REST(self, offset: str) -> None:  # noqa: N802
+        self.offset = int(offset)
+        self.reply(f"350 Restarting at {self.offset}")
+
+    def ftp_PASV(self, _: str) -> None:  # noqa: N802
+        port = self.open_passive()
+        host = self.server.ftp.host.replace(".", ",")
+        self.reply(f"227 Entering Passive Mode ({host},{port >> 8},{port & 0xFF})")
+
+    def ftp_EPSV(self, _: str) -> None:  # noqa: N802
+        self.reply(f"229 Entering Extended Passive Mode (|||{self.open_passive()}|)")
+
+    def ftp_STOR(self, path: str, append: bool = False) -> None:  # noqa: N802
+        local = self.local(path)
+        if not local.parent.is_dir():
+            self.reply(f"553 {path}: No such directory")
+            return
+
+        offset, self.offset = self.offset, 0
+        with self.data_connection() as conn:
+            if conn is None:
+                return
+
+            received = self.server.ftp.store(conn, local, offset, append)
+            self.server.ftp.stats.add(bytes_received=received)
+
+    def ftp_APPE(self, path: str) -> None:  # noqa: N802
+        self.ftp_STOR(path, append=True)
+
+    def ftp_RETR(self, path: str) -> None:  # noqa: N802
+        if not (local := self.local(path)).is_file():
+            self.reply(f"550 {path}: No such file")
+            return
+
+        offset, self.offset = self.offset, 0
+        with self.data_connection() as conn, local.open("rb") as f:
+            if conn is None:
+                return
+
+            f.seek(offset)
+            while data := f.read(_BUFFER):
+                conn.sendall(data)
+                self.server.ftp.stats.add(bytes_sent=len(data))
+
+    def listing(self, path: str, line: Callable[[Path], str]) -> None:
+        if not (local := self.local(path)).exists():
+            self.reply(f"550 {path}: No such file or directory")
+            return
+
+        entries = sorted(local.iterdir()) if local.is_dir() else [local]
+        with self.data_connection() as conn:
+            if conn is None:
+                return
+
+            data = "".join(f"{line(entry)}\r\n" for entry in entries).encode()
+            conn.sendall(data)
+            self.server.ftp.stats.add(bytes_sent=len(data))
+
+    def ftp_NLST(self, path: str) -> None:  # noqa: N802
+        self.listing(path, lambda entry: entry.name)
+
+    def ftp_LIST(self, path: str) -> None:  # noqa: N802
+        def line(entry: Path) -> str:
+            stat = entry.stat()
+            kind = "d" if entry.is_dir() else "-"
+            modified = datetime.fromtimestamp(stat.st_mtime, tz=UTC)
+
+            return f"{kind}rw-r--r-- 1 ftp ftp {stat.st_size:>12} {modified:%b %d %H:%M} {entry.name}"
+
+        self.listing(path if not path.startswith("-") else "", line)
+
+    def ftp_MLSD(self, path: str) -> None:  # noqa: N802
+        def line(entry: Path) -> str:
+            stat = entry.stat()
+            kind = "dir" if entry.is_dir() else "file"
+            modified = datetime.fromtimestamp(stat.st_mtime, tz=UTC)
+
+            return f"type={kind};size={stat.st_size};modify={modified:%Y%m%d%H%M%S}; {entry.name}"
+
+        self.listing(path, line)
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, ftp: "FTPServer") -> None:
+        self.ftp = ftp
+        super().__init__((ftp.host, 0), _Handler)
+
+
+class FTPServer:
+    """
+    Serves root directory on localhost from background threads, use as context manager.
+
+    With discard uploads are read and counted but not written, SIZE then reports size of the last upload. Any
+    user and password are accepted unless password is given.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        latency: float = 0.0,
+        discard: bool = False,
+        host: str = "127.0.0.1",
+        password: Optional[str] = None,
+    ) -> None:
+        self.root = root
+        self.latency = latency
+        self.discard = discard
+        self.host = host
+        self.password = password
+        self.stats = FTPStats()
+        # sizes of discarded uploads
+        self._sizes: dict[Path, int] = {}
+        self._server: Optional[_TCPServer] = None
+
+    @property
+    def port(self) -> int:
+        assert self._server is not None, "server is not running"
+
+        return int(self._server.server_address[1])
+
+    def store(self, conn: socket.socket, path: Path, offset: int, append: bool) -> int:
+        if self.discard:
+            received = 0
+            while data := conn.recv(_BUFFER):
+                received += len(data)
+            self._sizes[path] = received + (self._sizes.get(path, 0) if append else offset)
+
+            return received
+
+        received = 0
+        with path.open("ab" if append else "r+b" if offset else "wb") as f:
+            if offset and not append:
+                f.seek(offset)
+                f.truncate()
+
+            while data := conn.recv(_BUFFER):
+                f.write(data)
+                received += len(data)
+
+        return received
+
+    def size(self, path: Path) -> Optional[int]:
+        if path in self._sizes:
+            return self._sizes[path]
+
+        return path.stat().st_size if path.is_file() else None
+
+    def start(self) -> "FTPServer":
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._server = _TCPServer(self)
+        threading.Thread(target=self._server.serve_forever, name="ftp server", daemon=True).start()
+
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FTPServer":
+        return self.start()
+
+    def __exit__(self, *_: object) -> None:
+        self.stop()
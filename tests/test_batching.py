@@ -0,0 +1,77 @@
+from usautobuild.batching import MessageBatcher
+
+
+def drain(batcher: MessageBatcher) -> list[tuple[str, bool]]:
+    batches = []
+    while (ready := batcher.pop_ready()) is not None:
+        batches.append(ready)
+
+    return batches
+
+
+def test_batcher_merges_same_kind():
+    batcher = MessageBatcher(limit=100, max_age=1)
+
+    batcher.add("a")
+    batcher.add("b")
+    batcher.seal()
+
+    assert drain(batcher) == [("a\nb", False)]
+    assert not batcher
+
+
+def test_batcher_splits_on_kind_change():
+    batcher = MessageBatcher(limit=100, max_age=1)
+
+    batcher.add("a")
+    batcher.add("b", True)
+    batcher.add("c", True)
+    batcher.add("d")
+    batcher.seal()
+
+    assert drain(batcher) == [("a", False), ("b\nc", True), ("d", False)]
+
+
+def test_batcher_respects_limit():
+    batcher = MessageBatcher(limit=5, max_age=1)
+
+    for message in ("aa", "bb", "cc", "dd"):
+        batcher.add(message)
+
+    # "aa\nbb" is exactly 5
+    assert drain(batcher) == [("aa\nbb", False)]
+
+    batcher.seal()
+
+    assert drain(batcher) == [("cc\ndd", False)]
+
+
+def test_batcher_cuts_long_messages_at_lines():
+    batcher = MessageBatcher(limit=5, max_age=1)
+
+    batcher.add("abc\ndefgh\nijklmnop")
+    batcher.seal()
+
+    batches = drain(batcher)
+
+    assert [message for message, _ in batches] == ["abc", "defgh", "ijklm", "nop"]
+    assert all(len(message) <= 5 for message, _ in batches)
+
+
+def test_batcher_age(clock):
+    batcher = MessageBatcher(limit=100, max_age=1, clock=clock)
+
+    assert batcher.time_until_due() is None
+
+    batcher.add("a")
+    clock.now = 0.5
+    batcher.add("b")
+    batcher.seal_due()
+
+    assert not batcher.has_ready
+    assert batcher.time_until_due() == 0.5
+
+    clock.now = 1
+    batcher.seal_due()
+
+    assert drain(batcher) == [("a\nb", False)]
@@ -0,0 +1,236 @@
+import logging
+import os
+import socket
+import threading
+import time
+
+from ftplib import FTP, error_perm
+
+import pytest
+
+from tests.ftp_server import FTPServer, _Handler
+from usautobuild.cdn import FTPSessionManager, RemoteIndex, TransferProgress, store_file
+
+PASSWORD = "secret"
+
+
+@pytest.fixture
+def server(tmp_path):
+    with FTPServer(tmp_path / "cdn", password=PASSWORD) as server:
+        yield server
+
+
+def make_manager(server: FTPServer, password: str = PASSWORD, **kwargs) -> FTPSessionManager:
+    return FTPSessionManager(server.host, server.port, "user", password, **kwargs)
+
+
+def test_login_fails_early_on_bad_credentials(server):
+    with make_manager(server, password=PASSWORD[::-1]) as manager, pytest.raises(error_perm, match="530"):
+        manager.login()
+
+
+def test_connections_are_reused(server):
+    with make_manager(server, size=2) as manager:
+        manager.login()
+        assert server.stats.connections == 2
+
+        with manager.connection() as first:
+            first.pwd()
+        with manager.connection() as second:
+            second.pwd()
+
+        assert first is second
+        assert server.stats.commands["PASS"] == 2
+
+
+def test_concurrent_holders_get_own_connections(server):
+    with make_manager(server, size=2) as manager:
+        barrier = threading.Barrier(2, timeout=5)
+        used = []
+
+        def hold() -> None:
+            with manager.connection() as ftp:
+                used.append(ftp)
+                barrier.wait()
+
+        threads = [threading.Thread(target=hold) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert used[0] is not used[1]
+
+
+def drop(ftp: FTP) -> None:
+    """Break connection the way server closing it would"""
+
+    assert ftp.sock is not None
+    ftp.sock.shutdown(socket.SHUT_RDWR)
+
+
+def test_dropped_connection_is_replaced(server):
+    with make_manager(server, keepalive_interval=0.0) as manager:
+        with manager.connection() as ftp:
+            drop(ftp)
+
+        # idle connection is probed before use and reopened
+        with manager.connection() as replacement:
+            assert replacement.pwd() == "/"
+
+        assert replacement is not ftp
+        assert server.stats.connections == 2
+
+        with pytest.raises(OSError), manager.connection() as broken:
+            drop(broken)
+            broken.pwd()
+
+        with manager.connection() as reopened:
+            assert reopened is not broken
+
+
+def test_keepalive_sends_noop_over_idle_connections(server):
+    with make_manager(server, keepalive_interval=0.05) as manager:
+        manager.login()
+        manager.start_keepalive()
+
+        deadline = time.monotonic() + 5
+        while server.stats.commands["NOOP"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert server.stats.commands["NOOP"] >= 2
+        assert server.stats.connections == 1
+
+
+@pytest.fixture
+def tree(server):
+    builds = server.root / "unitystation" / "fork" / "linuxserver"
+    builds.mkdir(parents=True)
+    (builds / "41.zip").write_bytes(b"x" * 100)
+
+    return server.root
+
+
+def test_index_lists_directory_once(server, tree):
+    with make_manager(server) as manager, manager.connection() as ftp:
+        index = manager.index
+
+        assert index.is_dir(ftp, "/unitystation/fork/linuxserver/")
+        assert not index.is_dir(ftp, "/unitystation/fork/StandaloneOSX")
+        assert index.file_size(ftp, "/unitystation/fork/linuxserver/41.zip") == 100
+        assert not index.exists(ftp, "/unitystation/fork/linuxserver/42.zip")
+        assert not index.exists(ftp, "/unitystation/missing/42.zip")
+
+    assert server.stats.commands["MLSD"] == 3
+
+
+def test_index_falls_back_to_list(server, tree, monkeypatch):
+    monkeypatch.delattr(_Handler, "ftp_MLSD")
+
+    with make_manager(server) as manager, manager.connection() as ftp:
+        assert manager.index.is_dir(ftp, "/unitystation/fork/linuxserver")
+        assert manager.index.file_size(ftp, "/unitystation/fork/linuxserver/41.zip") == 100
+
+    assert server.stats.commands["LIST"] == 2
+
+
+def test_index_falls_back_to_list_on_rejected_facts(server, tree, monkeypatch):
+    monkeypatch.setattr(_Handler, "ftp_OPTS", lambda handler, _: handler.reply("501 Unknown option"))
+
+    with make_manager(server) as manager, manager.connection() as ftp:
+        assert manager.index.file_size(ftp, "/unitystation/fork/linuxserver/41.zip") == 100
+
+    assert server.stats.commands["MLSD"] == 0
+    assert server.stats.commands["LIST"] == 1
+
+
+def test_index_tracks_created_entries(server, tree):
+    with make_manager(server) as manager, manager.connection() as ftp:
+        index = manager.index
+
+        index.make_dir(ftp, "/unitystation/fork/StandaloneOSX")
+        index.make_dir(ftp, "/unitystation/fork/StandaloneOSX")
+        index.add_file("/unitystation/fork/StandaloneOSX/42.zip", 10)
+
+        assert index.file_size(ftp, "/unitystation/fork/StandaloneOSX/42.zip") == 10
+
+    assert server.stats.commands["MKD"] == 1
+    # new directory is known to be empty without listing it
+    assert server.stats.commands["MLSD"] == 1
+
+
+def test_new_run_relists_over_same_connection(server, tree):
+    with make_manager(server) as manager:
+        with manager.connection() as ftp:
+            assert not manager.index.exists(ftp, "/unitystation/fork/linuxserver/42.zip")
+
+        (tree / "unitystation" / "fork" / "linuxserver" / "42.zip").write_bytes(b"x")
+        manager.new_run()
+
+        with manager.connection() as ftp:
+            assert manager.index.exists(ftp, "/unitystation/fork/linuxserver/42.zip")
+
+    assert server.stats.commands["MLSD"] == 2
+    assert server.stats.connections == 1
+
+
+@pytest.mark.parametrize("size", [0, 10, 3 * 1024 + 1])
+def test_store_file_sends_blocks(server, tmp_path, size):
+    local = tmp_path / "archive.zip"
+    local.write_bytes(os.urandom(size))
+    blocks = []
+
+    with make_manager(server) as manager, manager.connection() as ftp:
+        reply = store_file(ftp, "/archive.zip", local, lambda block: blocks.append(bytes(block)), 1024)
+
+    assert reply.startswith("226")
+    assert (server.root / "archive.zip").read_bytes() == local.read_bytes()
+    assert b"".join(blocks) == local.read_bytes()
+    assert all(len(block) == 1024 for block in blocks[:-1])
+
+
+def test_transfer_progress_reports_throttled(caplog):
+    now = 0.0
+    progress = TransferProgress("/archive.zip", 1000, connection=1, report_interval=10.0, clock=lambda: now)
+
+    with caplog.at_level(logging.INFO, logger="usautobuild"):
+        for _ in range(4):
+            now += 4
+            progress.update(100)
+
+    # reported once at 12s, rate over the 12s since start
+    assert len(caplog.records) == 1
+    assert "over connection 1" in caplog.records[0].getMessage()
+    assert progress.current_rate == pytest.approx(300 / 12)
+    assert progress.average_rate == pytest.approx(400 / 16)
+    assert progress.eta == pytest.approx(600 / (300 / 12))
+
+
+def test_index_lists_directories_concurrently(monkeypatch):
+    barrier = threading.Barrier(2, timeout=5)
+    fetched = []
+
+    def fetch(_ftp, directory):
+        fetched.append(directory)
+        if directory != "/same":
+            # both threads have to be fetching at once to get past
+            barrier.wait()
+        else:
+            time.sleep(0.05)
+
+        return {}
+
+    monkeypatch.setattr(RemoteIndex, "_fetch", staticmethod(fetch))
+    index = RemoteIndex()
+
+    def ask(*paths: str) -> None:
+        for path in paths:
+            index.exists(None, path)  # type: ignore[arg-type]
+
+    threads = [threading.Thread(target=ask, args=(f"/dir{i}/file", "/same/file")) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(fetched) == ["/dir0", "/dir1", "/same"]
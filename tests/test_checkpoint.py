@@ -0,0 +1,51 @@
+import json
+
+from usautobuild.checkpoint import RunState, output_digest
+
+
+def test_output_digest_tracks_tree_changes(tmp_path):
+    build = tmp_path / "build"
+    (build / "Data").mkdir(parents=True)
+    (build / "Data" / "file").write_text("a")
+
+    digest = output_digest(build)
+    assert output_digest(build) == digest
+
+    (build / "extra").write_text("b")
+    assert output_digest(build) != digest
+
+    assert output_digest(tmp_path / "missing") is None
+
+
+def test_state_roundtrip_and_output_validation(tmp_path):
+    archive = tmp_path / "linuxserver.zip"
+    archive.write_bytes(b"zip")
+
+    state = RunState(tmp_path / "state.json", 42, "abc")
+    state.complete("upload/linuxserver", state.fingerprint(target="linuxserver"), [archive])
+
+    loaded = RunState.load(tmp_path / "state.json")
+    assert loaded is not None
+    assert loaded.build_number == 42
+    assert loaded.commit == "abc"
+    assert loaded.completed == ["upload/linuxserver"]
+    assert loaded.is_complete("upload/linuxserver", loaded.fingerprint(target="linuxserver"))
+    assert not loaded.is_complete("upload/linuxserver", loaded.fingerprint(target="StandaloneOSX"))
+
+    loaded.commit = "def"
+    assert not loaded.is_complete("upload/linuxserver", loaded.fingerprint(target="linuxserver"))
+
+    loaded.commit = "abc"
+    archive.write_bytes(b"rezipped")
+    assert not loaded.is_complete("upload/linuxserver", loaded.fingerprint(target="linuxserver"))
+
+
+def test_load_ignores_bad_state(tmp_path):
+    path = tmp_path / "state.json"
+    assert RunState.load(path) is None
+
+    path.write_text("{broken")
+    assert RunState.load(path) is None
+
+    path.write_text(json.dumps({"version": 0}))
+    assert RunState.load(path) is None
@@ -0,0 +1,220 @@
+import functools
+import io
+import os
+import signal
+import subprocess
+import sys
+
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import pytest
+
+import main
+
+from usautobuild import watcher
+from usautobuild.cdn import FTPSessionManager
+from usautobuild.checkpoint import RunState
+from usautobuild.cli import parse_args
+from usautobuild.config import DEFAULT_BRANCH, Config
+from usautobuild.daemon import BuildJob, Spool
+from usautobuild.distributed import TargetJob
+from usautobuild.watcher import RefWatcher
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_parse_args_uses_given_argv():
+    args = parse_args(["--branch", "staging", "--dry-run"])
+
+    assert args["branch"] == "staging"
+    assert args["dry_run"]
+    assert not args["release"]
+
+
+def test_parse_args_conflicts():
+    with pytest.raises(Exception, match="--branch conflicts with --pr"):
+        parse_args(["--branch", "staging", "--pr", "1"])
+
+
+def test_importing_main_is_cheap():
+    code = "import sys, main; " "print(','.join(m for m in sys.argv[1:] if m in sys.modules))"
+    # only modes using them import the rest
+    modules = ["git", "requests", "humanize", "usautobuild.actions.builder", "usautobuild.cdn", "usautobuild.daemon"]
+    modules += ["usautobuild.distributed", "usautobuild.metrics", "usautobuild.watcher", "usautobuild.checkpoint"]
+    proc = subprocess.run(
+        [sys.executable, "-c", code, *modules],  # noqa: S603
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert proc.stdout.strip() == ""
+
+
+# required settings, as given to the process
+ENVIRON = {
+    "CDN_HOST": "host",
+    "CDN_USER": "user",
+    "CDN_PASSWORD": "password",
+    "DOCKER_PASSWORD": "password",
+    "DOCKER_USERNAME": "username",
+    "CHANGELOG_API_URL": "url",
+    "CHANGELOG_API_KEY": "key",
+    "CHANGELOG_WEBHOOK": "url",
+    "NEWEST_BUILD_API_URL": "url",
+    "DO_GOOD_FILES": "True",
+}
+
+# what exporting config of the same process leaves behind in os.environ
+EXPORTED = {"DISCORD_WEBHOOK": "None", "GITHUB_PR_NUMBER": "None", "RELEASE": "True", "GIT_BRANCH": "staging"}
+
+
+class FakeLogger:
+    def __init__(self) -> None:
+        self.runs: list[int] = []
+
+    def configure(self, config: Config) -> None: ...
+
+    def start_run(self, config: Config) -> None:
+        self.runs.append(config.build_number)
+
+
+@pytest.fixture
+def logger(monkeypatch) -> Any:
+    monkeypatch.setattr(main, "git_version", lambda: "version")
+
+    return FakeLogger()
+
+
+@pytest.mark.parametrize(("argv", "build_number"), [([], 123), (["--build-number", "7"], 7)])
+def test_resumed_build_number_is_exported(tmp_path, monkeypatch, logger, argv, build_number):
+    state_file = tmp_path / "run-state.json"
+    RunState(state_file, 123).save()
+
+    runs = []
+
+    def run(config: Config, run_state: RunState, _sessions: FTPSessionManager) -> None:
+        runs.append((config.build_number, config.environ["BUILD_NUMBER"], os.environ["BUILD_NUMBER"], run_state))
+
+    monkeypatch.setattr(main, "_run", run)
+
+    environ = {**ENVIRON, "STATE_FILE": str(state_file)}
+    with mock.patch.dict(os.environ, environ, clear=True):
+        args = parse_args(["--resume", "--config-file", str(tmp_path / "none.json"), *argv])
+        main._build(logger, args, dict(os.environ))
+
+    ((number, exported, environ_number, run_state),) = runs
+    assert number == run_state.build_number == build_number
+    assert exported == environ_number == str(build_number)
+    assert logger.runs == [build_number]
+
+
+def test_daemon_job_config_ignores_exported_environment(tmp_path, monkeypatch, logger):
+    environ = {**ENVIRON, "SPOOL_DIR": str(tmp_path / "spool")}
+    args = parse_args(["--daemon", "--release", "--branch", "staging", "--config-file", str(tmp_path / "none.json")])
+    config = Config.resolve(args, environ)
+
+    Spool(config.spool_dir).submit(BuildJob(pr=5))
+    configs = []
+
+    def run(job_config: Config, _run_state: RunState, _sessions: FTPSessionManager) -> None:
+        configs.append(job_config)
+        # stops daemon the way service manager would
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    monkeypatch.setattr(main, "_run", run)
+
+    with mock.patch.dict(os.environ, {**environ, **EXPORTED}, clear=True):
+        main._run_daemon(logger, args, config, environ)
+
+    (job_config,) = configs
+    assert job_config.github_pr_number == 5
+    assert job_config.git_branch == DEFAULT_BRANCH
+    assert not job_config.release
+    assert job_config.discord_webhook is None
+    assert "DISCORD_WEBHOOK" not in job_config.environ
+    assert logger.runs == [job_config.build_number]
+
+
+def test_watched_pull_request_job_is_resolved(tmp_path, monkeypatch, logger):
+    environ = {**ENVIRON, "SPOOL_DIR": str(tmp_path / "spool"), "WATCH_INTERVAL": "0", "WATCH_DEBOUNCE": "0"}
+    argv = ["--watch", "--release", "--branch", "staging", "--config-file", str(tmp_path / "none.json")]
+    args = parse_args(argv)
+    config = Config.resolve({**args, "watch_prs": True, "daemon_poll_interval": 0}, environ)
+
+    heads = iter(["x", "y"])
+
+    def list_refs(_url: str, patterns: Sequence[str]) -> dict[str, str]:
+        assert patterns == ["refs/heads/staging", "refs/pull/*/head"]
+
+        return {"refs/heads/staging": "a", "refs/pull/7/head": next(heads, "y")}
+
+    monkeypatch.setattr(watcher, "RefWatcher", functools.partial(RefWatcher, list_refs=list_refs))
+    configs = []
+
+    def run(job_config: Config, _run_state: RunState, _sessions: FTPSessionManager) -> None:
+        configs.append(job_config)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    monkeypatch.setattr(main, "_run", run)
+
+    with mock.patch.dict(os.environ, {**environ, **EXPORTED}, clear=True):
+        main._run_daemon(logger, args, config, environ)
+
+    (job_config,) = configs
+    assert job_config.github_pr_number == 7
+    assert job_config.git_branch == DEFAULT_BRANCH
+    assert job_config.release
+    assert job_config.environ["GIT_BRANCH"] == DEFAULT_BRANCH
+
+
+def test_worker_config_ignores_exported_environment(tmp_path, monkeypatch, logger):
+    pytest.importorskip("git")
+    pytest.importorskip("humanize")
+
+    from usautobuild import actions
+
+    job = TargetJob("linuxserver", "abc", 42, "develop")
+    built = []
+
+    class FakeGitter:
+        def __init__(self, config: Config) -> None:
+            built.append(config)
+
+        def start_gitting(self) -> None: ...
+
+        def checkout(self, commit: str) -> None:
+            assert commit == job.commit
+
+    class FakeBuilder:
+        def __init__(self, config: Config) -> None:
+            self.config = config
+            self.log_metrics: dict[str, Any] = {}
+
+        def __getattr__(self, _name: str) -> Any:
+            return lambda *_: None
+
+        def build(self, target: str) -> None:
+            (self.config.output_dir / target).mkdir(parents=True)
+
+    monkeypatch.setattr(actions, "Gitter", FakeGitter)
+    monkeypatch.setattr(actions, "Builder", FakeBuilder)
+    monkeypatch.setattr(sys, "stdin", io.StringIO(job.to_json()))
+    monkeypatch.chdir(tmp_path)
+
+    environ = {**ENVIRON, "OUTPUT_DIR": str(tmp_path / "builds"), "BUILD_WORKERS": "ssh:other:/srv"}
+    artifact = io.BytesIO()
+
+    with mock.patch.dict(os.environ, {**environ, **EXPORTED}, clear=True):
+        main._run_worker(logger, parse_args(["--worker"]), artifact, environ)
+
+    (config,) = built
+    assert config.build_number == 42
+    assert config.build_workers == []
+    assert config.github_pr_number is None
+    assert config.discord_webhook is None
+    assert artifact.closed
@@ -1,4 +1,5 @@
 import os
+import typing
 
 from pathlib import Path
 from typing import Optional
@@ -135,3 +136,77 @@ def test_config_attributes_properly_skipped():
 
     assert cfg.foo == 1337
     assert cfg._private_var == "spam"
+
+
+def test_config_resolve_leaves_environ_alone():
+    class Config(ConfigBase):
+        foo: int
+        bar = Var("x", set_env=False)
+        baz = "default"
+
+    cfg = Config.resolve({"config_file": Path(), "foo": "3"}, environ={"BAZ": "from env"})
+
+    assert cfg.foo == 3
+    assert cfg.baz == "from env"
+    assert cfg.environ == {"FOO": "3"}
+    assert "FOO" not in os.environ
+
+
+def test_config_resolve_overrides():
+    class Config(ConfigBase):
+        flag = Var(False, arg="on")
+        items = Var(["x"])
+        number: Optional[int] = Var(None, arg="pr")
+        branch = Var("develop", arg="name")
+
+    environ = {"FLAG": "true", "ITEMS": "a,b", "NUMBER": "5", "BRANCH": "staging"}
+    args = {"config_file": Path(), "on": True, "items": ["c"], "pr": 7, "name": "feature"}
+
+    cfg = Config.resolve(args, environ, overrides={"on": False, "items": [], "pr": None, "name": None})
+
+    # falsy overrides win over args and env, None means default
+    assert cfg.flag is False
+    assert cfg.items == []
+    assert cfg.number is None
+    assert cfg.branch == "develop"
+    # unset optional value is not exported as "None"
+    assert "NUMBER" not in cfg.environ
+
+
+def test_config_resolve_ignores_process_environ():
+    class Config(ConfigBase):
+        foo = "default"
+
+    with mock.patch.dict(os.environ, {"FOO": "exported"}):
+        assert Config.resolve({"config_file": Path()}).foo == "default"
+
+
+def test_config_resolve_is_read_only():
+    class Config(ConfigBase):
+        foo = 1
+
+    cfg = Config.resolve({"config_file": Path()})
+
+    with pytest.raises(AttributeError, match="read only"):
+        cfg.foo = 2
+
+    # legacy instances stay writable and export to os.environ
+    with mock.patch.dict(os.environ):
+        legacy = Config({"config_file": Path()})
+        legacy.foo = 2
+
+        assert legacy.environ == {"FOO": "1"}
+        assert os.environ["FOO"] == "1"
+
+    assert "FOO" not in os.environ
+
+
+def test_config_schema_is_cached():
+    class Config(ConfigBase):
+        foo = 1
+
+    with mock.patch("typing.get_type_hints", wraps=typing.get_type_hints) as get_type_hints:
+        Config.resolve({"config_file": Path()})
+        Config.resolve({"config_file": Path(), "foo": 2})
+
+    assert get_type_hints.call_count == 1
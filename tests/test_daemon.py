@@ -0,0 +1,88 @@
+from usautobuild.daemon import BuildJob, Daemon, JobQueue, Spool
+
+
+def test_queue_coalesces_same_branch():
+    queue = JobQueue()
+    first = queue.push(BuildJob(branch="develop", submitted=1, dry_run=True))
+    merged = queue.push(BuildJob(branch="develop", submitted=2, release=True))
+
+    assert len(queue) == 1
+    assert merged.id == first.id
+    assert merged.submitted == 1
+    assert merged.release
+    assert not merged.dry_run
+
+
+def test_queue_order():
+    queue = JobQueue()
+    queue.push(BuildJob(branch="a", submitted=1))
+    queue.push(BuildJob(branch="b", submitted=2, release=True))
+    queue.push(BuildJob(pr=5, submitted=3, priority=1))
+    queue.push(BuildJob(branch="c", submitted=0))
+
+    popped = [queue.pop() for _ in range(5)]
+
+    assert [job.key for job in popped if job is not None] == [(None, 5), ("b", None), ("c", None), ("a", None)]
+    assert popped[-1] is None
+
+
+def test_spool_roundtrip(tmp_path):
+    spool = Spool(tmp_path)
+    job = BuildJob(branch="develop", priority=3)
+    spool.submit(job)
+    (spool.incoming / "bad.json").write_text("{")
+
+    (collected,) = spool.collect()
+    assert collected.id == job.id
+    assert collected.priority == 3
+    assert list(spool.incoming.iterdir()) == []
+
+    spool.recover()
+    (recovered,) = spool.collect()
+    assert recovered.id == job.id
+
+    spool.finish(recovered)
+    assert list(spool.queued.iterdir()) == []
+
+
+def test_daemon_runs_coalesced_jobs(tmp_path):
+    spool = Spool(tmp_path)
+    spool.submit(BuildJob(branch="develop", submitted=1))
+    spool.submit(BuildJob(branch="develop", submitted=2, release=True))
+    spool.submit(BuildJob(branch="staging", submitted=3))
+
+    ran = []
+
+    def run_job(job):
+        ran.append(job)
+        if len(ran) == 2:
+            daemon.stop()
+
+    daemon = Daemon(spool, run_job, poll_interval=0)
+    daemon.run()
+
+    assert [(job.branch, job.release) for job in ran] == [("develop", True), ("staging", False)]
+    assert list(spool.queued.iterdir()) == []
+
+
+def test_daemon_keeps_failed_jobs(tmp_path):
+    spool = Spool(tmp_path)
+    failing = BuildJob(branch="develop", submitted=1)
+    spool.submit(failing)
+    spool.submit(BuildJob(branch="staging", submitted=2))
+
+    ran = []
+
+    def run_job(job):
+        ran.append(job.branch)
+        if job.branch == "develop":
+            raise RuntimeError("broken")
+
+        daemon.stop()
+
+    daemon = Daemon(spool, run_job, poll_interval=0)
+    daemon.run()
+
+    assert ran == ["develop", "staging"]
+    assert list(spool.queued.iterdir()) == []
+    assert [path.name for path in spool.failed.iterdir()] == [f"{failing.submitted:.6f}-{failing.id}.json"]
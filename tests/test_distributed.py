@@ -0,0 +1,154 @@
+import io
+import sys
+import tarfile
+import textwrap
+
+from pathlib import Path
+
+import pytest
+
+from usautobuild.distributed import (
+    CommandTransport,
+    Coordinator,
+    TargetJob,
+    make_transport,
+    pack_artifact,
+    unpack_artifact,
+)
+from usautobuild.exceptions import WorkerFailedError
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+JOB = TargetJob("StandaloneLinux64", "abc", 42, "develop")
+
+
+def make_build(root: Path, target: str = "StandaloneLinux64") -> None:
+    (root / "builds" / target / "Data").mkdir(parents=True)
+    (root / "builds" / target / "Data" / "file").write_text("data")
+    (root / "logs").mkdir()
+    (root / "logs" / f"{target}.txt").write_text("editor log")
+
+
+def fake_worker(tmp_path: Path, fail: bool = False) -> CommandTransport:
+    """Worker command packing prepared build of whatever target it receives"""
+
+    make_build(tmp_path / "worker")
+
+    script = tmp_path / "worker.py"
+    script.write_text(
+        textwrap.dedent(
+            f"""
+            import sys
+            from pathlib import Path
+
+            sys.path.insert(0, {str(REPO_ROOT)!r})
+            from usautobuild.distributed import TargetJob, pack_artifact
+
+            job = TargetJob.from_json(sys.stdin.read())
+            print("building", job.target, file=sys.stderr)
+            if {fail!r}:
+                sys.exit(3)
+
+            root = Path({str(tmp_path / "worker")!r})
+            pack_artifact(sys.stdout.buffer, job.target, root / "builds", root / "logs", {{"build_size": 1}})
+            """
+        )
+    )
+
+    return CommandTransport("fake", [sys.executable, str(script)])
+
+
+def test_artifact_roundtrip(tmp_path):
+    make_build(tmp_path / "worker")
+    (tmp_path / "builds" / "StandaloneLinux64").mkdir(parents=True)
+    (tmp_path / "builds" / "StandaloneLinux64" / "stale").write_text("old")
+
+    stream = io.BytesIO()
+    worker = tmp_path / "worker"
+    pack_artifact(stream, "StandaloneLinux64", worker / "builds", worker / "logs", {"build_size": 1})
+    stream.seek(0)
+
+    metadata = unpack_artifact(stream, "StandaloneLinux64", tmp_path / "builds", tmp_path / "logs")
+
+    assert metadata == {"build_size": 1}
+    assert (tmp_path / "builds" / "StandaloneLinux64" / "Data" / "file").read_text() == "data"
+    assert not (tmp_path / "builds" / "StandaloneLinux64" / "stale").exists()
+    assert (tmp_path / "logs" / "StandaloneLinux64.txt").read_text() == "editor log"
+    assert sorted(p.name for p in (tmp_path / "builds").iterdir()) == ["StandaloneLinux64"]
+
+
+def test_artifact_without_extraction_filters(tmp_path, monkeypatch):
+    # python before 3.11.4
+    monkeypatch.delattr(tarfile, "data_filter")
+    make_build(tmp_path / "worker")
+
+    stream = io.BytesIO()
+    worker = tmp_path / "worker"
+    pack_artifact(stream, "StandaloneLinux64", worker / "builds", worker / "logs", {"build_size": 1})
+    stream.seek(0)
+
+    assert unpack_artifact(stream, "StandaloneLinux64", tmp_path / "builds", tmp_path / "logs") == {"build_size": 1}
+    assert (tmp_path / "builds" / "StandaloneLinux64" / "Data" / "file").read_text() == "data"
+
+
+@pytest.mark.parametrize("filters", [True, False])
+def test_artifact_escaping_destination_is_refused(tmp_path, monkeypatch, filters):
+    if not filters:
+        monkeypatch.delattr(tarfile, "data_filter")
+
+    stream = io.BytesIO()
+    with tarfile.open(fileobj=stream, mode="w|") as tar:
+        info = tarfile.TarInfo("../escaped")
+        info.size = 4
+        tar.addfile(info, io.BytesIO(b"evil"))
+    stream.seek(0)
+
+    with pytest.raises(tarfile.TarError):
+        unpack_artifact(stream, "StandaloneLinux64", tmp_path / "builds", tmp_path / "logs")
+
+    assert not (tmp_path / "builds" / "escaped").exists()
+    assert not (tmp_path / "escaped").exists()
+
+
+def test_command_transport(tmp_path):
+    metadata = fake_worker(tmp_path).run(JOB, tmp_path / "builds", tmp_path / "logs")
+
+    assert metadata == {"build_size": 1}
+    assert (tmp_path / "builds" / "StandaloneLinux64" / "Data" / "file").is_file()
+
+
+def test_command_transport_failure(tmp_path):
+    with pytest.raises(WorkerFailedError, match="exited with 3"):
+        fake_worker(tmp_path, fail=True).run(JOB, tmp_path / "builds", tmp_path / "logs")
+
+    assert not (tmp_path / "builds" / ".StandaloneLinux64.partial").exists()
+
+
+def test_coordinator_spreads_jobs_and_stops_on_failure():
+    transports = [CommandTransport(name, []) for name in ("a", "b")]
+    jobs = [TargetJob(target, "abc", 42, "develop") for target in ("t1", "t2", "t3", "t4")]
+    built = []
+
+    def run(transport, job):
+        if job.target == "t1":
+            raise WorkerFailedError(transport.name, job.target, "boom")
+
+        built.append(job.target)
+
+    failures = Coordinator(transports, stop_on_failure=False).build(jobs, run)
+    assert list(failures) == ["t1"]
+    assert sorted(built) == ["t2", "t3", "t4"]
+
+    built.clear()
+    failures = Coordinator(transports[:1], stop_on_failure=True).build(jobs, run)
+    assert list(failures) == ["t1"]
+    assert built == []
+
+
+def test_make_transport():
+    assert make_transport("local:/srv/worker").cwd == Path("/srv/worker")
+    ssh = make_transport("ssh:builder:/srv/worker")
+    assert ssh.argv[-2:] == ["builder", "cd /srv/worker && python3 main.py --worker"]
+
+    with pytest.raises(ValueError):
+        make_transport("ftp:nope")
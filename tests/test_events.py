@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from usautobuild import events
+from usautobuild.events import BuildEvent, EventLog, list_runs, read_events
+
+
+@pytest.fixture
+def event_log(tmp_path):
+    event_log = EventLog(tmp_path, "run", build_number=42, branch="develop")
+    events.set_event_log(event_log)
+
+    yield event_log
+
+    events.set_event_log(None)
+    event_log.close()
+
+
+def test_event_log_writes_flat_json_lines(event_log):
+    event_log.emit("upload", target="StandaloneOSX", duration=1.5, bytes=1024)
+    event_log.close()
+
+    (line,) = event_log.path.read_text().splitlines()
+    raw = json.loads(line)
+
+    assert raw["event"] == "upload"
+    assert raw["run_id"] == "run"
+    assert raw["build_number"] == 42
+    assert raw["branch"] == "develop"
+    assert raw["target"] == "StandaloneOSX"
+    assert raw["duration"] == 1.5
+    assert raw["bytes"] == 1024
+
+
+def test_read_events_roundtrip(event_log):
+    emitted = event_log.emit("something", status="ok", nested={"a": 1})
+    event_log.close()
+
+    assert read_events(event_log.path) == [emitted]
+
+
+def test_read_events_skips_truncated_line(event_log):
+    event_log.emit("first")
+    event_log.close()
+
+    with event_log.path.open("a") as f:
+        f.write('{"event": "sec')
+
+    assert [event.event for event in read_events(event_log.path)] == ["first"]
+
+
+def test_stage_records_outcome(event_log):
+    with events.stage("ok_stage", target="linuxserver"):
+        pass
+
+    with pytest.raises(ValueError), events.stage("bad_stage"):
+        raise ValueError("nope")
+
+    event_log.close()
+
+    start, end, _, failed = read_events(event_log.path)
+
+    assert (start.event, start.stage, start.target) == ("stage_start", "ok_stage", "linuxserver")
+    assert (end.event, end.status) == ("stage_end", "ok")
+    assert end.duration is not None
+    assert (failed.stage, failed.status, failed.data["error"]) == ("bad_stage", "failed", "nope")
+
+
+def test_emit_without_event_log_does_nothing():
+    events.emit("nothing")
+
+
+def test_build_event_from_dict_unknown_fields():
+    event = BuildEvent.from_dict({"event": "e", "ts": 1.0, "run_id": "r", "new_field": 1})
+
+    assert event.data == {"new_field": 1}
+
+
+def test_list_runs(tmp_path):
+    assert list_runs(tmp_path / "nonexistent") == []
+
+    EventLog(tmp_path, "a").close()
+
+    assert list_runs(tmp_path) == [tmp_path / "a.jsonl"]
@@ -0,0 +1,101 @@
+import hashlib
+import shutil
+import zlib
+
+import pytest
+
+from usautobuild import integrity
+from usautobuild.integrity import (
+    Manifest,
+    StreamDigest,
+    build_manifest,
+    check_layout,
+    hash_file,
+    manifest_path,
+    verify_archive,
+)
+
+
+@pytest.fixture
+def build(tmp_path):
+    root = tmp_path / "builds" / "linuxserver"
+    (root / "Unitystation_Data" / "Managed").mkdir(parents=True)
+    (root / "Unitystation").write_bytes(b"\x7fELF" * 1000)
+    (root / "Unitystation_Data" / "data.unity3d").write_bytes(bytes(range(256)) * 4096)
+    (root / "Unitystation_Data" / "Managed" / "Mirror.dll").write_bytes(b"MZ" * 100)
+    (root / "Unitystation_Data" / "empty").touch()
+
+    return root
+
+
+@pytest.mark.parametrize("data", [b"", b"abc", bytes(range(256)) * 100])
+def test_hash_file(tmp_path, monkeypatch, data):
+    # several chunks per file
+    monkeypatch.setattr(integrity, "_CHUNK", 1000)
+    path = tmp_path / "file"
+    path.write_bytes(data)
+
+    assert hash_file(path) == integrity.FileDigest(len(data), hashlib.sha256(data).hexdigest(), zlib.crc32(data))
+
+
+def test_stream_digest():
+    digest = StreamDigest()
+    for block in (b"ab", b"", b"c"):
+        digest.update(block)
+
+    assert digest.size == 3
+    assert digest.hexdigest == hashlib.sha256(b"abc").hexdigest()
+
+
+def test_manifest_roundtrip(build):
+    manifest = build_manifest("linuxserver", build, workers=2)
+
+    assert set(manifest.files) == {
+        "Unitystation",
+        "Unitystation_Data/data.unity3d",
+        "Unitystation_Data/Managed/Mirror.dll",
+        "Unitystation_Data/empty",
+    }
+    assert manifest.files["Unitystation"] == hash_file(build / "Unitystation")
+    assert manifest.size == 4000 + 256 * 4096 + 200
+
+    path = manifest_path(build.parent, "linuxserver")
+    manifest.write(path)
+    assert Manifest.load(path) == manifest
+
+    path.write_text("{")
+    assert Manifest.load(path) is None
+
+
+def test_check_layout(build, tmp_path):
+    assert check_layout(build, ["Unitystation", "Unitystation_Data/Managed"]) == []
+    assert check_layout(build, ["Unitystation.exe"]) == ["Unitystation.exe is missing"]
+    assert check_layout(tmp_path / "missing", []) == [f"{tmp_path / 'missing'} does not exist"]
+
+    (tmp_path / "hollow" / "Data").mkdir(parents=True)
+    assert check_layout(tmp_path / "hollow", ["Data"]) == [f"{tmp_path / 'hollow'} has no files"]
+
+
+def test_verify_archive(build):
+    manifest = build_manifest("linuxserver", build)
+    shutil.make_archive(str(build), "zip", build)
+
+    assert verify_archive(build.with_suffix(".zip"), manifest, workers=3) == []
+
+    (build / "Unitystation").write_bytes(b"changed")
+    stale = build_manifest("linuxserver", build)
+    del stale.files["Unitystation_Data/empty"]
+    stale.files["extra"] = stale.files["Unitystation"]
+
+    assert verify_archive(build.with_suffix(".zip"), stale) == [
+        "Unitystation differs from manifest",
+        "Unitystation_Data/empty is not in manifest",
+        "extra is missing in archive",
+    ]
+
+    # flip a byte in the middle of stored data of the largest member
+    raw = bytearray(build.with_suffix(".zip").read_bytes())
+    raw[len(raw) // 3] ^= 0xFF
+    build.with_suffix(".zip").write_bytes(raw)
+
+    assert verify_archive(build.with_suffix(".zip"), manifest)
@@ -0,0 +1,160 @@
+import logging
+import threading
+
+from typing import Any, Optional
+
+import pytest
+
+from usautobuild.logger import BufferedDiscordHandler, Logger, log
+
+
+class FakeResponse:
+    def __init__(
+        self, status_code: int = 204, headers: Optional[dict[str, str]] = None, body: Optional[dict[str, Any]] = None
+    ) -> None:
+        self.status_code = status_code
+        self.headers = {} if headers is None else headers
+        self._body = body
+
+    def json(self) -> dict[str, Any]:
+        if self._body is None:
+            raise ValueError("no json body")
+
+        return self._body
+
+
+class FakeSession:
+    """Returns given responses in order, then 204s. Posting blocks while paused"""
+
+    def __init__(self, *responses: FakeResponse) -> None:
+        self.responses = list(responses)
+        self.posted: list[str] = []
+        self.resumed = threading.Event()
+        self.resumed.set()
+        self.waiting = threading.Event()
+
+    def post(self, _url: str, json: dict[str, Any], timeout: float) -> FakeResponse:
+        self.waiting.set()
+        self.resumed.wait()
+        self.posted.append(json["content"])
+
+        return self.responses.pop(0) if self.responses else FakeResponse()
+
+    def close(self) -> None: ...
+
+
+@pytest.fixture
+def make_handler(monkeypatch):
+    pytest.importorskip("requests")
+
+    monkeypatch.setattr(BufferedDiscordHandler, "MIN_SEND_INTERVAL", 0.0)
+    monkeypatch.setattr(BufferedDiscordHandler, "BUFFER_GRACE_TIME", 0.01)
+    created = []
+
+    def make(session: FakeSession, **kwargs: Any) -> BufferedDiscordHandler:
+        handler = BufferedDiscordHandler("http://localhost/webhook", **kwargs)
+        handler._session = session  # type: ignore[assignment]
+        created.append(handler)
+
+        return handler
+
+    yield make
+
+    for handler in created:
+        if handler._thread.is_alive():
+            handler.stop()
+
+
+def record(message: str) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, __file__, 0, message, None, None)
+
+
+@pytest.mark.parametrize(
+    ("response", "delay"),
+    [
+        # remaining requests are spread over the bucket window
+        (FakeResponse(headers={"X-RateLimit-Remaining": "4", "X-RateLimit-Reset-After": "10"}), 2.0),
+        (FakeResponse(headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "1.5"}), 1.5),
+        (FakeResponse(), BufferedDiscordHandler.MIN_SEND_INTERVAL),
+        # body is more precise than rounded header
+        (FakeResponse(429, {"Retry-After": "3"}, {"retry_after": 2.5}), 2.5),
+        (FakeResponse(429, {"Retry-After": "3"}), 3.0),
+        (FakeResponse(429), BufferedDiscordHandler.MIN_SEND_INTERVAL),
+    ],
+)
+def test_rate_limit_delay(response, delay):
+    assert BufferedDiscordHandler.rate_limit_delay(response) == delay
+
+
+def test_rate_limited_message_is_retried(make_handler):
+    session = FakeSession(FakeResponse(429, body={"retry_after": 0.01}))
+    handler = make_handler(session)
+
+    assert handler.send_message("hello")
+    assert session.posted == ["hello", "hello"]
+
+
+def test_rate_limit_retries_are_bounded(make_handler, monkeypatch):
+    monkeypatch.setattr(BufferedDiscordHandler, "MAX_RATE_LIMIT_RETRIES", 2)
+    session = FakeSession(*(FakeResponse(429, body={"retry_after": 0}) for _ in range(5)))
+    handler = make_handler(session)
+
+    assert not handler.send_message("hello")
+    assert len(session.posted) == 3
+
+
+def test_overflow_notice_follows_queued_records(make_handler):
+    session = FakeSession()
+    handler = make_handler(session, queue_size=5)
+
+    # stall handler thread in the middle of sending first message
+    session.resumed.clear()
+    handler.emit(record("first"))
+    assert session.waiting.wait(5)
+
+    for i in range(50):
+        handler.emit(record(f"m{i}"))
+
+    session.resumed.set()
+    handler.stop()
+
+    assert handler.dropped == 45
+    text = "\n".join(session.posted)
+    assert text.index("first") < text.index("m4") < text.index("skipped 45 messages")
+    assert "m5" not in text
+
+
+def test_overflow_drop_policy_only_counts(make_handler):
+    session = FakeSession()
+    handler = make_handler(session, overflow=BufferedDiscordHandler.OVERFLOW_DROP, queue_size=5)
+
+    session.resumed.clear()
+    handler.emit(record("first"))
+    assert session.waiting.wait(5)
+
+    for i in range(10):
+        handler.emit(record(f"m{i}"))
+
+    session.resumed.set()
+    handler.stop()
+
+    assert handler.dropped == 5
+    assert "skipped" not in "\n".join(session.posted)
+
+
+def test_queued_records_are_written_on_exit(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Logger, "_Logger__logger_initialized", False)
+    monkeypatch.setattr(log, "handlers", [])
+    monkeypatch.setattr(log, "level", log.level)
+
+    with Logger(logging.DEBUG):
+        for i in range(1000):
+            log.info("message %s", i)
+
+    (log_file,) = (tmp_path / "logs").iterdir()
+    written = log_file.read_text().splitlines()
+
+    assert len(written) == 1000
+    assert written[-1].endswith("message 999")
+    assert capsys.readouterr().out.count("message") == 1000
@@ -0,0 +1,83 @@
+import stat
+
+from typing import Any
+
+from usautobuild.events import BuildEvent
+from usautobuild.metrics import MetricsRegistry, metrics_from_events, write_textfile
+
+
+def make_event(event: str, **kwargs: Any) -> BuildEvent:
+    return BuildEvent(event=event, ts=1000.0, run_id="run", build_number=42, branch="develop", **kwargs)
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    registry.declare("things_total", "counter", "Things")
+    registry.declare("empty", "gauge", "Never set")
+    registry.inc("things_total", 2, kind='a "quoted"\nvalue')
+
+    assert registry.render() == "\n".join(
+        (
+            "# HELP things_total Things",
+            "# TYPE things_total counter",
+            'things_total{kind="a \\"quoted\\"\\nvalue"} 2\n',
+        )
+    )
+
+
+def test_load_counters_continues_counters_only():
+    previous = MetricsRegistry()
+    previous.declare("things_total", "counter", "Things")
+    previous.declare("level", "gauge", "Level")
+    previous.inc("things_total", 3, kind='we"ird')
+    previous.set("level", 5)
+
+    registry = MetricsRegistry()
+    registry.declare("things_total", "counter", "Things")
+    registry.declare("level", "gauge", "Level")
+    registry.load_counters(previous.render() + "garbage line\n")
+    registry.inc("things_total", kind='we"ird')
+
+    assert registry.get("things_total", kind='we"ird') == 4
+    assert registry.get("level") is None
+
+
+def test_metrics_from_events():
+    events = [
+        make_event("stage_end", stage="build", target="linux", duration=10.0, status="ok"),
+        make_event("build_phases", target="linux", data={"phases": {"il2cpp": {"duration": 4.0}}, "build_size": 100}),
+        make_event("upload", target="linux", duration=2.0, data={"bytes": 300, "connection": 0}),
+        make_event("upload", target="linux", duration=1.0, data={"bytes": 300, "connection": 1}),
+        make_event("cache", data={"cache": "docker_layers", "hits": 3, "lookups": 4}),
+        make_event("stage_end", stage="run", duration=20.0, status="failed"),
+    ]
+
+    registry = metrics_from_events(events, 'usautobuild_runs_total{branch="develop",status="failed"} 2\n')
+
+    assert registry.get("usautobuild_runs_total", branch="develop", status="failed") == 3
+    assert registry.get("usautobuild_run_success", branch="develop") == 0
+    assert registry.get("usautobuild_stage_failures_total", branch="develop", stage="run", target="") == 1
+    assert registry.get("usautobuild_stage_duration_seconds", branch="develop", stage="build", target="linux") == 10
+    phase = registry.get("usautobuild_build_phase_duration_seconds", branch="develop", target="linux", phase="il2cpp")
+    assert phase == 4
+    assert registry.get("usautobuild_build_size_bytes", branch="develop", target="linux") == 100
+    assert registry.get("usautobuild_upload_bytes", branch="develop", target="linux") == 600
+    assert registry.get("usautobuild_upload_throughput_bytes_per_second", branch="develop", target="linux") == 200
+    metric = "usautobuild_upload_connection_throughput_bytes_per_second"
+    assert registry.get(metric, branch="develop", connection="1") == 300
+    assert registry.get("usautobuild_cache_hit_ratio", branch="develop", cache="docker_layers") == 0.75
+
+
+def test_write_textfile_replaces_file(tmp_path):
+    path = tmp_path / "collector" / "usautobuild.prom"
+    registry = MetricsRegistry()
+    registry.declare("level", "gauge", "Level")
+    registry.set("level", 1)
+
+    write_textfile(path, registry)
+    registry.set("level", 2)
+    write_textfile(path, registry)
+
+    assert path.read_text().endswith("level 2\n")
+    assert stat.S_IMODE(path.stat().st_mode) == 0o644
+    assert [p.name for p in path.parent.iterdir()] == ["usautobuild.prom"]
@@ -0,0 +1,108 @@
+import logging
+
+import pytest
+
+from usautobuild.output import BoundedCapture, LineSplitter, is_level_handled
+
+
+def test_line_splitter_buffers_incomplete_line():
+    splitter = LineSplitter()
+
+    assert splitter.feed(b"foo") == []
+    assert splitter.feed(b"bar\nbaz") == ["foobar"]
+    assert splitter.flush() == ["baz"]
+    assert splitter.flush() == []
+
+
+def test_line_splitter_multiple_lines():
+    splitter = LineSplitter()
+
+    assert splitter.feed(b"a\nb\n\nc\n") == ["a", "b", "", "c"]
+    assert splitter.flush() == []
+
+
+def test_line_splitter_multibyte_split_between_chunks():
+    splitter = LineSplitter()
+    data = "нян\n".encode()
+
+    assert splitter.feed(data[:1]) == []
+    assert splitter.feed(data[1:3]) == []
+    assert splitter.feed(data[3:]) == ["нян"]
+
+
+def test_line_splitter_replaces_invalid_bytes():
+    splitter = LineSplitter()
+
+    assert splitter.feed(b"\xff\n") == ["�"]
+
+
+@pytest.fixture
+def logger():
+    # detached from hierarchy so pytest capture handlers do not interfere
+    return logging.Logger("test_output", logging.DEBUG)
+
+
+def test_is_level_handled_logger_level(logger):
+    logger.addHandler(logging.NullHandler())
+    logger.setLevel(logging.INFO)
+
+    assert not is_level_handled(logger, logging.DEBUG)
+    assert is_level_handled(logger, logging.INFO)
+
+
+def test_is_level_handled_handler_level(logger):
+    handler = logging.NullHandler()
+    handler.setLevel(logging.INFO)
+    logger.addHandler(handler)
+
+    assert not is_level_handled(logger, logging.DEBUG)
+
+    logger.addHandler(logging.NullHandler())
+
+    assert is_level_handled(logger, logging.DEBUG)
+
+
+def test_is_level_handled_last_resort(logger):
+    assert not is_level_handled(logger, logging.INFO)
+    assert is_level_handled(logger, logging.WARNING)
+
+
+def test_bounded_capture_keeps_everything_within_limits():
+    capture = BoundedCapture(max_lines=3)
+    capture.extend(["a", "b", "c"])
+
+    assert capture.lines == ["a", "b", "c"]
+    assert capture.dropped == 0
+    assert capture.spill_path is None
+
+
+def test_bounded_capture_line_limit():
+    capture = BoundedCapture(max_lines=2, spill=False)
+    capture.extend(["a", "b", "c", "d"])
+
+    assert capture.lines == ["c", "d"]
+    assert capture.dropped == 2
+    assert capture.spill_path is None
+
+
+def test_bounded_capture_char_limit_keeps_last_line():
+    capture = BoundedCapture(max_chars=4, spill=False)
+    capture.extend(["aa", "bb", "cc", "dddddd"])
+
+    assert capture.lines == ["dddddd"]
+    assert capture.dropped == 3
+
+
+def test_bounded_capture_spills_full_stream():
+    capture = BoundedCapture(max_lines=2)
+    capture.extend(["a", "b", "c", "d"])
+    capture.close()
+
+    assert capture.spill_path is not None
+    assert capture.spill_path.read_text() == "a\nb\nc\nd\n"
+
+    spill_path = capture.spill_path
+    capture.discard()
+
+    assert not spill_path.exists()
+    assert capture.lines == []
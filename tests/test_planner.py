@@ -0,0 +1,107 @@
+from pathlib import Path
+
+import pytest
+
+from usautobuild.config import Config
+from usautobuild.events import BuildEvent
+from usautobuild.planner import History, PlanStage, build_plan, simulate
+
+
+def event(name: str, **kwargs) -> BuildEvent:
+    return BuildEvent.from_dict({"event": name, "ts": 0.0, "run_id": "run", **kwargs})
+
+
+def make_config(**args) -> Config:
+    required = dict.fromkeys(
+        (
+            "cdn_host",
+            "cdn_user",
+            "cdn_password",
+            "docker_password",
+            "docker_username",
+            "changelog_api_url",
+            "changelog_api_key",
+            "changelog_webhook",
+            "newest_build_api_url",
+        ),
+        "value",
+    )
+
+    return Config.resolve({"config_file": Path(), "do_good_files": True, **required, **args}, environ={})
+
+
+def test_simulate_respects_limits_and_finds_critical_path():
+    stages = [
+        PlanStage("gitting", "git", 1),
+        PlanStage("build", "build", 5, "a", ("gitting",)),
+        PlanStage("build", "build", 3, "b", ("gitting",)),
+        PlanStage("build", "build", 4, "c", ("gitting",)),
+        PlanStage("upload", "upload", 2, "c", ("build c",)),
+    ]
+
+    assert simulate(stages, {}, serial=True).wall_time == 15
+
+    unlimited = simulate(stages, {})
+    assert unlimited.wall_time == 7
+    assert unlimited.critical_path() == ["gitting", "build c", "upload c"]
+
+    limited = simulate(stages, {"build": 2})
+    # longest remaining paths go first: c (4 + 2) and a (5), b waits for c
+    assert limited.start["build b"] == 5
+    assert limited.wall_time == 8
+    assert limited.critical_path() == ["gitting", "build c", "build b"]
+
+
+def test_history_estimates_and_cache_rates():
+    history = History()
+    history.add_run(
+        [
+            event("stage_end", stage="build", target="linuxserver", duration=100.0, status="ok"),
+            event("stage_end", stage="build", target="StandaloneOSX", duration=50.0, status="failed"),
+            event("process", label="pull linuxserver", duration=10.0, status="0"),
+            event("cache", cache="docker_pull", hits=1, lookups=2),
+            event("archive", target="linuxserver", duration=3.0, bytes=1),
+            event("archive", target="StandaloneOSX", duration=30.0, bytes=1, good_files="1"),
+        ]
+    )
+    history.add_run([event("stage_start", stage="build")])
+
+    assert history.runs == 1
+    assert history.estimate("build", "linuxserver") == 100
+    # failed build does not count, estimate falls back to other targets
+    assert history.estimate("build", "StandaloneOSX") == 100
+    assert history.estimate("pull", "linuxserver") == 10
+    assert history.estimate("archive", "StandaloneOSX") == 3
+    assert history.estimate("dockering") is None
+    assert history.hit_rate("docker_pull") == 0.5
+    assert history.hit_rate("good_files") is None
+
+
+def test_build_plan_follows_config():
+    history = History()
+    history.add_run(
+        [
+            event("stage_end", stage="build", target="linuxserver", duration=100.0, status="ok"),
+            event("process", label="pull linuxserver", duration=10.0, status="0"),
+        ]
+    )
+
+    dry = build_plan(make_config(dry_run=True, target_platforms=["linuxserver"]), history, {})
+    assert [stage.key for stage in dry] == ["gitting", "build linuxserver", "verify linuxserver", "good_files"]
+    assert dry[1].source == "history"
+    assert dry[3].deps == ("gitting",)
+
+    stages = build_plan(
+        make_config(release=True, target_platforms=["linuxserver", "StandaloneOSX"]),
+        history,
+        {"docker_pull": 1.0, "good_files": 1.0},
+    )
+    by_key = {stage.key: stage for stage in stages}
+
+    # recorded build pulled its image, assumed cache hit skips it
+    assert by_key["build linuxserver"].duration == pytest.approx(90)
+    assert by_key["good_files"].duration == 0
+    assert by_key["good_files"].deps == ("verify StandaloneOSX",)
+    assert by_key["archive StandaloneOSX"].deps == ("verify StandaloneOSX",)
+    assert by_key["dockering"].deps == ("verify linuxserver",)
+    assert set(by_key["changelog"].deps) == {"upload linuxserver", "upload StandaloneOSX", "dockering"}
@@ -0,0 +1,72 @@
+import resource
+import subprocess
+import sys
+
+from usautobuild.resources import (
+    ContainerSampler,
+    ContainerUsage,
+    ProcessUsage,
+    UsageRecorder,
+    format_usage_table,
+    wait_with_rusage,
+)
+
+
+def test_wait_with_rusage_sets_returncode():
+    with subprocess.Popen([sys.executable, "-c", "raise SystemExit(3)"]) as cmd:  # noqa: S603
+        rusage = wait_with_rusage(cmd)
+
+    assert cmd.returncode == 3
+    assert rusage is not None
+
+    usage = ProcessUsage.from_rusage("python", 1.0, cmd.returncode, rusage)
+
+    assert usage.peak_rss > 0
+    assert usage.user_time + usage.system_time > 0
+
+
+def test_process_usage_from_rusage_units():
+    rusage = resource.struct_rusage((1.5, 0.5, 2048, 0, 0, 0, 0, 0, 0, 4, 8, 0, 0, 0, 0, 0))
+
+    usage = ProcessUsage.from_rusage("cmd", 2.0, 0, rusage)
+
+    assert usage.user_time == 1.5
+    assert usage.system_time == 0.5
+    assert usage.read_bytes == 4 * 512
+    assert usage.written_bytes == 8 * 512
+
+
+def test_container_sampler_reads_cgroup_v2(tmp_path):
+    (tmp_path / "cpu.stat").write_text("usage_usec 2500000\nuser_usec 2000000\nsystem_usec 500000\n")
+    (tmp_path / "memory.peak").write_text("1048576\n")
+    (tmp_path / "io.stat").write_text("8:0 rbytes=100 wbytes=200 rios=1 wios=2\n8:16 rbytes=1 wbytes=2 rios=1 wios=1\n")
+
+    usage = ContainerSampler._read_v2(tmp_path)
+
+    assert usage == ContainerUsage(cpu_time=2.5, peak_memory=1048576, read_bytes=101, written_bytes=202)
+
+
+def test_usage_recorder():
+    usage_recorder = UsageRecorder()
+    usage = ProcessUsage("cmd", 1.0, 0)
+
+    usage_recorder.record(usage)
+
+    assert usage_recorder.usages == [usage]
+
+
+def test_format_usage_table():
+    table = format_usage_table(
+        [
+            ProcessUsage("build linuxserver", 3723.0, 0, peak_rss=2048, container=ContainerUsage(peak_memory=1 << 30)),
+            ProcessUsage("docker push", 12.25, 1),
+        ]
+    )
+    header, build, push = table.splitlines()
+
+    assert header.startswith("command")
+    assert "01:02:03" in build
+    assert "1.0 GiB" in build
+    assert "2.0 KiB" in build
+    assert push.startswith("docker push")
+    assert "12.2s" in push
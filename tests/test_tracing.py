@@ -0,0 +1,92 @@
+import json
+import threading
+
+import pytest
+
+from usautobuild.tracing import Tracer
+
+
+def test_span_nesting():
+    tracer = Tracer()
+
+    with tracer.span("outer", target="linuxserver") as outer, tracer.span("inner") as inner:
+        pass
+
+    assert inner.parent_id == outer.id
+    assert outer.parent_id is None
+    assert outer.args == {"target": "linuxserver"}
+    assert outer.duration is not None
+    assert inner.duration is not None
+    assert outer.duration >= inner.duration >= 0
+
+
+def test_span_records_error():
+    tracer = Tracer()
+
+    with pytest.raises(ValueError), tracer.span("failing"):
+        raise ValueError
+
+    (span,) = tracer.spans
+
+    assert "ValueError" in span.args["error"]
+    assert span.end is not None
+
+
+def test_traced_decorator():
+    tracer = Tracer()
+
+    class Stage:
+        @tracer.traced()
+        def run(self, value):
+            return value * 2
+
+        @tracer.traced("custom")
+        def other(self):
+            with tracer.span("child"):
+                pass
+
+    assert Stage().run(2) == 4
+    Stage().other()
+
+    run, custom, child = tracer.spans
+
+    assert run.name == "test_traced_decorator.<locals>.Stage.run"
+    assert custom.name == "custom"
+    assert child.parent_id == custom.id
+
+
+def test_threads_get_own_trees():
+    tracer = Tracer()
+
+    with tracer.span("main"):
+        thread = threading.Thread(target=lambda: tracer.span("worker").__enter__(), name="worker-thread")
+        thread.start()
+        thread.join()
+
+    main, worker = tracer.spans
+
+    assert worker.parent_id is None
+    assert worker.thread_name == "worker-thread"
+    assert worker.thread_id != main.thread_id
+
+
+def test_chrome_trace_export(tmp_path):
+    tracer = Tracer()
+
+    with tracer.span("done"):
+        pass
+
+    open_span = tracer.span("open")
+    open_span.__enter__()
+
+    path = tmp_path / "traces" / "run.json"
+    tracer.export_chrome_trace(path)
+
+    trace = json.loads(path.read_text())
+    complete = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    metadata = [event for event in trace["traceEvents"] if event["ph"] == "M"]
+
+    assert [event["name"] for event in complete] == ["done", "open"]
+    assert all(event["dur"] >= 0 for event in complete)
+    assert complete[1]["args"]["parent_id"] is None
+    assert metadata[0]["args"]["name"] == threading.current_thread().name
@@ -0,0 +1,103 @@
+import time
+
+from usautobuild.unity_log import LogTailer, UnityLogParser
+
+LOG = """\
+Begin MonoManager ReloadAssembly
+- Completed reload, in  1.500 seconds
+- Starting script compilation
+- Finished script compilation in 12.250 seconds
+Asset Pipeline Refresh: Total: 30.000 seconds - Initiated by RefreshV2(NoUpdateAssetOptions)
+- Completed reload, in  0.500 seconds
+Compiling shader "Standard" pass "FORWARD" (vp)
+Compiling shader "Standard" pass "FORWARD" (fp)
+Build Report
+Uncompressed usage by category (Percentages based on user generated assets only):
+Textures               12.0 mb	 50.0%
+Meshes                 1.5 kb	 0.0%
+Complete build size 2.0 gb
+Build Finished, Result: Success.
+"""
+
+
+def test_parser_phases_and_report():
+    parser = UnityLogParser()
+
+    for i, line in enumerate(LOG.splitlines()):
+        parser.feed(line, timestamp=float(i))
+
+    metrics = parser.metrics
+    phases = metrics.phases
+
+    assert phases["domain_reload"].duration == 2.0
+    assert phases["domain_reload"].count == 2
+    assert phases["script_compilation"].duration == 12.25
+    assert phases["asset_import"].duration == 30.0
+    # timed by line timestamps
+    assert phases["shader_compilation"].duration == 1.0
+    assert "il2cpp" not in phases
+
+    assert metrics.size_by_category == {"Textures": 12 * 1024**2, "Meshes": 1536}
+    assert metrics.build_size == 2 * 1024**3
+    assert metrics.result == "Success"
+
+
+# trimmed linuxserver editor log, il2cpp is mentioned long before and after the player build runs it
+IL2CPP_LOG = """\
+[Package Manager] Registered 42 packages:
+  Packages from [https://packages.unity.com]:
+    com.unity.burst@1.8.4 (location: Library/PackageCache/com.unity.burst@1.8.4)
+Loading il2cpp_data from Library/il2cpp_cache
+Scripting backend: IL2CPP
+- Completed reload, in  1.500 seconds
+[ 1/6  0s] Csc Library/Bee/artifacts/1900b0aE.dag/Assembly-CSharp.dll (+2 others)
+[ 2/6  3s] UnityLinker Library/Bee/artifacts/LinuxPlayerBuildProgram/ManagedStripped/Assembly-CSharp.dll
+[ 3/6 12s] IL2CPP_CodeGen Library/Bee/artifacts/LinuxPlayerBuildProgram/il2cppOutput/cpp/Il2CppCodeRegistration.cpp
+[ 4/6 40s] C_Linux_x64_Lld Library/Bee/artifacts/LinuxPlayerBuildProgram/.../GenericMethods__1.o
+[ 5/6  2s] Link_Linux_x64_Lld Library/Bee/artifacts/LinuxPlayerBuildProgram/.../GameAssembly.so
+[ 6/6  0s] CopyFiles Library/Bee/artifacts/LinuxPlayerBuildProgram/il2cpp_data/Metadata/global-metadata.dat
+Unloading 3 unused Assets to reduce memory usage. il2cpp_data cleanup skipped
+Build Finished, Result: Success.
+"""
+
+
+def test_parser_il2cpp_counts_build_steps_only():
+    parser = UnityLogParser()
+
+    for i, line in enumerate(IL2CPP_LOG.splitlines()):
+        parser.feed(line, timestamp=float(i))
+
+    # timestamps are line numbers, from IL2CPP_CodeGen to Link_Linux_x64_Lld
+    assert parser.metrics.phases["il2cpp"].first_seen == 8.0
+    assert parser.metrics.phases["il2cpp"].duration == 2.0
+    assert parser.metrics.phases["il2cpp"].count == 1
+    assert parser.metrics.result == "Success"
+
+
+def test_parser_il2cpp_older_editor():
+    parser = UnityLogParser()
+
+    parser.feed("Invoking il2cpp with arguments: --convert-to-cpp --emit-null-checks", timestamp=10.0)
+    parser.feed("IL2CPP settings changed", timestamp=20.0)
+
+    assert parser.metrics.phases["il2cpp"].first_seen == 10.0
+    assert parser.metrics.phases["il2cpp"].duration == 0.0
+
+
+def test_tailer_follows_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(LogTailer, "POLL_INTERVAL", 0.01)
+
+    log_file = tmp_path / "build.txt"
+    tailer = LogTailer(log_file).start()
+
+    time.sleep(0.05)
+    with log_file.open("w") as f:
+        f.write("- Finished script compilation in 1.0 seconds\n- Finished script")
+    time.sleep(0.05)
+    with log_file.open("a") as f:
+        f.write(" compilation in 2.0 seconds\nBuild Finished, Result: Failure.")
+
+    metrics = tailer.stop()
+
+    assert metrics.phases["script_compilation"].duration == 3.0
+    assert metrics.result == "Failure"
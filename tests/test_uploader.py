@@ -0,0 +1,188 @@
+import hashlib
+
+from ftplib import FTP
+from pathlib import Path
+
+import pytest
+
+from tests.ftp_server import FTPServer
+from usautobuild.actions import uploader as uploader_module
+from usautobuild.actions.uploader import Uploader
+from usautobuild.checkpoint import RunState
+from usautobuild.config import Config
+from usautobuild.exceptions import BuildVerificationError, UploadVerificationError
+from usautobuild.integrity import build_manifest, manifest_path
+
+TARGETS = ["linuxserver", "StandaloneOSX"]
+
+
+@pytest.fixture
+def server(tmp_path):
+    with FTPServer(tmp_path / "cdn") as server:
+        yield server
+
+
+@pytest.fixture
+def uploader_config(tmp_path, server) -> Config:
+    output_dir = tmp_path / "builds"
+    for target in TARGETS:
+        (output_dir / target / "Data").mkdir(parents=True)
+        (output_dir / target / "Data" / "level0").write_bytes(target.encode() * 1000)
+
+    return Config.resolve(
+        {
+            "config_file": Path(),
+            "do_good_files": True,
+            "cdn_host": server.host,
+            "cdn_port": server.port,
+            "cdn_user": "user",
+            "cdn_password": "password",
+            "docker_password": "password",
+            "docker_username": "username",
+            "changelog_api_url": "url",
+            "changelog_api_key": "key",
+            "changelog_webhook": "url",
+            "newest_build_api_url": "url",
+            "target_platforms": TARGETS,
+            "output_dir": output_dir,
+            "build_number": 42,
+        },
+        environ={},
+    )
+
+
+def test_upload_archives_to_cdn(uploader_config, server):
+    uploader = Uploader(uploader_config)
+    uploader.start_upload()
+
+    for target in TARGETS:
+        remote = server.root / "unitystation" / uploader_config.forkname / target / "42.zip"
+        data = uploader.archive_path(target).read_bytes()
+        assert remote.read_bytes() == data
+
+        sidecar = remote.with_name("42.zip.sha256").read_text()
+        assert sidecar == f"{hashlib.sha256(data).hexdigest()}  42.zip\n"
+
+    assert server.stats.commands["STOR"] == 2 * len(TARGETS)
+    assert server.stats.commands["SIZE"] == len(TARGETS)
+
+
+def test_broken_targets_are_not_uploaded(uploader_config, server):
+    uploader = Uploader(uploader_config)
+    uploader.start_upload(broken=["StandaloneOSX"])
+
+    assert not uploader.archive_path("StandaloneOSX").exists()
+    assert not (server.root / "unitystation" / uploader_config.forkname / "StandaloneOSX").exists()
+    assert (server.root / "unitystation" / uploader_config.forkname / "linuxserver" / "42.zip").exists()
+
+
+def test_upload_retries_size_mismatch(uploader_config, server, monkeypatch):
+    monkeypatch.setattr(server, "size", lambda _: 1)
+    monkeypatch.setattr(Uploader, "MAX_UPLOAD_ATTEMPTS", 1)
+
+    uploader = Uploader(uploader_config)
+    uploader.zip_build_folder("linuxserver")
+
+    with pytest.raises(UploadVerificationError):
+        uploader.upload_to_cdn()
+
+    # no sidecar is published for incomplete upload
+    assert server.stats.commands["STOR"] == 2
+    assert not list(server.root.rglob("*.sha256"))
+
+
+def test_upload_skips_completed_targets(tmp_path, uploader_config, server):
+    run_state = RunState(tmp_path / "state.json", 42)
+    uploader = Uploader(uploader_config, run_state)
+
+    for target in TARGETS:
+        uploader.zip_build_folder(target)
+    uploader.mark_complete("upload", "linuxserver")
+
+    uploader.upload_to_cdn()
+
+    assert server.stats.commands["STOR"] == 2
+    assert not (server.root / "unitystation" / uploader_config.forkname / "linuxserver").exists()
+
+
+def test_archive_is_checked_against_manifest(uploader_config):
+    output_dir = uploader_config.output_dir
+    build_manifest("linuxserver", output_dir / "linuxserver").write(manifest_path(output_dir, "linuxserver"))
+
+    uploader = Uploader(uploader_config)
+    uploader.zip_build_folder("linuxserver")
+
+    (output_dir / "linuxserver" / "Data" / "level0").write_bytes(b"truncated")
+    with pytest.raises(BuildVerificationError):
+        uploader.zip_build_folder("linuxserver")
+
+
+def test_upload_skips_files_already_on_cdn(uploader_config, server):
+    Uploader(uploader_config).start_upload()
+    stores = server.stats.commands["STOR"]
+
+    Uploader(uploader_config).upload_to_cdn()
+
+    assert server.stats.commands["STOR"] == stores
+    assert server.stats.commands["MKD"] == len(TARGETS)
+
+
+def test_uploaded_archive_is_hashed_once(uploader_config, server, monkeypatch):
+    uploader = Uploader(uploader_config)
+    uploader.start_upload()
+
+    hashed = []
+    monkeypatch.setattr(uploader_module, "hash_file", lambda path: hashed.append(path))
+
+    # digest of upload itself is reused by checks and retries
+    for _ in range(2):
+        uploader.upload_to_cdn()
+
+    assert hashed == []
+
+
+def test_failed_upload_discards_connection(uploader_config, server, monkeypatch):
+    uploader = Uploader(uploader_config)
+    uploader.zip_build_folder("linuxserver")
+
+    def store_verified(*_: object) -> None:
+        raise ConnectionResetError("Connection reset by peer")
+
+    monkeypatch.setattr(uploader, "store_verified", store_verified)
+    uploader.upload_target("linuxserver")
+    assert server.stats.connections == 1
+
+    with uploader.sessions.connection() as ftp:
+        ftp.pwd()
+
+    assert server.stats.connections == 2
+
+
+def test_directory_creation_is_retried(uploader_config, server, monkeypatch):
+    uploader = Uploader(uploader_config)
+    uploader.zip_build_folder("linuxserver")
+
+    make_dir = uploader.sessions.index.make_dir
+    failures = [TimeoutError("timed out")]
+
+    def flaky_make_dir(ftp: FTP, path: str) -> None:
+        if failures:
+            raise failures.pop()
+
+        make_dir(ftp, path)
+
+    monkeypatch.setattr(uploader.sessions.index, "make_dir", flaky_make_dir)
+    uploader.upload_target("linuxserver")
+
+    assert (server.root / "unitystation" / uploader_config.forkname / "linuxserver" / "42.zip").is_file()
+
+
+def test_good_files_folder_is_looked_up_in_listing(uploader_config, server):
+    (server.root / "unitystation" / "GoodFiles" / "24.1").mkdir(parents=True)
+
+    uploader = Uploader(uploader_config)
+
+    assert uploader.check_good_file_version_folder_exists("24.1")
+    assert not uploader.check_good_file_version_folder_exists("24.2")
+    assert server.stats.commands["MLSD"] == 1
+    assert server.stats.commands["CWD"] == 0
@@ -0,0 +1,29 @@
+import pytest
+
+from usautobuild.utils import atomic_write
+
+
+def test_atomic_write_replaces_file(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text("old")
+
+    with atomic_write(path, permissions=0o644) as f:
+        f.write("new")
+        # previous contents stay in place until block finishes
+        assert path.read_text() == "old"
+
+    assert path.read_text() == "new"
+    assert path.stat().st_mode & 0o777 == 0o644
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_atomic_write_keeps_file_on_error(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text("old")
+
+    with pytest.raises(RuntimeError), atomic_write(path) as f:
+        f.write("half")
+        raise RuntimeError("crash")
+
+    assert path.read_text() == "old"
+    assert list(tmp_path.iterdir()) == [path]
@@ -0,0 +1,81 @@
+from pathlib import Path
+
+import pytest
+
+from usautobuild.actions.verifier import Verifier
+from usautobuild.config import Config
+from usautobuild.exceptions import BuildVerificationError
+from usautobuild.integrity import Manifest, manifest_path
+
+
+def make_config(output_dir: Path, targets: list[str], abort_on_build_fail: bool = True) -> Config:
+    return Config.resolve(
+        {
+            "config_file": Path(),
+            "do_good_files": True,
+            "cdn_host": "host",
+            "cdn_user": "user",
+            "cdn_password": "password",
+            "docker_password": "password",
+            "docker_username": "username",
+            "changelog_api_url": "url",
+            "changelog_api_key": "key",
+            "changelog_webhook": "url",
+            "newest_build_api_url": "url",
+            "target_platforms": targets,
+            "output_dir": output_dir,
+        },
+        # false flags can not be passed as arguments
+        environ={"ABORT_ON_BUILD_FAIL": str(abort_on_build_fail)},
+    )
+
+
+def make_player(root: Path, code: str) -> None:
+    (root / "Unitystation_Data" / code).mkdir(parents=True)
+    (root / "Unitystation_Data" / code / "data.bin").write_bytes(b"code")
+    (root / "Unitystation").write_bytes(b"player")
+
+
+def test_il2cpp_target_needs_no_managed_assemblies(tmp_path):
+    # linuxserver is built with il2cpp image
+    make_player(tmp_path / "linuxserver", "il2cpp_data")
+    (tmp_path / "linuxserver" / "GameAssembly.so").write_bytes(b"native")
+
+    Verifier(make_config(tmp_path, ["linuxserver"])).start_verifying()
+
+    manifest = Manifest.load(manifest_path(tmp_path, "linuxserver"))
+    assert manifest is not None
+    assert "GameAssembly.so" in manifest.files
+
+
+def test_mono_target_needs_managed_assemblies(tmp_path):
+    make_player(tmp_path / "StandaloneLinux64", "il2cpp_data")
+
+    with pytest.raises(BuildVerificationError, match="Managed is missing"):
+        Verifier(make_config(tmp_path, ["StandaloneLinux64"])).start_verifying()
+
+
+def test_broken_target_does_not_stop_others_without_abort(tmp_path):
+    make_player(tmp_path / "StandaloneLinux64", "Managed")
+    config = make_config(tmp_path, ["linuxserver", "StandaloneLinux64"], abort_on_build_fail=False)
+
+    verifier = Verifier(config)
+    verifier.start_verifying()
+
+    assert verifier.failed_targets == ["linuxserver"]
+    assert not manifest_path(tmp_path, "linuxserver").exists()
+    assert manifest_path(tmp_path, "StandaloneLinux64").exists()
+
+
+def test_broken_target_loses_manifest_of_previous_run(tmp_path):
+    make_player(tmp_path / "StandaloneLinux64", "Managed")
+    config = make_config(tmp_path, ["StandaloneLinux64"], abort_on_build_fail=False)
+    Verifier(config).start_verifying()
+
+    # resumed run rebuilt target after partial clean
+    (tmp_path / "StandaloneLinux64" / "Unitystation").unlink()
+    verifier = Verifier(config)
+    verifier.start_verifying()
+
+    assert verifier.failed_targets == ["StandaloneLinux64"]
+    assert not manifest_path(tmp_path, "StandaloneLinux64").exists()
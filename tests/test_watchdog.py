@@ -0,0 +1,60 @@
+from usautobuild.watchdog import Watchdog
+
+
+def test_watchdog_no_limits(clock):
+    watchdog = Watchdog(clock=clock)
+
+    clock.now = 1e9
+
+    assert watchdog.check() is None
+    assert watchdog.poll_interval == Watchdog.MAX_POLL_INTERVAL
+
+
+def test_watchdog_timeout(clock):
+    watchdog = Watchdog(timeout=10, clock=clock)
+
+    clock.now = 9
+    watchdog.progress()
+
+    assert watchdog.check() is None
+
+    clock.now = 11
+
+    assert watchdog.check() is not None
+
+
+def test_watchdog_inactivity(clock):
+    watchdog = Watchdog(inactivity_timeout=4, clock=clock)
+
+    assert watchdog.poll_interval == 2
+
+    clock.now = 3
+    watchdog.progress()
+    clock.now = 6
+
+    assert watchdog.check() is None
+
+    clock.now = 8
+
+    reason = watchdog.check()
+    assert reason is not None
+    assert "no progress" in reason
+
+
+def test_watchdog_file_growth_is_progress(tmp_path, clock):
+    log_file = tmp_path / "build.txt"
+    watchdog = Watchdog(inactivity_timeout=4, watch_files=[log_file], clock=clock)
+
+    clock.now = 3
+    # file appearing counts as progress too
+    log_file.write_text("starting")
+
+    assert watchdog.check() is None
+
+    clock.now = 6
+
+    assert watchdog.check() is None
+
+    clock.now = 8
+
+    assert watchdog.check() is not None
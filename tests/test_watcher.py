@@ -0,0 +1,84 @@
+import subprocess
+
+from collections.abc import Callable, Sequence
+from typing import Any, Optional
+
+from usautobuild.watcher import RefWatcher, parse_ls_remote
+
+
+class FakeRemote:
+    def __init__(self, refs: dict[str, str], error: Optional[Exception] = None) -> None:
+        self.refs = refs
+        self.error = error
+        self.calls = 0
+
+    def __call__(self, _url: str, _patterns: Sequence[str]) -> dict[str, str]:
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+
+        return dict(self.refs)
+
+
+def make_watcher(remote: FakeRemote, clock: Callable[[], float], **kwargs: Any) -> RefWatcher:
+    return RefWatcher("url", "develop", interval=10, debounce=30, clock=clock, list_refs=remote, **kwargs)
+
+
+def test_parse_ls_remote():
+    output = "abc\trefs/heads/develop\ndef\trefs/pull/5/head\n\n"
+
+    assert parse_ls_remote(output) == {"refs/heads/develop": "abc", "refs/pull/5/head": "def"}
+
+
+def test_first_poll_only_remembers_heads(clock):
+    remote = FakeRemote({"refs/heads/develop": "a"})
+    watcher = make_watcher(remote, clock)
+
+    assert watcher.poll() == []
+
+    clock.now = 100
+    assert watcher.poll() == []
+
+
+def test_polls_at_interval(clock):
+    remote = FakeRemote({"refs/heads/develop": "a"})
+    watcher = make_watcher(remote, clock)
+
+    watcher.poll()
+    clock.now = 5
+    watcher.poll()
+    assert remote.calls == 1
+
+    clock.now = 10
+    watcher.poll()
+    assert remote.calls == 2
+
+
+def test_debounces_quick_pushes(clock):
+    remote = FakeRemote({"refs/heads/develop": "a", "refs/pull/7/head": "x"})
+    watcher = make_watcher(remote, clock, include_prs=True, release=True)
+    watcher.poll()
+
+    remote.refs["refs/heads/develop"] = "b"
+    clock.now = 10
+    assert watcher.poll() == []
+
+    # another push restarts debounce
+    remote.refs["refs/heads/develop"] = "c"
+    remote.refs["refs/pull/7/head"] = "y"
+    clock.now = 30
+    assert watcher.poll() == []
+
+    clock.now = 60
+    jobs = watcher.poll()
+    assert [(job.branch, job.pr, job.release) for job in jobs] == [("develop", None, True), (None, 7, True)]
+
+    clock.now = 100
+    assert watcher.poll() == []
+
+
+def test_remote_errors_are_not_fatal(clock):
+    remote = FakeRemote({}, subprocess.TimeoutExpired("git", 60))
+    watcher = make_watcher(remote, clock)
+
+    assert watcher.poll() == []
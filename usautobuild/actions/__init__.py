@@ -1,12 +1,19 @@
-from .api_caller import ApiCaller
-from .builder import Builder
-from .discord_changelog_poster import DiscordChangelogPoster
-from .dockerizer import Dockerizer
-from .gitter import Gitter
-from .licenser import Licenser
-from .stable_tagger import tag_as_stable
-from .uploader import Uploader
-from .good_files import GoodFiles
+import importlib
+
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .api_caller import ApiCaller
+    from .builder import Builder
+    from .discord_changelog_poster import DiscordChangelogPoster
+    from .dockerizer import Dockerizer
+    from .gitter import Gitter
+    from .good_files import GoodFiles
+    from .licenser import Licenser
+    from .stable_tagger import tag_as_stable
+    from .uploader import Uploader
+    from .verifier import Verifier
+
 __all__ = (
     "ApiCaller",
     "Builder",
@@ -17,4 +24,26 @@ __all__ = (
     "DiscordChangelogPoster",
     "tag_as_stable",
     "GoodFiles",
+    "Verifier",
 )
+
+# actions pull in git, requests and friends, they are only imported once used
+_modules = {
+    "ApiCaller": "api_caller",
+    "Builder": "builder",
+    "DiscordChangelogPoster": "discord_changelog_poster",
+    "Dockerizer": "dockerizer",
+    "Gitter": "gitter",
+    "GoodFiles": "good_files",
+    "Licenser": "licenser",
+    "tag_as_stable": "stable_tagger",
+    "Uploader": "uploader",
+    "Verifier": "verifier",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if (module := _modules.get(name)) is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    return getattr(importlib.import_module(f".{module}", __name__), name)
@@ -3,6 +3,7 @@ from logging import getLogger
 import requests
 
 from usautobuild.config import Config
+from usautobuild.tracing import traced
 
 log = getLogger("usautobuild")
 
@@ -14,6 +15,7 @@ class ApiCaller:
         self.build_number = config.build_number
         self.dry_run = config.dry_run
 
+    @traced()
     def post_new_version(self) -> None:
         if self.dry_run:
             log.info("Dry run, skipping Changelog API call")
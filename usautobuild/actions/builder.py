@@ -5,44 +5,42 @@ import time
 
 from logging import getLogger
 from pathlib import Path
+from typing import ClassVar, Optional
 
 import humanize
 
+from git import Repo
+
+from usautobuild import events
+from usautobuild.checkpoint import RunState
 from usautobuild.config import Config
+from usautobuild.distributed import CommandTransport, Coordinator, TargetJob, make_transport
 from usautobuild.exceptions import (
     BuildFailedError,
     InvalidProjectPathError,
-    MissingLicenseFileError
+    MissingLicenseFileError,
+    ProcessTimeoutError,
 )
+from usautobuild.platforms import exec_name, platform_image, platform_subtarget
+from usautobuild.tracing import traced
+from usautobuild.unity_log import BuildLogMetrics, LogTailer
 from usautobuild.utils import git_version, run_process_shell
-
-exec_name = {
-    "linuxserver": "Unitystation",
-    "StandaloneLinux64": "Unitystation",
-    "StandaloneWindows64": "Unitystation.exe",
-    "StandaloneOSX": "Unitystation.app",
-}
-
-platform_image = {
-    "linuxserver": "-linux-il2cpp-3.2.0",
-    "StandaloneLinux64": "-base-3.2.0",
-    "StandaloneWindows64": "-windows-mono-3.2.0",
-    "StandaloneOSX": "-mac-mono-3.2.0",
-}
-
-platform_subtarget = {
-    "linuxserver": "Server",
-    "StandaloneLinux64": "Player",
-    "StandaloneWindows64": "Player",
-    "StandaloneOSX": "Player",
-}
+from usautobuild.watchdog import Watchdog
 
 log = getLogger("usautobuild")
 
 
 class Builder:
-    def __init__(self, config: Config):
+    # monotonic time of last pull of every image by this process
+    _pulled_images: ClassVar[dict[str, float]] = {}
+
+    def __init__(self, config: Config, run_state: Optional[RunState] = None):
         self.config = config
+        self.run_state = run_state
+        # phase timings and build report parsed from editor logs of last build of every target
+        self.log_metrics: dict[str, BuildLogMetrics] = {}
+        # targets whose build failed without aborting the run
+        self.failed_targets: list[str] = []
 
     def check_license(self) -> None:
         log.debug("Checking license file...")
@@ -50,13 +48,37 @@ class Builder:
             log.error("Missing license file at given directory: %s", self.config.license_file)
             raise MissingLicenseFileError(self.config.license_file)
 
-    def clean_builds_folder(self) -> None:
+    def clean_builds_folder(self, targets: Optional[list[str]] = None) -> None:
+        """Wipe output folder, only given targets are removed if passed"""
+
         path = self.config.output_dir
-        if path.is_dir():
+        if not path.is_dir():
+            return
+
+        if targets is None:
             log.debug("Found output folder, cleaning up!")
             shutil.rmtree(path)
             path.mkdir()
 
+            return
+
+        for target in targets:
+            if (path / target).is_dir():
+                log.debug("Cleaning up %s output", target)
+                shutil.rmtree(path / target)
+
+    def pending_targets(self) -> list[str]:
+        """Targets without valid build from interrupted run"""
+
+        if (run_state := self.run_state) is None:
+            return list(self.config.target_platforms)
+
+        return [
+            target
+            for target in self.config.target_platforms
+            if not run_state.is_complete(f"build/{target}", run_state.fingerprint(target=target))
+        ]
+
     def create_builds_folders(self) -> None:
         for target in self.config.target_platforms:
             try:
@@ -123,23 +145,36 @@ class Builder:
         with prefab_file.open("w", encoding="UTF-8") as f:
             f.write(prefab)
 
-    def make_command(self, target: str) -> str:
+    def get_image(self, target: str) -> str:
         base_image = "unityci/editor"
         platform_prefix = "ubuntu-" if target == "linuxserver" else ""
-        image = f"{base_image}:{platform_prefix}{self.config.unity_version}{platform_image[target]}"
 
+        return f"{base_image}:{platform_prefix}{self.config.unity_version}{platform_image[target]}"
+
+    def make_pull_command(self, target: str) -> str:
+        # pull separately because docker run does not have -q alternative
+        return f"docker pull {self.get_image(target)}"
+
+    def make_command(self, target: str) -> str:
         return (
-            # pull first because docker run does not have -q alternative
-            f"docker pull -q {image} && "
             f"docker run --rm "
+            f"--cidfile {self.cidfile_path(target)} "
             f"{self.generate_mounts()} "
-            f"{image} "
+            f"{self.get_image(target)} "
             f"unity-editor "
             f"{self.generate_build_args(target)} "
             f"-logfile /root/logs/{target}.txt "
             f"-quit"
         )
 
+    @staticmethod
+    def cidfile_path(target: str) -> Path:
+        return Path.cwd() / "logs" / f"{target}.cid"
+
+    @staticmethod
+    def logfile_path(target: str) -> Path:
+        return Path.cwd() / "logs" / f"{target}.txt"
+
     def generate_mounts(self) -> str:
         cwd = Path.cwd()
 
@@ -175,34 +210,188 @@ class Builder:
 
         return ""
 
-    def build(self, target: str) -> None:
-        command = self.make_command(target)
+    @traced()
+    def pull_image(self, target: str) -> None:
+        image = self.get_image(target)
+        pulled = self._pulled_images.get(image)
+        if pulled is not None and time.monotonic() - pulled < self.config.pull_interval:
+            log.debug("Image %s was pulled recently, not pulling again", image)
+            events.emit("cache", target=target, cache="docker_pull", hits=1, lookups=1)
+            return
+
+        command = self.make_pull_command(target)
         log.debug("Running command\n%s\n", command)
 
-        if run_process_shell(command):
+        # output is kept to find out if image was already present
+        pull_log = Path.cwd() / "logs" / f"pull-{target}.txt"
+        pull_log.unlink(missing_ok=True)
+
+        if run_process_shell(
+            command,
+            tee=pull_log,
+            label=f"pull {target}",
+            watchdog=Watchdog(timeout=self.config.pull_timeout),
+            env=self.config.environ,
+        ):
             raise BuildFailedError(target)
 
+        self._pulled_images[image] = time.monotonic()
+
+        up_to_date = "Image is up to date" in pull_log.read_text(errors="replace")
+        events.emit("cache", target=target, cache="docker_pull", hits=int(up_to_date), lookups=1)
+
+    @traced()
+    def build(self, target: str) -> None:
+        self.pull_image(target)
+
+        command = self.make_command(target)
+
+        for attempt in range(self.config.build_retries + 1):
+            if attempt:
+                log.warning("Retrying %s build, attempt %s of %s", target, attempt + 1, self.config.build_retries + 1)
+
+            log.debug("Running command\n%s\n", command)
+
+            # docker refuses to start if cidfile is left from previous run
+            cidfile = self.cidfile_path(target)
+            cidfile.unlink(missing_ok=True)
+            # otherwise tailer would parse log of the previous build before editor truncates it
+            logfile = self.logfile_path(target)
+            logfile.unlink(missing_ok=True)
+
+            watchdog = Watchdog(
+                timeout=self.config.build_timeout,
+                inactivity_timeout=self.config.build_inactivity_timeout,
+                watch_files=[logfile],
+            )
+
+            tailer = LogTailer(logfile).start()
+            try:
+                status = run_process_shell(
+                    command,
+                    label=f"build {target}",
+                    cidfile=cidfile,
+                    watchdog=watchdog,
+                    env=self.config.environ,
+                )
+            except ProcessTimeoutError as e:
+                log.error("%s build is stuck: %s", target, e)
+                self.remove_container(cidfile)
+
+                continue
+            finally:
+                self.log_metrics[target] = tailer.stop()
+                log.info("%s phases: %s", target, self.log_metrics[target].summary())
+                events.emit("build_phases", target=target, attempt=attempt, **self.log_metrics[target].as_dict())
+
+            if status:
+                raise BuildFailedError(target)
+
+            return
+
+        raise BuildFailedError(target)
+
+    def remove_container(self, cidfile: Path) -> None:
+        """Make sure container is gone, killing docker client does not stop the container itself"""
+
+        try:
+            container_id = cidfile.read_text().strip()
+        except FileNotFoundError:
+            log.debug("No container id found in %s, nothing to remove", cidfile)
+            return
+
+        if run_process_shell(
+            f"docker rm -f {container_id}", stderr_on_failure=True, label="docker rm", env=self.config.environ
+        ):
+            log.error("Failed to remove container %s", container_id)
+
+    @traced()
     def start_building(self) -> None:
+        targets = self.pending_targets()
+        if skipped := [target for target in self.config.target_platforms if target not in targets]:
+            log.info("Reusing builds of %s", ", ".join(skipped))
+        if not targets:
+            return
+
         log.info("Building version: %s", git_version(directory=self.config.project_path, brief=False))
         start = time.time()
 
-        self.check_license()
-        self.clean_builds_folder()
+        # workers check their own licenses
+        if not self.config.build_workers:
+            self.check_license()
+        # builds of other targets are still valid and should survive
+        self.clean_builds_folder(targets if skipped else None)
         self.create_builds_folders()
+
+        if self.config.build_workers:
+            self.build_on_workers(targets)
+        else:
+            self.prepare_project()
+            self.build_locally(targets)
+
+        log.info("Finished building in %s", humanize.naturaldelta(time.time() - start))
+
+    def prepare_project(self) -> None:
         self.set_jsons_data()
         self.set_addressables_mode()
 
-        for target in self.config.target_platforms:
+    def target_built(self, target: str) -> None:
+        if (run_state := self.run_state) is not None:
+            run_state.complete(
+                f"build/{target}",
+                run_state.fingerprint(target=target),
+                [self.config.output_dir / target],
+            )
+
+    def build_locally(self, targets: list[str]) -> None:
+        for target in targets:
             log.debug("Building %s", target)
 
             start_target = time.time()
             try:
-                self.build(target)
+                with events.stage("build", target=target):
+                    self.build(target)
+
+                self.target_built(target)
             except Exception as e:
                 if self.config.abort_on_build_fail:
                     log.error("Abort: %s", e)
                     raise
+
+                self.failed_targets.append(target)
             finally:
                 log.info("%s duration: %s", target, humanize.naturaldelta(time.time() - start_target))
 
-        log.info("Finished building in %s", humanize.naturaldelta(time.time() - start))
+    def build_on_workers(self, targets: list[str]) -> None:
+        """Build targets in parallel on workers from config, each worker builds one target at a time"""
+
+        commit = Repo(self.config.project_path, search_parent_directories=True).head.commit.hexsha
+        jobs = [
+            TargetJob(target, commit, self.config.build_number, self.config.git_branch, self.config.github_pr_number)
+            for target in targets
+        ]
+        logs_dir = Path.cwd() / "logs"
+
+        def run(transport: CommandTransport, job: TargetJob) -> None:
+            log.debug("Building %s on %s", job.target, transport.name)
+
+            start_target = time.time()
+            try:
+                with events.stage("build", target=job.target, worker=transport.name):
+                    metadata = transport.run(job, self.config.output_dir, logs_dir)
+            finally:
+                log.info("%s duration: %s", job.target, humanize.naturaldelta(time.time() - start_target))
+
+            events.emit("build_phases", target=job.target, worker=transport.name, **metadata)
+            self.target_built(job.target)
+
+        transports = [make_transport(spec) for spec in self.config.build_workers]
+        coordinator = Coordinator(transports, stop_on_failure=self.config.abort_on_build_fail)
+
+        failures = coordinator.build(jobs, run)
+        if failures and self.config.abort_on_build_fail:
+            error = next(iter(failures.values()))
+            log.error("Abort: %s", error)
+            raise error
+
+        self.failed_targets.extend(failures)
@@ -6,6 +6,7 @@ from typing import DefaultDict
 import requests
 
 from usautobuild.config import Config
+from usautobuild.tracing import traced
 
 log = getLogger("usautobuild")
 
@@ -75,6 +76,7 @@ class DiscordChangelogPoster:
         self.changelog_webhook = config.changelog_webhook
         self.newest_build_url = config.newest_build_api_url
 
+    @traced()
     def post_changelog(self, message: str) -> None:
         message_chunks = [message[i : i + 2000] for i in range(0, len(message), 2000)]
 
@@ -94,6 +96,7 @@ class DiscordChangelogPoster:
                 log.error(response.json())
                 raise
 
+    @traced()
     def fetch_newest_build(self) -> NewestBuildModel:
         resp = requests.get(self.newest_build_url, timeout=30)
         try:
@@ -120,6 +123,7 @@ class DiscordChangelogPoster:
             ],
         )
 
+    @traced()
     def start_posting(self) -> None:
         log.info("Starting changelog posting")
         newest_build = self.fetch_newest_build()
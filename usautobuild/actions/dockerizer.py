@@ -1,17 +1,38 @@
+import re
 import shutil
 
 from logging import getLogger
 from pathlib import Path
+from typing import Optional
 
+from usautobuild import events
+from usautobuild.checkpoint import RunState
 from usautobuild.config import Config
+from usautobuild.tracing import traced
 from usautobuild.utils import run_process_shell
 
 log = getLogger("usautobuild")
 
+# buildkit: "#5 [2/4] RUN ..." and "#5 CACHED", legacy builder: "Step 2/4 : RUN ..." and " ---> Using cache"
+_BUILDKIT_STEP = re.compile(r"^#(\d+) \[.*\d+/\d+\]", re.MULTILINE)
+_BUILDKIT_CACHED = re.compile(r"^#(\d+) CACHED", re.MULTILINE)
+_LEGACY_STEP = re.compile(r"^Step \d+/\d+ :", re.MULTILINE)
+_LEGACY_CACHED = re.compile(r"^ ---> Using cache", re.MULTILINE)
+
+
+def count_layer_cache(output: str) -> tuple[int, int]:
+    """Count cached and total steps in docker build output"""
+
+    if steps := set(_BUILDKIT_STEP.findall(output)):
+        return len(steps & set(_BUILDKIT_CACHED.findall(output))), len(steps)
+
+    return len(_LEGACY_CACHED.findall(output)), len(_LEGACY_STEP.findall(output))
+
 
 class Dockerizer:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, run_state: Optional[RunState] = None):
         self.config = config
+        self.run_state = run_state
 
     def copy_dockerfile(self) -> None:
         log.debug("Preparing Docker folder")
@@ -31,16 +52,49 @@ class Dockerizer:
 
         shutil.copytree(self.config.output_dir / "linuxserver", path)
 
+    @traced()
     def make_images(self) -> None:
         log.debug("Creating images...")
 
+        # output is kept to count layer cache hits
+        build_log = Path.cwd() / "logs" / "docker-build.txt"
+        build_log.unlink(missing_ok=True)
+
         if status := run_process_shell(
             f"docker build "
+            f"--progress plain "
             f"-t unitystation/unitystation:{self.config.build_number} "
-            f"-t unitystation/unitystation:{self.config.git_branch} Docker"
+            f"-t unitystation/unitystation:{self.config.git_branch} Docker",
+            tee=build_log,
+            label="docker build",
+            env=self.config.environ,
         ):
             raise Exception(f"Build failed: {status}")
 
+        hits, steps = count_layer_cache(build_log.read_text(errors="replace"))
+        events.emit("cache", cache="docker_layers", hits=hits, lookups=steps)
+
+    def image_size(self, image: str) -> Optional[int]:
+        """Uncompressed size of local image, compressed layers actually pushed are smaller and partly cached"""
+
+        output = Path.cwd() / "logs" / "docker-inspect.txt"
+        output.unlink(missing_ok=True)
+
+        if run_process_shell(
+            f"docker image inspect --format '{{{{.Size}}}}' {image}",
+            stderr_on_failure=True,
+            tee=output,
+            label="docker image inspect",
+            env=self.config.environ,
+        ):
+            return None
+
+        try:
+            return int(output.read_text())
+        except ValueError:
+            return None
+
+    @traced()
     def push_images(self) -> None:
         log.debug("Pushing images...")
 
@@ -48,21 +102,45 @@ class Dockerizer:
             'echo "$DOCKER_PASSWORD" | docker login --username "$DOCKER_USERNAME" --password-stdin',
             # complains about storing credentials in filesystem
             stderr_on_failure=True,
+            label="docker login",
+            env=self.config.environ,
         ):
             raise Exception(f"Docker login failed: {status}")
 
-        if status := run_process_shell(f"docker push unitystation/unitystation:{self.config.build_number}"):
+        if status := run_process_shell(
+            f"docker push unitystation/unitystation:{self.config.build_number}",
+            label="docker push build",
+            env=self.config.environ,
+        ):
             raise Exception(f"Docker push build failed: {status}")
-        if status := run_process_shell(f"docker push unitystation/unitystation:{self.config.git_branch}"):
+        if status := run_process_shell(
+            f"docker push unitystation/unitystation:{self.config.git_branch}",
+            label="docker push branch",
+            env=self.config.environ,
+        ):
             raise Exception(f"Docker push branch failed: {status}")
 
+        # both tags point to the same image
+        if (size := self.image_size(f"unitystation/unitystation:{self.config.build_number}")) is not None:
+            events.emit("docker_image", tag=self.config.build_number, bytes=size)
+
+    @traced()
     def start_dockering(self) -> None:
         if self.config.dry_run:
             log.info("Dry run, skipping dockerization")
             return
+
+        server_build = self.config.output_dir / "linuxserver"
+        if (run_state := self.run_state) is not None and run_state.is_complete("dockering", run_state.fingerprint()):
+            log.info("Images were already pushed, skipping dockerization")
+            return
+
         log.debug("Starting docker process")
         self.copy_dockerfile()
         self.copy_server_build()
         self.make_images()
         self.push_images()
+
+        if run_state is not None:
+            run_state.complete("dockering", run_state.fingerprint(), [server_build])
         log.info("Process finished, a new staging build has been deployed and should shortly be present on the server.")
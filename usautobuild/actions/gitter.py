@@ -1,11 +1,12 @@
 from logging import getLogger
 from pathlib import Path
-from typing import Any
+from typing import Any, ClassVar
 
 from git import RemoteProgress, Repo
 
 from usautobuild.config import Config
 from usautobuild.exceptions import NoChangesError
+from usautobuild.tracing import traced
 
 log = getLogger("usautobuild")
 
@@ -17,19 +18,28 @@ class CloneProgress(RemoteProgress):
 
 
 class Gitter:
+    # repos opened by earlier runs of the same process
+    _repos: ClassVar[dict[Path, Repo]] = {}
+
     def __init__(self, config: Config):
         self.config = config
 
-    def prepare_git_directory(self) -> None:
+    def prepare_git_directory(self, update: bool = True) -> None:
         log.debug("Preparing git directory...")
         self.local_repo_dir = Path.cwd() / "local_repo"
 
         if not self.local_repo_dir.is_dir():
             self.local_repo_dir.mkdir()
-            self.local_repo = self.clone_repo(self.local_repo_dir)
+            self.local_repo = self._repos[self.local_repo_dir] = self.clone_repo(self.local_repo_dir)
         else:
-            self.local_repo = Repo(self.local_repo_dir)
-            self.update_repo()
+            if (repo := self._repos.get(self.local_repo_dir)) is None:
+                repo = self._repos[self.local_repo_dir] = Repo(self.local_repo_dir)
+
+            self.local_repo = repo
+            if update:
+                self.update_repo()
+            else:
+                log.debug("Keeping repo at %s", self.head_commit)
 
     def clone_repo(self, local_dir: Path) -> Repo:
         log.debug("Clonning repository...")
@@ -54,10 +64,19 @@ class Gitter:
             log.error("Couldn't find changes after updating repo. Aborting build!")
             raise NoChangesError(self.config.git_branch)
 
-    def start_gitting(self) -> None:
-        self.prepare_git_directory()
-        self.config.project_path = self.local_repo_dir / "UnityProject"
+    def checkout(self, commit: str) -> None:
+        log.debug("Checking out %s", commit)
+        self.local_repo.git.reset("--hard", commit)
+
+    @property
+    def head_commit(self) -> str:
+        return self.local_repo.head.commit.hexsha
+
+    @traced()
+    def start_gitting(self, update: bool = True) -> None:
+        self.prepare_git_directory(update)
 
+    @traced()
     def get_Good_file_tag(self) -> str:
         log.debug("Searching for the latest 'good-file-*' tag...")
 
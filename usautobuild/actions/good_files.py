@@ -11,19 +11,21 @@ from usautobuild.exceptions import (
     InvalidProjectPathError,
     MissingLicenseFileError,
 )
+from usautobuild.tracing import traced
 
 log = getLogger("usautobuild")
 
 class GoodFiles:
-    def __init__(self, config):
+    def __init__(self, config: Config) -> None:
         self.config = config
         self.files_to_keep_in_managed = self.get_files_to_keep_in_managed()
 
-    def get_files_to_keep_in_managed(self):
+    def get_files_to_keep_in_managed(self) -> list[str]:
         path = Path.cwd() / "local_repo/Tools/CodeScanning/CodeScan/CodeScan/bin/Debug/net7.0/FilesToMoveToManaged.json"
         with path.open('r') as file:
             return json.load(file)
 
+    @traced()
     def make_good_files_build(self) -> None:
         good_files_dir = Path(self.config.output_dir) / "good_files"
         good_files_dir.mkdir(parents=True, exist_ok=True)
@@ -8,15 +8,16 @@ log = getLogger("usautobuild")
 def tag_as_stable() -> None:
     log.info("Pushing a stable build from the latest build!")
 
-    if status := run_process_shell("docker build -t unitystation/unitystation:stable Docker"):
+    if status := run_process_shell("docker build -t unitystation/unitystation:stable Docker", label="docker build"):
         raise Exception(f"Build failed: {status}")
 
     if status := run_process_shell(
         'echo "$DOCKER_PASSWORD" | docker login --username "$DOCKER_USERNAME" --password-stdin',
         # complains about storing credentials in filesystem
         stderr_on_failure=True,
+        label="docker login",
     ):
         raise Exception(f"Docker login failed: {status}")
 
-    if status := run_process_shell("docker push unitystation/unitystation:stable"):
+    if status := run_process_shell("docker push unitystation/unitystation:stable", label="docker push stable"):
         raise Exception(f"Push failed: {status}")
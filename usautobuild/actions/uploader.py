@@ -1,10 +1,21 @@
+from collections.abc import Collection, Iterable
+from concurrent.futures import ThreadPoolExecutor
 from ftplib import FTP, all_errors, error_perm
 from logging import getLogger
 from shutil import make_archive as zip_folder
+from typing import Any, Optional
 
+from usautobuild import events
+from usautobuild.cdn import FTPSessionManager, TransferProgress, store_file
+from usautobuild.checkpoint import RunState, output_digest
 from usautobuild.config import Config
+from usautobuild.exceptions import BuildVerificationError, UploadVerificationError
+from usautobuild.integrity import Manifest, StreamDigest, hash_file, manifest_path, sidecar_line, verify_archive
+from usautobuild.tracing import traced
 from pathlib import Path 
+import io
 import os
+import time
 import zipfile
 import json
 
@@ -14,25 +25,50 @@ log = getLogger("usautobuild")
 class Uploader:
     MAX_UPLOAD_ATTEMPTS = 10
 
-    def __init__(self, config: Config):
+    def __init__(
+        self, config: Config, run_state: Optional[RunState] = None, sessions: Optional[FTPSessionManager] = None
+    ):
         self.config = config
+        self.run_state = run_state
+        # connections are shared with the rest of the pipeline if given
+        self.sessions = FTPSessionManager.from_config(config) if sessions is None else sessions
+        # sha256 of archives by path, size and modification time, retries do not read them again
+        self._digests: dict[tuple[Path, int, int], str] = {}
+
+    def archive_path(self, target: str) -> Path:
+        return (self.config.output_dir / target).with_suffix(".zip")
+
+    def is_complete(self, step: str, target: str, **inputs: Any) -> bool:
+        """Whether step was done for target by interrupted run and its archive did not change since"""
+
+        if (run_state := self.run_state) is None:
+            return False
+
+        return run_state.is_complete(f"{step}/{target}", run_state.fingerprint(target=target, **inputs))
+
+    def mark_complete(self, step: str, target: str, **inputs: Any) -> None:
+        if (run_state := self.run_state) is not None:
+            run_state.complete(
+                f"{step}/{target}", run_state.fingerprint(target=target, **inputs), [self.archive_path(target)]
+            )
+
+    @traced()
+    def upload_to_cdn(self, targets: Optional[Iterable[str]] = None) -> None:
+        """Upload archives of targets, all of config by default"""
+
+        requested = list(self.config.target_platforms if targets is None else targets)
+        targets = [target for target in requested if not self.is_complete("upload", target)]
+        if skipped := [target for target in requested if target not in targets]:
+            log.info("Skipping already uploaded %s", ", ".join(skipped))
+        if not targets:
+            return
 
-    def upload_to_cdn(self) -> None:
         # TODO: consider SFTP
-        ftp = FTP()  # noqa: S321
-
         try:
-            log.debug("Trying to connect to CDN...")
-
-            ftp.connect(self.config.cdn_host, 21, timeout=60)
-            ftp.login(self.config.cdn_user, self.config.cdn_password)
-            log.debug("CDN says: %s", ftp.getwelcome())
-
-            # ftp.rmd(f"/unitystation/{self.forkname}")
-            # ftp.mkd(f"/unitystation/{self.forkname}")
-
-            for target in self.config.target_platforms:
-                self.attempt_ftp_upload(ftp, target)
+            # targets are uploaded concurrently when there are several connections
+            with ThreadPoolExecutor(min(self.sessions.size, len(targets)), thread_name_prefix="upload") as pool:
+                for _ in pool.map(self.upload_target, targets):
+                    pass
 
         except all_errors as e:
             log.error(str(e))
@@ -42,76 +78,188 @@ class Uploader:
             log.error(str(e))
             raise e
 
-        ftp.close()
+    def upload_target(self, target: str) -> None:
+        with self.sessions.connection() as ftp:
+            self.attempt_ftp_upload(ftp, target)
 
+    @traced()
     def attempt_ftp_upload(self, ftp: FTP, target: str, attempt: int = 0) -> None:
-        try:
-            ftp.mkd(f"/unitystation/{self.config.forkname}/{target}/")
-        except error_perm:
-            log.debug("Folder for %s already exists!", self.config.forkname)
-        except Exception as e:
-            raise e
-
         upload_path = f"/unitystation/{self.config.forkname}/{target}/{self.config.build_number}.zip"
-        local_file = (self.config.output_dir / target).with_suffix(".zip")
+        local_file = self.archive_path(target)
         try:
-            with local_file.open("rb") as zip_file:
-                log.debug("Uploading %s...", target)
-                ftp.storbinary(f"STOR {upload_path}", zip_file)
+            self.sessions.index.make_dir(ftp, f"/unitystation/{self.config.forkname}/{target}")
+
+            if self.is_uploaded(ftp, local_file, upload_path):
+                log.info("%s is already on CDN", upload_path)
+                self.mark_complete("upload", target)
+                return
+
+            log.debug("Uploading %s...", target)
+            start = time.monotonic()
+            digest = self.store_verified(ftp, local_file, upload_path)
+            events.emit(
+                "upload",
+                target=target,
+                duration=time.monotonic() - start,
+                bytes=digest.size,
+                remote_path=upload_path,
+                connection=self.sessions.connection_id(ftp),
+                attempt=attempt,
+                sha256=digest.hexdigest,
+            )
+            self.mark_complete("upload", target)
+        except UploadVerificationError as e:
+            if attempt >= self.MAX_UPLOAD_ATTEMPTS:
+                raise
+
+            log.warning("%s, retrying...", e)
+            self.attempt_ftp_upload(ftp, target, attempt=attempt + 1)
         except all_errors as e:
             if "timed out" in str(e):
                 if attempt >= self.MAX_UPLOAD_ATTEMPTS:
                     raise
 
                 log.debug("FTP connection timed out, retrying...")
-                self.attempt_ftp_upload(ftp, target, attempt=attempt + 1)
+                self.attempt_ftp_upload(self.sessions.reconnect(ftp), target, attempt=attempt + 1)
             else:
                 log.error("Error trying to upload %s", local_file)
                 log.error(str(e))
+                # connection could be left in the middle of transfer, next holder gets a fresh one
+                self.sessions.discard(ftp)
+
+    @staticmethod
+    def _digest_key(local_file: Path) -> tuple[Path, int, int]:
+        stat = local_file.stat()
+
+        return local_file, stat.st_size, stat.st_mtime_ns
+
+    def archive_sha256(self, local_file: Path) -> str:
+        """Hash of local file, computed once unless file changes"""
+
+        key = self._digest_key(local_file)
+        if (sha256 := self._digests.get(key)) is None:
+            sha256 = self._digests[key] = hash_file(local_file).sha256
+
+        return sha256
+
+    def is_uploaded(self, ftp: FTP, local_file: Path, remote_path: str) -> bool:
+        """Whether remote file has the size of local one and its sidecar matches local hash"""
+
+        index = self.sessions.index
+        if index.file_size(ftp, remote_path) != local_file.stat().st_size:
+            return False
+        # sidecar is only written after complete upload
+        if not index.exists(ftp, f"{remote_path}.sha256"):
+            return False
+
+        sidecar = io.BytesIO()
+        ftp.retrbinary(f"RETR {remote_path}.sha256", sidecar.write)
+
+        return sidecar.getvalue() == sidecar_line(self.archive_sha256(local_file), remote_path.rsplit("/", 1)[-1])
+
+    def store_verified(self, ftp: FTP, local_file: Path, remote_path: str) -> StreamDigest:
+        """
+        Upload file hashing the blocks as they are sent, then check remote size and publish .sha256 sidecar.
+
+        Sidecar is only written once remote file is known to be complete.
+        """
+
+        digest = StreamDigest()
+        progress = TransferProgress(
+            remote_path,
+            local_file.stat().st_size,
+            self.sessions.connection_id(ftp),
+            self.config.upload_progress_interval,
+        )
+
+        def sent(block: memoryview) -> None:
+            digest.update(block)
+            progress.update(len(block))
+
+        store_file(ftp, remote_path, local_file, sent)
+        self._digests[self._digest_key(local_file)] = digest.hexdigest
+
+        try:
+            remote_size = ftp.size(remote_path)
+        except error_perm as e:
+            log.warning("Could not verify size of uploaded %s: %s", remote_path, e)
+        else:
+            if remote_size != digest.size:
+                raise UploadVerificationError(remote_path, digest.size, -1 if remote_size is None else remote_size)
+
+        sidecar = sidecar_line(digest.hexdigest, remote_path.rsplit("/", 1)[-1])
+        ftp.storbinary(f"STOR {remote_path}.sha256", io.BytesIO(sidecar))
+        log.debug("%s sha256 is %s", remote_path, digest.hexdigest)
 
+        self.sessions.index.add_file(remote_path, digest.size)
+        self.sessions.index.add_file(f"{remote_path}.sha256", len(sidecar))
+
+        return digest
+
+    @traced()
     def zip_build_folder(self, target: str) -> None:
         build_folder = self.config.output_dir / target
-        zip_folder(str(build_folder), "zip", build_folder)
+        # archive of previous build is useless if target was rebuilt since
+        build_digest = output_digest(build_folder)
+
+        if self.is_complete("archive", target, build=build_digest):
+            log.debug("Reusing %s archive", target)
+            return
+
+        start = time.monotonic()
+        archive = zip_folder(str(build_folder), "zip", build_folder)
+        events.emit("archive", target=target, duration=time.monotonic() - start, bytes=Path(archive).stat().st_size)
+        self.verify_archive(target)
+        self.mark_complete("archive", target, build=build_digest)
+
+    @traced()
+    def verify_archive(self, target: str) -> None:
+        """Check archive matches manifest written by verification stage and is not corrupt"""
+
+        if (manifest := Manifest.load(manifest_path(self.config.output_dir, target))) is None:
+            log.warning("No manifest of %s found, archive is not verified", target)
+            return
+
+        if problems := verify_archive(self.archive_path(target), manifest, self.config.hash_workers):
+            raise BuildVerificationError(f"{target} archive", problems)
+
+    @traced()
+    def start_upload(self, broken: Collection[str] = ()) -> None:
+        """Archive and upload targets of config except broken ones"""
 
-    def start_upload(self) -> None:
         if self.config.dry_run:
             log.info("Dry run, skipping upload")
             return
         log.debug("Starting upload to cdn process...")
 
-        for target in self.config.target_platforms:
+        targets = [target for target in self.config.target_platforms if target not in broken]
+        if skipped := [target for target in self.config.target_platforms if target in broken]:
+            log.warning("Not uploading broken %s", ", ".join(skipped))
+
+        for target in targets:
             self.zip_build_folder(target)
 
-        self.upload_to_cdn()
+        self.upload_to_cdn(targets)
 
 
+    @traced()
     def check_good_file_version_folder_exists(self, version_number: str) -> bool:
-
-        ftp = FTP()  # noqa: S321
-        ftp.connect(self.config.cdn_host, 21, timeout=60)
-        ftp.login(self.config.cdn_user, self.config.cdn_password)
-     
         folder_path = f"/unitystation/GoodFiles/{version_number}"
-        try:
-            log.debug("Checking if folder %s exists...", folder_path)
-            current_dir = ftp.pwd()  # Save the current directory
-            ftp.cwd(folder_path)     # Try changing to the target directory
-            ftp.cwd(current_dir)     # Change back to the original directory
-            ftp.close()
-            return True
-        except error_perm as e:
-            if "550" in str(e):  # 550 error indicates folder not found
+
+        with self.sessions.connection() as ftp:
+            try:
+                log.debug("Checking if folder %s exists...", folder_path)
+                if self.sessions.index.is_dir(ftp, folder_path):
+                    return True
+
                 log.debug("Folder %s does not exist.", folder_path)
                 return False
-            ftp.close()
-            raise e  # Re-raise other errors
-        except all_errors as e:
-            log.error("Error occurred while checking folder existence: %s", str(e))
-            ftp.close()
-            raise e
-        ftp.close()
+            except all_errors as e:
+                log.error("Error occurred while checking folder existence: %s", str(e))
+                raise e
 
 
+    @traced()
     def Zip_And_Upload_Good_files(self, version_number: str) -> None:
         """
         Zips and uploads individual target directories to the specified CDN path with filenames including the version.
@@ -120,71 +268,65 @@ class Uploader:
             log.info("Dry run enabled; skipping zip and upload of GoodFiles.")
             return
         
-        ftp = FTP()  # noqa: S321
-        try:
-            log.debug("Connecting to CDN...")
-            ftp.connect(self.config.cdn_host, 21, timeout=60)
-            ftp.login(self.config.cdn_user, self.config.cdn_password)
-            
-            good_files_dir = Path(self.config.output_dir) / "good_files"
-            for target in self.config.target_platforms:
-                # Skip targets as needed
-                if target == "linuxserver":
-                    log.info("Skipping target: %s", target)
-                    continue
+        with self.sessions.connection() as ftp:
+            try:
+                good_files_dir = Path(self.config.output_dir) / "good_files"
+                for target in self.config.target_platforms:
+                    # Skip targets as needed
+                    if target == "linuxserver":
+                        log.info("Skipping target: %s", target)
+                        continue
                 
-                # Prepare and zip the target directory
-                target_path = good_files_dir / target
-                zip_file_path = self.zip_directory(target_path, target, version_number)
+                    # Prepare and zip the target directory
+                    target_path = good_files_dir / target
+                    zip_file_path = self.zip_directory(target_path, target, version_number)
                 
-                # Determine the remote file path based on the target
-                target_suffix = {
-                    "StandaloneWindows64": "Windows",
-                    "StandaloneLinux64": "Linux",
-                    "StandaloneOSX": "Mac",
-                }.get(target, target)  # Default to target if unknown
+                    # Determine the remote file path based on the target
+                    target_suffix = {
+                        "StandaloneWindows64": "Windows",
+                        "StandaloneLinux64": "Linux",
+                        "StandaloneOSX": "Mac",
+                    }.get(target, target)  # Default to target if unknown
                 
-                remote_file_name = f"{version_number}_{target_suffix}.zip"
-                remote_path = f"/unitystation/GoodFiles/{version_number}/{remote_file_name}"
+                    remote_file_name = f"{version_number}_{target_suffix}.zip"
+                    remote_path = f"/unitystation/GoodFiles/{version_number}/{remote_file_name}"
                 
-                # Upload the zipped file
-                self.upload_file_to_ftp(ftp, zip_file_path, remote_path)
-                log.info("Uploaded %s to %s", zip_file_path, remote_path)
+                    # Upload the zipped file
+                    self.upload_file_to_ftp(ftp, zip_file_path, remote_path)
+                    log.info("Uploaded %s to %s", zip_file_path, remote_path)
 
-                    # Now update the AllowGoodFiles.json file with the new version number
-            allow_good_files_path = "/unitystation/GoodFiles/AllowGoodFiles.json"
+                        # Now update the AllowGoodFiles.json file with the new version number
+                allow_good_files_path = "/unitystation/GoodFiles/AllowGoodFiles.json"
             
-            # Read the existing AllowGoodFiles.json
-            try:
-                log.debug("Reading existing AllowGoodFiles.json...")
-                ftp.retrbinary(f"RETR {allow_good_files_path}", open("AllowGoodFiles.json", "wb").write)
-                with open("AllowGoodFiles.json", "r") as file:
-                    versions = json.load(file)
-            except Exception as e:
-                log.warning("Could not read AllowGoodFiles.json. Creating a new one.")
-                versions = []
-
-            # Append the new version number
-            if version_number not in versions:
-                versions.append(version_number)
-
-            # Write the updated versions list to the file
-            with open("AllowGoodFiles.json", "w") as file:
-                json.dump(versions, file)
-
-            # Upload the updated JSON file, overwriting the existing one
-            with open("AllowGoodFiles.json", "rb") as file:
-                log.debug("Uploading updated AllowGoodFiles.json...")
-                ftp.storbinary(f"STOR {allow_good_files_path}", file)
-                log.debug("AllowGoodFiles.json updated successfully.")
+                # Read the existing AllowGoodFiles.json
+                try:
+                    log.debug("Reading existing AllowGoodFiles.json...")
+                    ftp.retrbinary(f"RETR {allow_good_files_path}", open("AllowGoodFiles.json", "wb").write)
+                    with open("AllowGoodFiles.json", "r") as file:
+                        versions = json.load(file)
+                except Exception as e:
+                    log.warning("Could not read AllowGoodFiles.json. Creating a new one.")
+                    versions = []
+
+                # Append the new version number
+                if version_number not in versions:
+                    versions.append(version_number)
+
+                # Write the updated versions list to the file
+                with open("AllowGoodFiles.json", "w") as file:
+                    json.dump(versions, file)
+
+                # Upload the updated JSON file, overwriting the existing one
+                with open("AllowGoodFiles.json", "rb") as file:
+                    log.debug("Uploading updated AllowGoodFiles.json...")
+                    ftp.storbinary(f"STOR {allow_good_files_path}", file)
+                    log.debug("AllowGoodFiles.json updated successfully.")
             
-        except all_errors as e:
-            log.error("An FTP error occurred: %s", str(e))
-            raise e
-        finally:
-            ftp.close()
-            log.debug("Disconnected from CDN.")
+            except all_errors as e:
+                log.error("An FTP error occurred: %s", str(e))
+                raise e
 
+    @traced()
     def zip_directory(self, dir_path: Path, target: str, version_number: str) -> Path:
         # Determine the suffix for the target
         target_suffix = {
@@ -196,7 +338,8 @@ class Uploader:
         zip_file_name = f"{version_number}_{target_suffix}.zip"
         zip_file_path = dir_path.parent / zip_file_name
         log.debug("Zipping directory: %s to %s", dir_path, zip_file_path)
-        
+        start = time.monotonic()
+
         with zipfile.ZipFile(zip_file_path, "w", zipfile.ZIP_DEFLATED) as zipf:
             for root, _, files in os.walk(dir_path):
                 for file in files:
@@ -204,21 +347,38 @@ class Uploader:
                     arcname = file_path.relative_to(dir_path.parent)
                     zipf.write(file_path, arcname)
         log.debug("Zipping complete: %s", zip_file_path)
+        events.emit(
+            "archive",
+            target=target,
+            duration=time.monotonic() - start,
+            bytes=zip_file_path.stat().st_size,
+            good_files=version_number,
+        )
         return zip_file_path
 
+    @traced()
     def upload_file_to_ftp(self, ftp: FTP, local_file: Path, remote_path: str) -> None:
         try:
             # Ensure the target directory exists on the FTP server
             remote_dir = "/".join(remote_path.split("/")[:-1])
-            try:
-                ftp.mkd(remote_dir)
-            except error_perm:
-                log.debug("Directory already exists on CDN: %s", remote_dir)
-
-            with local_file.open("rb") as file:
-                log.debug("Uploading file %s to %s...", local_file, remote_path)
-                ftp.storbinary(f"STOR {remote_path}", file)
-                log.debug("Upload complete for %s", remote_path)
+            self.sessions.index.make_dir(ftp, remote_dir)
+
+            if self.is_uploaded(ftp, local_file, remote_path):
+                log.debug("%s is already on CDN", remote_path)
+                return
+
+            log.debug("Uploading file %s to %s...", local_file, remote_path)
+            start = time.monotonic()
+            digest = self.store_verified(ftp, local_file, remote_path)
+            events.emit(
+                "upload",
+                duration=time.monotonic() - start,
+                bytes=digest.size,
+                remote_path=remote_path,
+                connection=self.sessions.connection_id(ftp),
+                sha256=digest.hexdigest,
+            )
+            log.debug("Upload complete for %s", remote_path)
         except all_errors as e:
             log.error("Error uploading file %s: %s", local_file, str(e))
             raise e
@@ -0,0 +1,73 @@
+import time
+
+from collections.abc import Iterable
+from logging import getLogger
+from pathlib import Path
+from typing import Optional
+
+from usautobuild import events
+from usautobuild.config import Config
+from usautobuild.exceptions import BuildVerificationError
+from usautobuild.integrity import Manifest, build_manifest, check_layout, manifest_path
+from usautobuild.platforms import exec_name, platform_image
+from usautobuild.tracing import traced
+
+log = getLogger("usautobuild")
+
+# player data folder, relative to build folder
+data_dir = {
+    "linuxserver": Path("Unitystation_Data"),
+    "StandaloneLinux64": Path("Unitystation_Data"),
+    "StandaloneWindows64": Path("Unitystation_Data"),
+    "StandaloneOSX": Path("Unitystation.app") / "Contents" / "Resources" / "Data",
+}
+
+
+class Verifier:
+    """Checks build folders are complete and writes their manifests, archives are checked against them later"""
+
+    def __init__(self, config: Config):
+        self.config = config
+        # targets whose build folders are broken, they must not be archived or uploaded
+        self.failed_targets: list[str] = []
+
+    def required_paths(self, target: str) -> list[str]:
+        data = data_dir[target]
+        # il2cpp players have metadata of compiled code instead of managed assemblies
+        code = "il2cpp_data" if "il2cpp" in platform_image[target] else "Managed"
+
+        return [exec_name[target], data.as_posix(), (data / code).as_posix()]
+
+    @traced()
+    def verify_target(self, target: str) -> Manifest:
+        root = self.config.output_dir / target
+        manifest_file = manifest_path(self.config.output_dir, target)
+        # manifest of interrupted run would vouch for the new build if this one is broken
+        manifest_file.unlink(missing_ok=True)
+
+        if problems := check_layout(root, self.required_paths(target)):
+            raise BuildVerificationError(target, problems)
+
+        start = time.monotonic()
+        manifest = build_manifest(target, root, self.config.hash_workers)
+        manifest.write(manifest_file)
+
+        duration = time.monotonic() - start
+        events.emit("verify", target=target, duration=duration, bytes=manifest.size, files=len(manifest.files))
+        log.debug("Hashed %s files of %s in %.1fs", len(manifest.files), target, duration)
+
+        return manifest
+
+    @traced()
+    def start_verifying(self, targets: Optional[Iterable[str]] = None) -> None:
+        """Verify targets, all of config by default. Broken ones are only reported unless abort_on_build_fail"""
+
+        for target in self.config.target_platforms if targets is None else targets:
+            try:
+                self.verify_target(target)
+            except BuildVerificationError as e:
+                if self.config.abort_on_build_fail:
+                    raise
+
+                log.error("%s", e)
+                self.failed_targets.append(target)
@@ -0,0 +1,112 @@
+import collections
+import time
+
+from collections.abc import Callable
+from typing import Optional
+
+__all__ = ("MessageBatcher",)
+
+
+class MessageBatcher:
+    """
+    Packs stream of messages into as few chat messages as possible.
+
+    Messages of the same kind are joined with newlines until length limit, messages longer than limit are cut at line
+    boundaries where possible. Chunks are only collected in a list with running length so adding is linear. Batch is
+    sealed once it is full, kind changes or it becomes older than max_age, sealed batches wait in ready queue.
+    """
+
+    __slots__ = (
+        "limit",
+        "max_age",
+        "_clock",
+        "_chunks",
+        "_length",
+        "_kind",
+        "_started",
+        "_ready",
+    )
+
+    def __init__(self, limit: int, max_age: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.limit = limit
+        self.max_age = max_age
+
+        self._clock = clock
+        self._chunks: list[str] = []
+        # length of joined chunks including separators
+        self._length = 0
+        self._kind = False
+        self._started = 0.0
+        self._ready: collections.deque[tuple[str, bool]] = collections.deque()
+
+    def add(self, message: str, kind: bool = False) -> None:
+        if self._chunks and kind != self._kind:
+            self.seal()
+
+        for piece in self._split(message):
+            if self._chunks and self._length + 1 + len(piece) > self.limit:
+                self.seal()
+
+            if not self._chunks:
+                self._kind = kind
+                self._started = self._clock()
+                self._length = len(piece)
+            else:
+                self._length += 1 + len(piece)
+
+            self._chunks.append(piece)
+
+    def _split(self, message: str) -> list[str]:
+        if len(message) <= self.limit:
+            return [message]
+
+        pieces = []
+        start = 0
+        while len(message) - start > self.limit:
+            end = message.rfind("\n", start, start + self.limit + 1)
+            # no newline to cut at, hard cut
+            if end <= start:
+                pieces.append(message[start : start + self.limit])
+                start += self.limit
+            else:
+                pieces.append(message[start:end])
+                start = end + 1
+
+        pieces.append(message[start:])
+
+        return pieces
+
+    def seal(self) -> None:
+        """Move current batch to ready queue regardless of its size and age"""
+
+        if not self._chunks:
+            return
+
+        self._ready.append(("\n".join(self._chunks), self._kind))
+        self._chunks = []
+        self._length = 0
+
+    def seal_due(self) -> None:
+        if self._chunks and self._clock() - self._started >= self.max_age:
+            self.seal()
+
+    def time_until_due(self) -> Optional[float]:
+        """Seconds until current batch reaches max_age, None if there is nothing pending"""
+
+        if not self._chunks:
+            return None
+
+        return max(0.0, self._started + self.max_age - self._clock())
+
+    def pop_ready(self) -> Optional[tuple[str, bool]]:
+        if not self._ready:
+            return None
+
+        return self._ready.popleft()
+
+    @property
+    def has_ready(self) -> bool:
+        return bool(self._ready)
+
+    def __bool__(self) -> bool:
+        return bool(self._ready or self._chunks)
@@ -0,0 +1,484 @@
+from __future__ import annotations
+
+import contextlib
+import mmap
+import os
+import posixpath
+import queue
+import socket
+import ssl
+import threading
+import time
+
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from ftplib import FTP, all_errors, error_perm, error_temp
+from logging import getLogger
+from pathlib import Path
+from typing import Optional
+
+from .config import Config
+from .events import emit
+
+__all__ = (
+    "FTPSessionManager",
+    "RemoteIndex",
+    "TransferProgress",
+    "store_file",
+)
+
+log = getLogger("usautobuild")
+
+# per block python overhead is negligible next to the time block takes to send
+BLOCK_SIZE = 4 * 1024 * 1024
+# lets the kernel keep more of a block in flight on high latency links, it may cap the value
+_SOCKET_BUFFER = 4 * 1024 * 1024
+
+_MIB = 1024 * 1024
+
+# errors after which connection can not be trusted anymore, unlike error_perm replies to a single command
+_CONNECTION_ERRORS = (OSError, EOFError, error_temp)
+
+
+@dataclass(frozen=True)
+class _Entry:
+    is_dir: bool
+    # None for directories and servers not reporting sizes
+    size: Optional[int] = None
+
+
+def _parse_list_line(line: str) -> Optional[tuple[str, _Entry]]:
+    # unix style LIST output: drwxr-xr-x 1 owner group size month day time name
+    parts = line.split(maxsplit=8)
+    if len(parts) < 9 or parts[8] in (".", ".."):
+        return None
+
+    is_dir = parts[0].startswith("d")
+
+    return parts[8], _Entry(is_dir, None if is_dir or not parts[4].isdigit() else int(parts[4]))
+
+
+class RemoteIndex:
+    """
+    Contents of remote directories listed once per run.
+
+    Directory is listed with MLSD, or LIST if server lacks it, the first time anything inside of it is asked about and
+    is kept up to date with directories and files created through the index. Changes made by others meanwhile are not
+    seen.
+    """
+
+    def __init__(self) -> None:
+        # None for directories that do not exist
+        self._listings: dict[str, Optional[dict[str, _Entry]]] = {}
+        # guards listings, directories are fetched under their own locks so that connections list them concurrently
+        self._lock = threading.Lock()
+        self._fetch_locks: dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def _fetch(ftp: FTP, directory: str) -> Optional[dict[str, _Entry]]:
+        try:
+            try:
+                return {
+                    name: _Entry(facts["type"] == "dir", int(facts["size"]) if "size" in facts else None)
+                    for name, facts in ftp.mlsd(directory, ["type", "size"])
+                    if facts.get("type") in ("dir", "file")
+                }
+            except error_perm as e:
+                # 500 and 502 are unknown and not implemented command, 501 is rejected OPTS MLST of requested facts
+                if not str(e).startswith(("500", "501", "502")):
+                    raise
+
+            lines: list[str] = []
+            ftp.retrlines(f"LIST {directory}", lines.append)
+
+            return dict(entry for line in lines if (entry := _parse_list_line(line)) is not None)
+        except error_perm as e:
+            if str(e).startswith("550"):
+                return None
+            raise
+
+    def _listing(self, ftp: FTP, directory: str) -> Optional[dict[str, _Entry]]:
+        with self._lock:
+            if directory in self._listings:
+                return self._listings[directory]
+
+            fetch_lock = self._fetch_locks.setdefault(directory, threading.Lock())
+
+        # others asking about the same directory wait for its listing instead of fetching it again
+        with fetch_lock:
+            with self._lock:
+                if directory in self._listings:
+                    return self._listings[directory]
+
+            log.debug("Listing %s on CDN", directory)
+            listing = self._fetch(ftp, directory)
+
+            with self._lock:
+                return self._listings.setdefault(directory, listing)
+
+    def _entry(self, ftp: FTP, path: str) -> Optional[_Entry]:
+        path = posixpath.normpath(path)
+        if path == "/":
+            return _Entry(True)
+
+        directory, name = posixpath.split(path)
+        if (listing := self._listing(ftp, directory)) is None:
+            return None
+
+        return listing.get(name)
+
+    def exists(self, ftp: FTP, path: str) -> bool:
+        return self._entry(ftp, path) is not None
+
+    def is_dir(self, ftp: FTP, path: str) -> bool:
+        return (entry := self._entry(ftp, path)) is not None and entry.is_dir
+
+    def file_size(self, ftp: FTP, path: str) -> Optional[int]:
+        """Size of remote file, None if it does not exist or size is not known"""
+
+        if (entry := self._entry(ftp, path)) is None or entry.is_dir:
+            return None
+
+        return entry.size
+
+    def _add(self, path: str, entry: _Entry) -> None:
+        directory, name = posixpath.split(posixpath.normpath(path))
+
+        with self._lock:
+            if (listing := self._listings.get(directory)) is not None:
+                listing[name] = entry
+
+    def make_dir(self, ftp: FTP, path: str) -> None:
+        """Create remote directory unless it is known to exist"""
+
+        if self.is_dir(ftp, path):
+            return
+
+        try:
+            ftp.mkd(path)
+        except error_perm as e:
+            log.debug("Could not create %s on CDN: %s", path, e)
+            return
+
+        self._add(path, _Entry(True))
+        with self._lock:
+            # freshly created directory is known to be empty
+            self._listings.setdefault(posixpath.normpath(path), {})
+
+    def add_file(self, path: str, size: int) -> None:
+        """Record file uploaded by this run"""
+
+        self._add(path, _Entry(False, size))
+
+
+class TransferProgress:
+    """
+    Bytes sent, throughput and ETA of a single upload.
+
+    Every report_interval seconds progress is logged and emitted as upload_progress event, along with the connection
+    transfer runs over so that concurrent uploads can be told apart. Current rate is the average since last report.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        total: int,
+        connection: Optional[int] = None,
+        report_interval: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.total = total
+        self.connection = connection
+        self.report_interval = report_interval
+        self._clock = clock
+
+        self.sent = 0
+        self.started = self._last_report = clock()
+        self._sent_at_last_report = 0
+        self.current_rate: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return self._clock() - self.started
+
+    @property
+    def average_rate(self) -> Optional[float]:
+        """Bytes per second since start"""
+
+        return self.sent / elapsed if (elapsed := self.elapsed) > 0 else None
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds left at current rate, average one before first report"""
+
+        rate = self.current_rate or self.average_rate
+        return (self.total - self.sent) / rate if rate else None
+
+    def update(self, sent: int) -> None:
+        self.sent += sent
+
+        if (now := self._clock()) - self._last_report >= self.report_interval:
+            self.current_rate = (self.sent - self._sent_at_last_report) / (now - self._last_report)
+            self._last_report = now
+            self._sent_at_last_report = self.sent
+            self.report()
+
+    def report(self) -> None:
+        percent = 100 * self.sent / self.total if self.total else 100.0
+        rate, average, eta = self.current_rate, self.average_rate, self.eta
+
+        log.info(
+            "Uploading %s%s: %.1f of %.1f MiB (%.0f%%), %s now, %s average, ETA %s",
+            self.name,
+            "" if self.connection is None else f" over connection {self.connection}",
+            self.sent / _MIB,
+            self.total / _MIB,
+            percent,
+            "?" if rate is None else f"{rate / _MIB:.1f} MiB/s",
+            "?" if average is None else f"{average / _MIB:.1f} MiB/s",
+            "?" if eta is None else f"{eta:.0f}s",
+            # would flood discord during long uploads
+            extra={"discord": False},
+        )
+        emit(
+            "upload_progress",
+            remote_path=self.name,
+            connection=self.connection,
+            bytes=self.sent,
+            total=self.total,
+            elapsed=self.elapsed,
+            rate=rate,
+            average_rate=average,
+            eta=eta,
+        )
+
+
+def _tune_socket(conn: socket.socket) -> None:
+    with contextlib.suppress(OSError):
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, _SOCKET_BUFFER)
+
+
+def store_file(
+    ftp: FTP,
+    remote_path: str,
+    local_file: Path,
+    callback: Optional[Callable[[memoryview], object]] = None,
+    blocksize: int = BLOCK_SIZE,
+) -> str:
+    """
+    Upload file like storbinary, in large blocks sent from a memory mapping of the file.
+
+    Callback gets every block as a view of the mapping, so hashing does not copy data through python.
+    """
+
+    ftp.voidcmd("TYPE I")
+
+    with local_file.open("rb") as f, ftp.transfercmd(f"STOR {remote_path}") as conn:
+        _tune_socket(conn)
+        size = os.fstat(f.fileno()).st_size
+
+        # empty files can not be mapped
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                if hasattr(mapped, "madvise"):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+
+                for offset in range(0, size, blocksize):
+                    with view[offset : offset + blocksize] as block:
+                        conn.sendall(block)
+
+                        if callback is not None:
+                            callback(block)
+
+        # same as storbinary, server has to see TLS shutdown before data connection closes
+        if isinstance(conn, ssl.SSLSocket):
+            conn.unwrap()
+
+    return ftp.voidresp()
+
+
+class _Connection:
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.ftp: Optional[FTP] = None
+        self.last_used = 0.0
+
+
+class FTPSessionManager:
+    """
+    Pool of logged in CDN connections shared by upload stages.
+
+    Connections are opened by login() or on first use, handed out one holder at a time by connection() and reopened
+    if they were dropped. Keepalive thread sends NOOP over connections idle for keepalive_interval so that server
+    does not close them while builds run. Stages share index of remote directories as well.
+
+    Manager can outlive a single run (daemon keeps one for all jobs), call new_run() between runs.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        size: int = 1,
+        timeout: float = 60.0,
+        keepalive_interval: float = 60.0,
+        factory: Callable[[], FTP] = FTP,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self.keepalive_interval = keepalive_interval
+        self._factory = factory
+        self.index = RemoteIndex()
+
+        self._connections = [_Connection(i) for i in range(size)]
+        # most recently used connections are handed out first, rest can stay idle
+        self._idle: queue.LifoQueue[_Connection] = queue.LifoQueue()
+        for conn in reversed(self._connections):
+            self._idle.put(conn)
+
+        self._stop = threading.Event()
+        self._keepalive: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_config(cls, config: Config) -> FTPSessionManager:
+        return cls(
+            config.cdn_host,
+            config.cdn_port,
+            config.cdn_user,
+            config.cdn_password,
+            size=config.cdn_connections,
+            keepalive_interval=config.cdn_keepalive_interval,
+        )
+
+    def _open(self, conn: _Connection) -> FTP:
+        ftp = self._factory()
+        try:
+            ftp.connect(self.host, self.port, timeout=self.timeout)
+            ftp.login(self.user, self.password)
+        except BaseException:
+            ftp.close()
+            raise
+
+        log.debug("CDN connection %s says: %s", conn.index, ftp.getwelcome())
+        conn.ftp = ftp
+        conn.last_used = time.monotonic()
+
+        return ftp
+
+    @staticmethod
+    def _drop(conn: _Connection) -> None:
+        if conn.ftp is not None:
+            conn.ftp.close()
+            conn.ftp = None
+
+    def _noop(self, conn: _Connection) -> None:
+        assert conn.ftp is not None
+
+        try:
+            conn.ftp.voidcmd("NOOP")
+            conn.last_used = time.monotonic()
+        except all_errors as e:
+            log.debug("CDN connection %s was lost: %s", conn.index, e)
+            self._drop(conn)
+
+    def _ensure(self, conn: _Connection) -> FTP:
+        # without keepalive server could have closed connection that sat idle
+        if conn.ftp is not None and time.monotonic() - conn.last_used > self.keepalive_interval:
+            self._noop(conn)
+
+        return self._open(conn) if conn.ftp is None else conn.ftp
+
+    def login(self) -> None:
+        """Open every connection now, bad credentials or unreachable CDN fail right away"""
+
+        conns = [self._idle.get() for _ in range(self.size)]
+        try:
+            for conn in conns:
+                self._ensure(conn)
+        finally:
+            for conn in conns:
+                self._idle.put(conn)
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[FTP]:
+        """Logged in connection for exclusive use, connection errors raised by holder make it reconnect next time"""
+
+        conn = self._idle.get()
+        try:
+            yield self._ensure(conn)
+        except _CONNECTION_ERRORS:
+            self._drop(conn)
+            raise
+        finally:
+            conn.last_used = time.monotonic()
+            self._idle.put(conn)
+
+    def new_run(self) -> None:
+        """Forget remote listings of previous run, others could have changed remote since. Connections stay open"""
+
+        self.index = RemoteIndex()
+
+    def connection_id(self, ftp: FTP) -> Optional[int]:
+        """Number of pooled connection ftp is, None for connections not from this pool"""
+
+        return next((conn.index for conn in self._connections if conn.ftp is ftp), None)
+
+    def discard(self, ftp: FTP) -> None:
+        """Close connection handed out by connection() that can not be trusted anymore, it is reopened on next use"""
+
+        if (conn := next((conn for conn in self._connections if conn.ftp is ftp), None)) is not None:
+            self._drop(conn)
+
+    def reconnect(self, ftp: FTP) -> FTP:
+        """Replace broken connection handed out by connection() with a new one"""
+
+        conn = next(conn for conn in self._connections if conn.ftp is ftp)
+        self._drop(conn)
+
+        return self._open(conn)
+
+    def _keepalive_loop(self) -> None:
+        while not self._stop.wait(self.keepalive_interval / 2):
+            idle: list[_Connection] = []
+            with contextlib.suppress(queue.Empty):
+                while len(idle) < self.size:
+                    idle.append(self._idle.get_nowait())
+
+            try:
+                for conn in idle:
+                    if conn.ftp is not None and time.monotonic() - conn.last_used >= self.keepalive_interval / 2:
+                        self._noop(conn)
+            finally:
+                # put back in the same order for lifo to keep handing out recently used ones
+                for conn in reversed(idle):
+                    self._idle.put(conn)
+
+    def start_keepalive(self) -> None:
+        if self._keepalive is None:
+            self._keepalive = threading.Thread(target=self._keepalive_loop, name="cdn keepalive", daemon=True)
+            self._keepalive.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._keepalive is not None:
+            self._keepalive.join()
+            self._keepalive = None
+
+        for conn in self._connections:
+            if conn.ftp is not None:
+                with contextlib.suppress(*all_errors):
+                    conn.ftp.quit()
+            self._drop(conn)
+
+    def __enter__(self) -> FTPSessionManager:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+
+from collections.abc import Iterable
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Optional
+
+from .utils import atomic_write
+
+__all__ = (
+    "RunState",
+    "output_digest",
+)
+
+log = getLogger("usautobuild")
+
+_STATE_VERSION = 1
+
+
+def output_digest(path: Path) -> Optional[str]:
+    """
+    Cheap digest of file or directory tree from names, sizes and modification times, None if path does not exist.
+
+    Contents are not read, a build folder with thousands of files is checked in a fraction of a second.
+    """
+
+    if not path.exists():
+        return None
+
+    digest = hashlib.sha256()
+
+    paths = [path] if path.is_file() else sorted(p for p in path.rglob("*") if p.is_file() or p.is_symlink())
+
+    for file in paths:
+        stat = file.lstat()
+        name = file.name if file == path else file.relative_to(path)
+        digest.update(f"{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+
+    return digest.hexdigest()
+
+
+class RunState:
+    """
+    Completed stages of a run persisted to JSON after each of them, allowing to resume failed run.
+
+    Stage is considered complete if it was recorded with the same input fingerprint and its local outputs have not
+    changed since. Fingerprint always includes commit and build number of the run.
+    """
+
+    def __init__(self, path: Path, build_number: int, commit: Optional[str] = None) -> None:
+        self.path = path
+        self.build_number = build_number
+        self.commit = commit
+
+        # targets can finish in parallel when built on workers
+        self._lock = threading.RLock()
+        self._stages: dict[str, dict[str, Any]] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> Optional[RunState]:
+        """Read state of previous run, None if there is none or it is unusable"""
+
+        try:
+            with path.open(encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning("Ignoring unreadable run state %s: %s", path, e)
+            return None
+
+        if not isinstance(raw, dict) or raw.get("version") != _STATE_VERSION:
+            log.warning("Ignoring run state %s of unknown version", path)
+            return None
+
+        state = cls(path, raw["build_number"], raw.get("commit"))
+        state._stages = raw.get("stages", {})
+
+        return state
+
+    def fingerprint(self, **inputs: Any) -> dict[str, Any]:
+        return {"commit": self.commit, "build_number": self.build_number, **inputs}
+
+    @property
+    def completed(self) -> list[str]:
+        return list(self._stages)
+
+    def is_complete(self, stage: str, fingerprint: dict[str, Any]) -> bool:
+        if (record := self._stages.get(stage)) is None:
+            return False
+
+        if record["fingerprint"] != fingerprint:
+            log.debug("%s inputs changed since it was completed", stage)
+            return False
+
+        for path, digest in record["outputs"].items():
+            if output_digest(Path(path)) != digest:
+                log.debug("%s output %s changed since it was completed", stage, path)
+                return False
+
+        return True
+
+    def complete(self, stage: str, fingerprint: dict[str, Any], outputs: Iterable[Path] = ()) -> None:
+        record = {
+            "fingerprint": fingerprint,
+            "outputs": {str(path): output_digest(path) for path in outputs},
+            "completed_at": time.time(),
+        }
+
+        with self._lock:
+            self._stages[stage] = record
+            self.save()
+
+    def save(self) -> None:
+        """Atomically replace state file so that crash mid write does not lose previous state"""
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self._lock:
+            self._write()
+
+    def _write(self) -> None:
+        raw = {
+            "version": _STATE_VERSION,
+            "build_number": self.build_number,
+            "commit": self.commit,
+            "stages": self._stages,
+        }
+
+        with atomic_write(self.path) as f:
+            json.dump(raw, f, indent=2)
@@ -1,76 +1,173 @@
 import argparse
 
+from collections.abc import Callable, Sequence
 from pathlib import Path
+from typing import Any, Optional, TypeVar
 
 from usautobuild.config import DEFAULT_BRANCH
 from usautobuild.logger import LogLevel
+from usautobuild.planner import CACHES, RESOURCES
 
-__all__ = ("args",)
+__all__ = (
+    "make_parser",
+    "parse_args",
+)
+
+T = TypeVar("T")
 
 _default_config_path = Path("config.json")
 
-ap = argparse.ArgumentParser(
-    description="""
-    Unitystation build script.
-    """
-)
 
-ap.add_argument(
-    "--branch",
-    type=str,
-    required=False,
-    help=f"Git branch to use. Defaults to {DEFAULT_BRANCH}. Incompatible with --tag",
-)
-ap.add_argument(
-    "--pr",
-    type=int,
-    required=False,
-    help="Force a particular GitHub PR. Incompatible with --branch",
-)
-ap.add_argument(
-    "-b",
-    "--build-number",
-    type=int,
-    required=False,
-    help="Force a particular build number",
-)
-ap.add_argument(
-    "-L",
-    "--get-license",
-    action="store_true",
-    help="Get license file and quit",
-)
-ap.add_argument(
-    "-f",
-    "--config-file",
-    type=Path,
-    help=f"Path to the config file, defaults to {_default_config_path}",
-    default=_default_config_path,
-)
-ap.add_argument(
-    "-l",
-    "--log-level",
-    type=LogLevel(),
-    help="Logging level, defaults to info",
-    default="INFO",
-)
-ap.add_argument(
-    "--release",
-    action="store_true",
-    help="Upload changelog and maybe do other release stuff when added",
-)
-ap.add_argument(
-    "--dry-run",
-    action="store_true",
-    help="Run build until completion without uploading to FTP",
-)
-ap.add_argument(
-    "--stable",
-    action="store_true",
-    help="Tag current build as stable and push to DockerHub with the stable tag",
-)
+def _assignment(convert: Callable[[str], T]) -> Callable[[str], tuple[str, T]]:
+    """Argument type of NAME=VALUE pairs"""
+
+    def parse(raw: str) -> tuple[str, T]:
+        name, sep, value = raw.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {raw!r}")
+
+        try:
+            return name, convert(value)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e)) from e
+
+    return parse
+
+
+def make_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(
+        description="""
+        Unitystation build script.
+        """
+    )
+
+    ap.add_argument(
+        "--branch",
+        type=str,
+        required=False,
+        help=f"Git branch to use. Defaults to {DEFAULT_BRANCH}. Incompatible with --tag",
+    )
+    ap.add_argument(
+        "--pr",
+        type=int,
+        required=False,
+        help="Force a particular GitHub PR. Incompatible with --branch",
+    )
+    ap.add_argument(
+        "-b",
+        "--build-number",
+        type=int,
+        required=False,
+        help="Force a particular build number",
+    )
+    ap.add_argument(
+        "-L",
+        "--get-license",
+        action="store_true",
+        help="Get license file and quit",
+    )
+    ap.add_argument(
+        "-f",
+        "--config-file",
+        type=Path,
+        help=f"Path to the config file, defaults to {_default_config_path}",
+        default=_default_config_path,
+    )
+    ap.add_argument(
+        "-l",
+        "--log-level",
+        type=LogLevel(),
+        help="Logging level, defaults to info",
+        default="INFO",
+    )
+    ap.add_argument(
+        "--release",
+        action="store_true",
+        help="Upload changelog and maybe do other release stuff when added",
+    )
+    ap.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Run build until completion without uploading to FTP",
+    )
+    ap.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue last run skipping stages that completed and whose outputs are still in place",
+    )
+    ap.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and build jobs submitted to spool directory one by one",
+    )
+    ap.add_argument(
+        "--watch",
+        action="store_true",
+        help="Run as daemon that also builds new commits of --branch on its own",
+    )
+    ap.add_argument(
+        "--submit",
+        action="store_true",
+        help="Put build with given --branch/--pr/--release/--dry-run into daemon queue and quit",
+    )
+    ap.add_argument(
+        "--priority",
+        type=int,
+        help="Priority of submitted job, higher is built first. Defaults to 0",
+        default=0,
+    )
+    ap.add_argument(
+        "--worker",
+        action="store_true",
+        help="Build single target job read from stdin and write artifact to stdout, used by build coordinator",
+    )
+    ap.add_argument(
+        "--plan",
+        action="store_true",
+        help="Print stages this build would run with duration estimates from past runs and quit, nothing is executed",
+    )
+    ap.add_argument(
+        "--plan-limit",
+        type=_assignment(int),
+        action="append",
+        default=[],
+        metavar="RESOURCE=N",
+        help=f"Concurrency limit of plan resource, one of: {', '.join(RESOURCES)}. Can be repeated",
+    )
+    ap.add_argument(
+        "--plan-cache-hit",
+        type=_assignment(float),
+        action="append",
+        default=[],
+        metavar="CACHE=RATE",
+        help=f"Assumed hit rate from 0 to 1 of cache, one of: {', '.join(CACHES)}. Defaults to rates of past runs",
+    )
+    ap.add_argument(
+        "--stable",
+        action="store_true",
+        help="Tag current build as stable and push to DockerHub with the stable tag",
+    )
+
+    return ap
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> dict[str, Any]:
+    """Parse command line, sys.argv is used if argv is not given"""
+
+    args = vars(make_parser().parse_args(argv))
+
+    if args["branch"] and args["pr"]:
+        raise Exception("--branch conflicts with --pr")
+
+    if (args["daemon"] or args["watch"]) and args["submit"]:
+        raise Exception("--daemon and --watch conflict with --submit")
+
+    for resource, limit in args["plan_limit"]:
+        if resource not in RESOURCES or limit < 1:
+            raise Exception(f"--plan-limit expects one of {', '.join(RESOURCES)} with positive limit")
 
-args = vars(ap.parse_args())
+    for cache, rate in args["plan_cache_hit"]:
+        if cache not in CACHES or not 0 <= rate <= 1:
+            raise Exception(f"--plan-cache-hit expects one of {', '.join(CACHES)} with rate from 0 to 1")
 
-if args["branch"] and args["pr"]:
-    raise Exception("--branch conflicts with --pr")
+    return args
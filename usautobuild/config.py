@@ -7,11 +7,15 @@ from typing import Optional
 
 from .config_base import ConfigBase, Var
 
-__all__ = ("Config", "DEFAULT_BRANCH")
+__all__ = ("Config", "DEFAULT_BRANCH", "current_build_number")
 
 DEFAULT_BRANCH = "develop"
 
 
+def current_build_number() -> int:
+    return int(datetime.datetime.now().strftime("%y%m%d%H"))
+
+
 class Config(ConfigBase):
     release: bool = False
     do_good_files : bool
@@ -31,17 +35,60 @@ class Config(ConfigBase):
 
     unity_version = "2020.1.17f1"
     target_platforms = ["linuxserver", "StandaloneWindows64", "StandaloneOSX", "StandaloneLinux64"]
+    cdn_port = 21
+    # connections kept open to the CDN, targets are uploaded concurrently over them
+    cdn_connections = 1
+    # seconds after which idle CDN connections are kept alive with NOOP
+    cdn_keepalive_interval = 60.0
+    # seconds between progress reports of running uploads
+    upload_progress_interval = 10.0
     cdn_download_url = "https://unitystationfile.b-cdn.net/{}/{}/{}.zip"
     forkname = "UnityStationDevelop"
 
     discord_webhook: Optional[str] = None
 
     dry_run = False
+    # skip stages completed by previous run according to state_file
+    resume = False
     abort_on_build_fail = True
     allow_no_changes = True
 
-    build_number = int(datetime.datetime.now().strftime("%y%m%d%H"))
+    # seconds, None disables the limit
+    pull_timeout: Optional[float] = 1800.0
+    build_timeout: Optional[float] = None
+    build_inactivity_timeout: Optional[float] = 3600.0
+    # how many times to restart a build after it was killed as hung
+    build_retries = 1
+    # build targets on workers instead of this host: local:<dir> or ssh:<host>:<dir>, see usautobuild.distributed
+    build_workers: list[str] = []
+    # threads hashing build outputs and checking archives, None picks by cpu count
+    hash_workers: Optional[int] = None
+
+    build_number = current_build_number()
 
     output_dir = Path.cwd() / "builds"
+    # structured json lines event log of every run
+    events_dir = Path.cwd() / "logs" / "events"
+    # chrome trace of pipeline stages of every run
+    trace_dir = Path.cwd() / "logs" / "traces"
+    # prometheus textfile for node_exporter textfile collector, not written if unset
+    metrics_file: Optional[Path] = None
+    # daemon mode job submission directory and how often it is checked, seconds
+    spool_dir = Path.cwd() / "spool"
+    daemon_poll_interval = 5.0
+    # watch mode: how often remote heads are listed, how long moved head has to stay put before it is built, seconds
+    watch_interval = 60.0
+    watch_debounce = 120.0
+    # also build new commits of pull requests
+    watch_prs = False
+    # seconds an image pulled by earlier build of the same process is reused without pulling again
+    pull_interval = 3600.0
+
+    # how many recorded runs --plan estimates stage durations from
+    plan_history = 20
+
+    # completed stages of the last run, used by resume
+    state_file = Path.cwd() / "logs" / "run-state.json"
     license_file = Path.cwd() / "UnityLicense.ulf"
-    project_path = Path()
+    # inside of repo cloned by Gitter
+    project_path = Path.cwd() / "local_repo" / "UnityProject"
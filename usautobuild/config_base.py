@@ -7,7 +7,7 @@ import typing
 from collections.abc import Mapping
 from logging import getLogger
 from pathlib import Path
-from typing import Any, Optional, TypeVar, Union
+from typing import Any, ClassVar, Optional, Self, TypeVar, Union
 
 from .exceptions import InvalidConfigFileError
 
@@ -103,34 +103,55 @@ class Variable:
     def resolve(self, name: str, args: Mapping[str, Any], cfg: dict[str, Any], type_: Any = _UNSET) -> Any:
         """Look up value from chain of CLI -> config -> env -> default? and try converting it to appropriate type"""
 
+        value, exported = self.resolve_value(name, args, cfg, type_)
+
+        if exported is not None:
+            os.environ[self.env_name(name)] = exported
+
+        return value
+
+    def resolve_value(
+        self,
+        name: str,
+        args: Mapping[str, Any],
+        cfg: dict[str, Any],
+        type_: Any = _UNSET,
+        environ: Optional[Mapping[str, str]] = None,
+    ) -> tuple[Any, Optional[str]]:
+        """
+        Same as resolve without touching os.environ, env is looked up in environ if given.
+
+        Second value is what would have been written to env, None if nothing.
+        """
+
         try:
-            return self._resolve(name, args, cfg, type_)
+            return self._resolve(name, args, cfg, type_, os.environ if environ is None else environ)
         except BaseConversionError as e:
             e.name = name
             e.var = self
 
             raise
 
-    def _resolve(self, name: str, args: Mapping[str, Any], cfg: dict[str, Any], type_: Any) -> Any:
+    def _resolve(
+        self, name: str, args: Mapping[str, Any], cfg: dict[str, Any], type_: Any, environ: Mapping[str, str]
+    ) -> tuple[Any, Optional[str]]:
         if self.type_ is not _UNSET:
             type_ = self.type_
 
         if type_ is _UNSET:
             type_ = self.guess_type_from_default(self.default)
 
-        value, from_env = self.fetch_value(name, args, cfg)
+        value, from_env = self.fetch_value(name, args, cfg, environ)
 
         if from_env:
-            return self.convert_env(value, type_)
+            return self.convert_env(value, type_), None
 
         converted_value = self.convert_non_env(value, type_)
 
         # overwrite environ only after successful conversion
         # if we got variable from env we do not need to overwrite it
-        if self.set_env:
-            os.environ[self.env_name(name)] = str(value)
-
-        return converted_value
+        # None would be read back as string "None", unset value is not exported at all
+        return converted_value, str(value) if self.set_env and converted_value is not None else None
 
     @staticmethod
     def guess_type_from_default(default: Any) -> Any:
@@ -141,13 +162,18 @@ class Variable:
 
         return type(default)
 
-    def fetch_value(self, name: str, args: Mapping[str, Any], cfg: dict[str, Any]) -> tuple[Any, bool]:
+    def fetch_value(
+        self, name: str, args: Mapping[str, Any], cfg: dict[str, Any], environ: Optional[Mapping[str, str]] = None
+    ) -> tuple[Any, bool]:
         """
         Get value from different sources with prioritios of CLI -> config -> env -> default.
 
         Second value indicates if value was fetched from env because env variables need special treatment.
         """
 
+        if environ is None:
+            environ = os.environ
+
         if (arg := self.arg) is None:
             arg = name
 
@@ -160,8 +186,8 @@ class Variable:
         if config in cfg:
             return cfg[config], False
 
-        if (env := self.env_name(name)) in os.environ:
-            return os.environ[env], True
+        if (env := self.env_name(name)) in environ:
+            return environ[env], True
 
         if self.default is _UNSET:
             raise VariableMissingError
@@ -250,13 +276,117 @@ def Var(default: T = _UNSET, *args: Any, **kwargs: Any) -> T:  # type: ignore[as
     return Variable(default, *args, **kwargs)  # type: ignore[return-value]
 
 
+# compiled schemas by config class
+_schemas: dict[type, dict[str, tuple[Variable, Any]]] = {}
+
+
+def _compile_schema(cls: type) -> dict[str, tuple[Variable, Any]]:
+    """Variables of config class with their types, introspection is slow so it is done once per class"""
+
+    if (schema := _schemas.get(cls)) is not None:
+        return schema
+
+    # get vaiables with annotations:
+    # foo: int
+    # foo: int = Var(...)
+    variables = typing.get_type_hints(cls)
+
+    # fill variables without annotations:
+    # foo = Var(int, ...)
+    # foo = 1
+    for name, value in inspect.getmembers(cls):
+        if name.startswith("_"):
+            continue
+
+        if inspect.isfunction(value) or inspect.isdatadescriptor(value) or inspect.ismethod(value):
+            continue
+
+        if name not in variables:
+            variables[name] = _UNSET
+
+    schema = {}
+
+    for name, type_ in variables.items():
+        if name.startswith("_") or typing.get_origin(type_) is ClassVar:
+            continue
+
+        # default for cases where Var is omitted:
+        # foo: int
+        var: Any = getattr(cls, name, Variable())
+        # variables with simple default:
+        # foo = 1
+        # foo: int = 1
+        if not isinstance(var, Variable):
+            var = Variable(var)
+
+        schema[name] = (var, type_)
+
+    _schemas[cls] = schema
+
+    return schema
+
+
 class ConfigBase:
+    """
+    Config populated from CLI arguments, config file and env.
+
+    Instances created directly write resolved values back to os.environ like before. Instances created with
+    resolve() leave process environment alone, keep those values in environ and are read only, so several of them
+    can be resolved and used concurrently.
+    """
+
+    _frozen = False
+    _environ: dict[str, str]
+
     def __init__(self, args: dict[str, Any]):
         self.resolve_vars(
             self.sanitize_argparse_args(args),
             self.read_config(args["config_file"]),
         )
 
+    @classmethod
+    def resolve(
+        cls,
+        args: dict[str, Any],
+        environ: Optional[Mapping[str, str]] = None,
+        overrides: Optional[Mapping[str, Any]] = None,
+    ) -> Self:
+        """
+        Read only config that does not touch os.environ and only sees env given in environ, none by default.
+
+        Unlike argparse args, overrides are applied even when they are falsy. None there stands for default of the
+        variable, not for whatever config file or env say.
+        """
+
+        args = cls.sanitize_argparse_args(args)
+
+        if overrides:
+            defaults = {var.arg or name: var.default for name, (var, _) in _compile_schema(cls).items()}
+
+            for arg, value in overrides.items():
+                if value is None and defaults.get(arg, _UNSET) is _UNSET:
+                    args.pop(arg, None)
+                else:
+                    args[arg] = defaults[arg] if value is None else value
+
+        self = cls.__new__(cls)
+        self.resolve_vars(args, self.read_config(args["config_file"]), {} if environ is None else environ)
+        self._frozen = True
+
+        return self
+
+    @property
+    def environ(self) -> dict[str, str]:
+        """Values exported to env, to be passed to subprocesses"""
+
+        return dict(self._environ)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if self._frozen:
+            raise AttributeError(f"{type(self).__name__} is read only, cannot set {name}")
+
+        super().__setattr__(name, value)
+
     @staticmethod
     def sanitize_argparse_args(args: dict[str, Any]) -> dict[str, Any]:
         """Filter None and False (from store_true) values which break defaults handling"""
@@ -283,41 +413,32 @@ class ConfigBase:
 
         return config
 
-    def resolve_vars(self, args: dict[str, Any], config: dict[str, Any]) -> None:
-        # get vaiables with annotations:
-        # foo: int
-        # foo: int = Var(...)
-        variables = typing.get_type_hints(type(self))
+    def resolve_vars(
+        self, args: dict[str, Any], config: dict[str, Any], environ: Optional[Mapping[str, str]] = None
+    ) -> None:
+        """Resolve all variables, exported values go to os.environ unless separate environ is given"""
 
-        # fill variables without annotations:
-        # foo = Var(int, ...)
-        # foo = 1
-        for name, value in inspect.getmembers(type(self)):
-            if name.startswith("_"):
-                continue
-
-            if inspect.isfunction(value) or inspect.isdatadescriptor(value) or inspect.ismethod(value):
-                continue
-
-            if name not in variables:
-                variables[name] = _UNSET
-
-        for name, type_ in variables.items():
-            # default for cases where Var is omitted:
-            # foo: int
-            var: Any = getattr(self, name, Variable())
-            # variables with simple default:
-            # foo = 1
-            # foo: int = 1
-            if not isinstance(var, Variable):
-                var = Variable(var)
+        exported = {}
 
+        for name, (var, type_) in _compile_schema(type(self)).items():
             try:
-                setattr(self, name, var.resolve(name, args, config, type_=type_))
+                value, exported_value = var.resolve_value(name, args, config, type_, environ)
             except Exception as e:
                 log.error("resolving %s to %s of type %s", name, var, type_)
 
                 raise e from None
 
+            setattr(self, name, value)
+
+            if exported_value is not None:
+                exported[var.env_name(name)] = exported_value
+
+                if environ is None:
+                    os.environ[var.env_name(name)] = exported_value
+
+        self._environ = exported
+
     def __repr__(self) -> str:
-        return f"<{type(self).__name__} {' '.join(f'{k}={v}' for k,v in self.__dict__.items())}>"
+        values = " ".join(f"{k}={v}" for k, v in self.__dict__.items() if not k.startswith("_"))
+
+        return f"<{type(self).__name__} {values}>"
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import json
+import signal
+import threading
+import time
+import uuid
+
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field, replace
+from logging import getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
+
+from .utils import atomic_write
+
+if TYPE_CHECKING:
+    from .watcher import RefWatcher
+
+__all__ = (
+    "BuildJob",
+    "Daemon",
+    "JobQueue",
+    "Spool",
+)
+
+log = getLogger("usautobuild")
+
+
+@dataclass(frozen=True)
+class BuildJob:
+    branch: Optional[str] = None
+    pr: Optional[int] = None
+    release: bool = False
+    dry_run: bool = False
+    # higher runs first, release builds win ties
+    priority: int = 0
+    submitted: float = field(default_factory=time.time)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    # spool files of this job and every job coalesced into it
+    sources: tuple[str, ...] = ()
+
+    @property
+    def key(self) -> tuple[Optional[str], Optional[int]]:
+        """Jobs with the same key build the same thing and can be coalesced"""
+
+        return self.branch, self.pr
+
+    @property
+    def order(self) -> tuple[int, bool, float]:
+        return self.priority, self.release, -self.submitted
+
+    def merge(self, newer: BuildJob) -> BuildJob:
+        """Single job doing everything both jobs asked for, keeping place of the older one in queue"""
+
+        return replace(
+            self,
+            release=self.release or newer.release,
+            dry_run=self.dry_run and newer.dry_run,
+            priority=max(self.priority, newer.priority),
+            sources=self.sources + newer.sources,
+        )
+
+    def as_args(self) -> dict[str, Any]:
+        """CLI arguments overriding daemon ones for this job"""
+
+        return {
+            "branch": self.branch,
+            "pr": self.pr,
+            "release": self.release,
+            "dry_run": self.dry_run,
+        }
+
+    def __str__(self) -> str:
+        source = f"pr {self.pr}" if self.pr is not None else f"branch {self.branch or 'default'}"
+        flags = "".join(f" {name}" for name in ("release", "dry_run") if getattr(self, name))
+
+        return f"{self.id} ({source}{flags})"
+
+
+class JobQueue:
+    """Pending jobs, at most one per key"""
+
+    def __init__(self) -> None:
+        self._jobs: dict[tuple[Optional[str], Optional[int]], BuildJob] = {}
+
+    def push(self, job: BuildJob) -> BuildJob:
+        """Queue job or coalesce it into queued job for the same key, returns the job that is queued"""
+
+        if (queued := self._jobs.get(job.key)) is not None:
+            job = queued.merge(job)
+            log.info("Coalesced build into queued job %s", job)
+
+        self._jobs[job.key] = job
+
+        return job
+
+    def pop(self) -> Optional[BuildJob]:
+        if not self._jobs:
+            return None
+
+        job = max(self._jobs.values(), key=lambda job: job.order)
+        del self._jobs[job.key]
+
+        return job
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+
+class Spool:
+    """
+    Job files in a directory, used to submit builds to running daemon.
+
+    New jobs are written to incoming/, collected jobs are moved to queued/ and removed once built so that queue
+    survives daemon restarts. Jobs that failed are kept in failed/ for inspection.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.incoming = directory / "incoming"
+        self.queued = directory / "queued"
+        self.failed = directory / "failed"
+
+        self.incoming.mkdir(parents=True, exist_ok=True)
+        self.queued.mkdir(parents=True, exist_ok=True)
+        self.failed.mkdir(parents=True, exist_ok=True)
+
+    def submit(self, job: BuildJob) -> Path:
+        raw = asdict(job)
+        del raw["sources"]
+
+        # written under temporary name first so daemon never picks up half written job
+        path = self.incoming / f"{job.submitted:.6f}-{job.id}.json"
+        with atomic_write(path) as f:
+            json.dump(raw, f)
+
+        return path
+
+    def recover(self) -> None:
+        """Put jobs left queued by previous daemon back to incoming"""
+
+        for path in self.queued.glob("*.json"):
+            path.replace(self.incoming / path.name)
+
+    def collect(self) -> list[BuildJob]:
+        jobs = []
+
+        for path in sorted(self.incoming.glob("*.json")):
+            try:
+                raw = json.loads(path.read_text(encoding="utf-8"))
+                job = BuildJob(**{**raw, "sources": ()})
+            except (OSError, ValueError, TypeError) as e:
+                log.error("Discarding bad job file %s: %s", path.name, e)
+                path.unlink(missing_ok=True)
+                continue
+
+            queued = self.queued / path.name
+            path.replace(queued)
+            jobs.append(replace(job, sources=(str(queued),)))
+
+        return jobs
+
+    def finish(self, job: BuildJob) -> None:
+        for source in job.sources:
+            Path(source).unlink(missing_ok=True)
+
+    def fail(self, job: BuildJob) -> None:
+        for source in map(Path, job.sources):
+            if source.is_file():
+                source.replace(self.failed / source.name)
+
+
+class Daemon:
+    """
+    Runs jobs from spool one by one until SIGTERM or SIGINT, current job is finished before exiting.
+
+    Jobs for moved refs are added too if watcher is given.
+    """
+
+    def __init__(
+        self,
+        spool: Spool,
+        run_job: Callable[[BuildJob], None],
+        poll_interval: float = 5.0,
+        watcher: Optional[RefWatcher] = None,
+    ) -> None:
+        self.spool = spool
+        self.run_job = run_job
+        self.poll_interval = poll_interval
+        self.watcher = watcher
+
+        self.queue = JobQueue()
+        self._stop = threading.Event()
+
+    def stop(self, *_args: Any) -> None:
+        log.info("Stopping daemon after current job")
+        self._stop.set()
+
+    def poll(self) -> None:
+        for job in self.spool.collect():
+            log.info("Received job %s", job)
+            self.queue.push(job)
+
+        if (watcher := self.watcher) is not None:
+            for job in watcher.poll():
+                self.queue.push(job)
+
+    def run(self) -> None:
+        previous_handlers = {signum: signal.signal(signum, self.stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+
+        self.spool.recover()
+        log.info("Waiting for jobs in %s", self.spool.incoming)
+
+        try:
+            while not self._stop.is_set():
+                self.poll()
+
+                if (job := self.queue.pop()) is None:
+                    self._stop.wait(self.poll_interval)
+                    continue
+
+                log.info("Starting job %s, %s more queued", job, len(self.queue))
+                try:
+                    self.run_job(job)
+                except Exception:
+                    log.exception("Job %s failed, moving it to %s", job, self.spool.failed)
+                    self.spool.fail(job)
+                else:
+                    self.spool.finish(job)
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import io
+import json
+import os
+import queue
+import shlex
+import shutil
+import subprocess
+import sys
+import tarfile
+import threading
+
+from collections.abc import Callable, Sequence
+from dataclasses import asdict, dataclass
+from logging import getLogger
+from pathlib import Path
+from typing import IO, Any, Optional
+
+from .exceptions import WorkerFailedError
+
+__all__ = (
+    "CommandTransport",
+    "Coordinator",
+    "TargetJob",
+    "artifact_output",
+    "make_transport",
+    "pack_artifact",
+    "unpack_artifact",
+)
+
+log = getLogger("usautobuild")
+
+_MAIN = Path(__file__).resolve().parent.parent / "main.py"
+_METADATA = "build.json"
+
+
+@dataclass(frozen=True)
+class TargetJob:
+    """Everything worker needs to reproduce single target build of coordinator's run"""
+
+    target: str
+    commit: str
+    build_number: int
+    branch: str
+    pr: Optional[int] = None
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, raw: str) -> TargetJob:
+        return cls(**json.loads(raw))
+
+
+def pack_artifact(fileobj: IO[bytes], target: str, output_dir: Path, logs_dir: Path, metadata: dict[str, Any]) -> None:
+    """Stream build folder, editor log and metadata of target as uncompressed tar"""
+
+    with tarfile.open(fileobj=fileobj, mode="w|") as tar:
+        tar.add(output_dir / target, arcname=f"builds/{target}")
+
+        if (logfile := logs_dir / f"{target}.txt").is_file():
+            tar.add(logfile, arcname=f"logs/{target}.txt")
+
+        raw = json.dumps(metadata).encode()
+        info = tarfile.TarInfo(_METADATA)
+        info.size = len(raw)
+        tar.addfile(info, io.BytesIO(raw))
+
+
+def unpack_artifact(fileobj: IO[bytes], target: str, output_dir: Path, logs_dir: Path) -> dict[str, Any]:
+    """
+    Extract artifact stream replacing build folder of target, returns metadata.
+
+    Stream is extracted next to the build folder first so that failed transfer does not leave half of a build behind.
+    """
+
+    staging = output_dir / f".{target}.partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+            _extract(tar, staging)
+
+        build = staging / "builds" / target
+        if not build.is_dir():
+            raise tarfile.TarError(f"artifact has no builds/{target}")
+
+        shutil.rmtree(output_dir / target, ignore_errors=True)
+        build.replace(output_dir / target)
+
+        if (logfile := staging / "logs" / f"{target}.txt").is_file():
+            logs_dir.mkdir(parents=True, exist_ok=True)
+            logfile.replace(logs_dir / f"{target}.txt")
+
+        metadata: dict[str, Any] = json.loads((staging / _METADATA).read_text())
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return metadata
+
+
+def _extract(tar: tarfile.TarFile, destination: Path) -> None:
+    """Extract archive refusing anything that would end up outside of destination"""
+
+    # extraction filters only exist since python 3.11.4
+    if hasattr(tarfile, "data_filter"):
+        tar.extractall(destination, filter="data")
+        return
+
+    root = destination.resolve()
+
+    for member in tar:
+        path = (root / member.name).resolve()
+
+        if member.issym():
+            allowed = (path.parent / member.linkname).resolve().is_relative_to(root)
+        else:
+            allowed = member.isfile() or member.isdir()
+
+        if not allowed or not path.is_relative_to(root):
+            raise tarfile.TarError(f"refusing to extract {member.name}")
+
+        # same as data filter: no setuid and no write access for others
+        member.mode &= 0o755
+        tar.extract(member, destination)
+
+
+def artifact_output() -> IO[bytes]:
+    """
+    Take over stdout for artifact stream of worker.
+
+    Anything else written to stdout, including log stream handler, goes to stderr afterwards.
+    """
+
+    sys.stdout.flush()
+    artifact = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    return artifact
+
+
+class CommandTransport:
+    """
+    Runs worker command per job. Job goes to its stdin, artifact is read from its stdout and stderr is logged.
+
+    Same protocol works for local processes and ssh, remote host only needs this repo and its own config.
+    """
+
+    def __init__(self, name: str, argv: Sequence[str], cwd: Optional[Path] = None) -> None:
+        self.name = name
+        self.argv = list(argv)
+        self.cwd = cwd
+
+    def run(self, job: TargetJob, output_dir: Path, logs_dir: Path) -> dict[str, Any]:
+        log.debug("Sending %s to worker %s", job.target, self.name)
+
+        proc = subprocess.Popen(
+            self.argv,  # noqa: S603
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+        )
+        assert proc.stdin is not None
+        assert proc.stdout is not None
+        assert proc.stderr is not None
+
+        stderr = proc.stderr
+        forwarder = threading.Thread(target=self._forward_stderr, args=(stderr, job.target), daemon=True)
+        forwarder.start()
+
+        error: Optional[Exception] = None
+        try:
+            with proc.stdin:
+                proc.stdin.write(job.to_json().encode())
+
+            metadata = unpack_artifact(proc.stdout, job.target, output_dir, logs_dir)
+        except (OSError, ValueError, tarfile.TarError) as e:
+            error = e
+        finally:
+            proc.stdout.close()
+            returncode = proc.wait()
+            forwarder.join()
+
+        if returncode:
+            raise WorkerFailedError(self.name, job.target, f"exited with {returncode}")
+
+        if error is not None:
+            raise WorkerFailedError(self.name, job.target, f"bad artifact: {error}")
+
+        return metadata
+
+    def _forward_stderr(self, stderr: IO[bytes], target: str) -> None:
+        with stderr:
+            for line in stderr:
+                log.debug("[%s %s] %s", self.name, target, line.decode(errors="replace").rstrip())
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.name}>"
+
+
+def make_transport(spec: str) -> CommandTransport:
+    """
+    Transport from worker spec.
+
+    local:<dir> runs worker process in directory on this host, ssh:<host>:<dir> runs it in directory of other host.
+    """
+
+    kind, _, rest = spec.partition(":")
+
+    if kind == "local" and rest:
+        return CommandTransport(spec, [sys.executable, str(_MAIN), "--worker"], cwd=Path(rest))
+
+    if kind == "ssh" and ":" in rest:
+        host, _, directory = rest.partition(":")
+        command = f"cd {shlex.quote(directory)} && python3 main.py --worker"
+
+        return CommandTransport(spec, ["ssh", "-o", "BatchMode=yes", host, command])
+
+    raise ValueError(f"Bad worker spec {spec!r}, expected local:<dir> or ssh:<host>:<dir>")
+
+
+class Coordinator:
+    """Hands target jobs to free workers, every worker builds one target at a time"""
+
+    def __init__(self, transports: Sequence[CommandTransport], stop_on_failure: bool = True) -> None:
+        self.transports = transports
+        self.stop_on_failure = stop_on_failure
+
+    def build(
+        self,
+        jobs: Sequence[TargetJob],
+        run: Callable[[CommandTransport, TargetJob], None],
+    ) -> dict[str, Exception]:
+        """Run all jobs, returns errors by target. Nothing new is started after first failure if stop_on_failure"""
+
+        pending: queue.SimpleQueue[TargetJob] = queue.SimpleQueue()
+        for job in jobs:
+            pending.put(job)
+
+        failures: dict[str, Exception] = {}
+        failed = threading.Event()
+
+        def worker_loop(transport: CommandTransport) -> None:
+            while not (self.stop_on_failure and failed.is_set()):
+                try:
+                    job = pending.get_nowait()
+                except queue.Empty:
+                    return
+
+                try:
+                    run(transport, job)
+                except Exception as e:
+                    log.error("%s", e)
+                    failures[job.target] = e
+                    failed.set()
+
+        threads = [
+            threading.Thread(target=worker_loop, args=(transport,), name=f"worker {transport.name}")
+            for transport in self.transports
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return failures
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import threading
+import time
+
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import IO, Any, Optional
+
+from . import tracing
+
+__all__ = (
+    "BuildEvent",
+    "EventLog",
+    "emit",
+    "list_runs",
+    "read_events",
+    "recorded_events",
+    "run_id",
+    "set_event_log",
+    "stage",
+)
+
+
+@dataclass(frozen=True)
+class BuildEvent:
+    """
+    Single structured event of a run. Serialized as one flat JSON object per line, field names are stable.
+
+    Anything not covered by common fields goes into data which is merged into the same object when serialized.
+    """
+
+    event: str
+    ts: float
+    run_id: str
+    build_number: Optional[int] = None
+    branch: Optional[str] = None
+    stage: Optional[str] = None
+    target: Optional[str] = None
+    # seconds
+    duration: Optional[float] = None
+    status: Optional[str] = None
+    data: dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self) -> dict[str, Any]:
+        raw = asdict(self)
+        # common fields take precedence in case of name clash
+        return {**raw.pop("data"), **raw}
+
+    @classmethod
+    def from_dict(cls, raw: dict[str, Any]) -> BuildEvent:
+        known = {f.name for f in fields(cls)} - {"data"}
+
+        return cls(
+            **{k: v for k, v in raw.items() if k in known},
+            data={k: v for k, v in raw.items() if k not in known},
+        )
+
+
+class EventLog:
+    """Appends events of one run to <directory>/<run_id>.jsonl"""
+
+    def __init__(
+        self, directory: Path, run_id: str, build_number: Optional[int] = None, branch: Optional[str] = None
+    ) -> None:
+        self.run_id = run_id
+        self.build_number = build_number
+        self.branch = branch
+
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f"{run_id}.jsonl"
+
+        self._lock = threading.Lock()
+        self._file: Optional[IO[str]] = self.path.open("a", encoding="utf-8")
+        # emitted events are also kept in memory for end of run reports
+        self._events: list[BuildEvent] = []
+
+    def emit(self, event: str, **kwargs: Any) -> BuildEvent:
+        common = {name: kwargs.pop(name) for name in ("stage", "target", "duration", "status") if name in kwargs}
+
+        build_event = BuildEvent(
+            event=event,
+            ts=time.time(),
+            run_id=self.run_id,
+            build_number=self.build_number,
+            branch=self.branch,
+            data=kwargs,
+            **common,
+        )
+        line = json.dumps(build_event.as_dict(), default=str)
+
+        with self._lock:
+            self._events.append(build_event)
+
+            if self._file is not None:
+                self._file.write(f"{line}\n")
+                # events are rare and are most useful when run dies, do not keep them in buffer
+                self._file.flush()
+
+        return build_event
+
+    @property
+    def events(self) -> list[BuildEvent]:
+        with self._lock:
+            return list(self._events)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_event_log: Optional[EventLog] = None
+
+
+def set_event_log(event_log: Optional[EventLog]) -> None:
+    global _event_log
+
+    _event_log = event_log
+
+
+def run_id() -> Optional[str]:
+    """Id of current run if event log is set up"""
+
+    return None if _event_log is None else _event_log.run_id
+
+
+def recorded_events() -> list[BuildEvent]:
+    """Events emitted so far in current run"""
+
+    return [] if _event_log is None else _event_log.events
+
+
+def emit(event: str, **kwargs: Any) -> None:
+    """Record event in current run log, does nothing if there is none"""
+
+    if (event_log := _event_log) is not None:
+        event_log.emit(event, **kwargs)
+
+
+@contextlib.contextmanager
+def stage(name: str, target: Optional[str] = None, **kwargs: Any) -> Iterator[None]:
+    """Record start and end of pipeline stage along with its duration and outcome, also traced as a span"""
+
+    emit("stage_start", stage=name, target=target, **kwargs)
+    start = time.monotonic()
+
+    try:
+        with tracing.span(name if target is None else f"{name} {target}", stage=name, target=target, **kwargs):
+            yield
+    except BaseException as e:
+        duration = time.monotonic() - start
+        emit("stage_end", stage=name, target=target, duration=duration, status="failed", error=str(e), **kwargs)
+        raise
+
+    emit("stage_end", stage=name, target=target, duration=time.monotonic() - start, status="ok", **kwargs)
+
+
+def read_events(path: Path) -> list[BuildEvent]:
+    """Load events of a single run, tolerating truncated last line of interrupted run"""
+
+    events = []
+
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                raw = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            events.append(BuildEvent.from_dict(raw))
+
+    return events
+
+
+def list_runs(directory: Path) -> list[Path]:
+    """Event files of all recorded runs, oldest first"""
+
+    if not directory.is_dir():
+        return []
+
+    return sorted(directory.glob("*.jsonl"), key=lambda path: path.stat().st_mtime)
@@ -25,3 +25,26 @@ class BuildFailedError(BaseError):
 class MissingLicenseFileError(BaseError):
     def __init__(self, path: Path) -> None:
         super().__init__(f"License file couldn't be found in set directory {path}")
+
+
+class ProcessTimeoutError(BaseError):
+    def __init__(self, reason: str) -> None:
+        super().__init__(f"Process considered hung: {reason}")
+
+
+class WorkerFailedError(BaseError):
+    def __init__(self, worker: str, target: str, reason: str) -> None:
+        super().__init__(f"Worker {worker} failed building {target}: {reason}")
+
+
+class UploadVerificationError(BaseError):
+    def __init__(self, path: str, expected: int, actual: int) -> None:
+        super().__init__(f"Uploaded {path} has {actual} bytes instead of {expected}")
+
+
+class BuildVerificationError(BaseError):
+    def __init__(self, target: str, problems: list[str]) -> None:
+        shown = "; ".join(problems[:5])
+        more = f" and {len(problems) - 5} more" if len(problems) > 5 else ""
+
+        super().__init__(f"Verification of {target} failed: {shown}{more}")
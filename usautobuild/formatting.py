@@ -0,0 +1,33 @@
+import time
+
+from collections.abc import Sequence
+
+__all__ = (
+    "format_seconds",
+    "format_size",
+    "format_table",
+)
+
+
+def format_seconds(seconds: float) -> str:
+    return time.strftime("%H:%M:%S", time.gmtime(seconds)) if seconds >= 60 else f"{seconds:.1f}s"
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size:.0f} {unit}"
+
+        size /= 1024
+
+    return f"{size:.1f} TiB"
+
+
+def format_table(rows: Sequence[Sequence[str]]) -> str:
+    """Plain text table suitable for logging, first row is header and every column is as wide as its widest cell"""
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths, strict=True)).rstrip() for row in rows
+    )
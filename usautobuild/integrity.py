@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+import zipfile
+import zlib
+
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional, Union
+
+from .utils import atomic_write
+
+__all__ = (
+    "FileDigest",
+    "Manifest",
+    "StreamDigest",
+    "build_manifest",
+    "check_layout",
+    "hash_file",
+    "manifest_path",
+    "sidecar_line",
+    "verify_archive",
+)
+
+_MANIFEST_VERSION = 1
+# hashlib and zlib release GIL for buffers this large, threads hash in parallel
+_CHUNK = 8 * 1024 * 1024
+
+
+class StreamDigest:
+    """
+    SHA-256 and size of data fed block by block.
+
+    Meant to be upload callback so that data is hashed from the same buffers that are sent, without reading file
+    again.
+    """
+
+    def __init__(self) -> None:
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def update(self, data: Union[bytes, memoryview]) -> None:
+        self._sha256.update(data)
+        self.size += len(data)
+
+    @property
+    def hexdigest(self) -> str:
+        return self._sha256.hexdigest()
+
+
+def sidecar_line(hexdigest: str, name: str) -> bytes:
+    """Contents of .sha256 file in sha256sum format, checkable with sha256sum -c"""
+
+    return f"{hexdigest}  {name}\n".encode()
+
+
+@dataclass(frozen=True)
+class FileDigest:
+    size: int
+    sha256: str
+    # same checksum zip stores for every member, lets archives be checked against manifest
+    crc32: int
+
+
+def hash_file(path: Path) -> FileDigest:
+    """SHA-256 and CRC-32 of file read through memory map in one pass"""
+
+    with path.open("rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        sha256 = hashlib.sha256()
+        crc32 = 0
+
+        # empty files can not be mapped
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                if hasattr(mapped, "madvise"):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+
+                for offset in range(0, size, _CHUNK):
+                    with view[offset : offset + _CHUNK] as chunk:
+                        sha256.update(chunk)
+                        crc32 = zlib.crc32(chunk, crc32)
+
+    return FileDigest(size, sha256.hexdigest(), crc32)
+
+
+@dataclass
+class Manifest:
+    """Digests of every file of build folder of a target, keyed by posix path relative to it"""
+
+    target: str
+    files: dict[str, FileDigest]
+
+    @property
+    def size(self) -> int:
+        return sum(digest.size for digest in self.files.values())
+
+    def write(self, path: Path) -> None:
+        """Replace manifest file atomically"""
+
+        raw = {
+            "version": _MANIFEST_VERSION,
+            "target": self.target,
+            "files": {name: asdict(digest) for name, digest in sorted(self.files.items())},
+        }
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_write(path) as f:
+            json.dump(raw, f, indent=1)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional[Manifest]:
+        """Manifest from file, None if it is missing or unreadable"""
+
+        try:
+            raw = json.loads(path.read_text())
+            if raw.get("version") != _MANIFEST_VERSION:
+                return None
+
+            return cls(raw["target"], {name: FileDigest(**digest) for name, digest in raw["files"].items()})
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+
+def manifest_path(output_dir: Path, target: str) -> Path:
+    return output_dir / f"{target}.manifest.json"
+
+
+def build_manifest(target: str, root: Path, workers: Optional[int] = None) -> Manifest:
+    """Hash every file under root in parallel threads"""
+
+    files = [path for path in root.rglob("*") if path.is_file()]
+    # biggest files first so that one of them does not end up last and alone
+    sizes = {path: path.stat().st_size for path in files}
+    files.sort(key=sizes.__getitem__, reverse=True)
+
+    with ThreadPoolExecutor(workers) as pool:
+        digests = list(pool.map(hash_file, files))
+
+    names = [path.relative_to(root).as_posix() for path in files]
+
+    return Manifest(target, dict(zip(names, digests, strict=True)))
+
+
+def check_layout(root: Path, required: Iterable[str]) -> list[str]:
+    """Problems with build folder: missing required paths relative to root or no files at all"""
+
+    if not root.is_dir():
+        return [f"{root} does not exist"]
+
+    problems = [f"{name} is missing" for name in required if not (root / name).exists()]
+
+    if not any(path.is_file() for path in root.rglob("*")):
+        problems.append(f"{root} has no files")
+
+    return problems
+
+
+def _read_members(archive: Path, names: list[str]) -> list[str]:
+    problems = []
+
+    with zipfile.ZipFile(archive) as zf:
+        for name in names:
+            try:
+                # member CRC is checked once it is read to the end
+                with zf.open(name) as member:
+                    while member.read(_CHUNK):
+                        pass
+            except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                problems.append(f"{name}: {e}")
+
+    return problems
+
+
+def verify_archive(archive: Path, manifest: Manifest, workers: Optional[int] = None) -> list[str]:
+    """
+    Problems with zip of build folder: entries differing from manifest or corrupt data.
+
+    Member sizes and CRCs from zip directory are compared with manifest first, then every member is decompressed
+    by parallel threads each reading the archive through its own handle.
+    """
+
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            infos = [info for info in zf.infolist() if not info.is_dir()]
+    except (OSError, zipfile.BadZipFile) as e:
+        return [f"{archive}: {e}"]
+
+    members = {info.filename.removeprefix("./"): info for info in infos}
+    problems = [f"{name} is missing in archive" for name in manifest.files.keys() - members.keys()]
+    problems += [f"{name} is not in manifest" for name in members.keys() - manifest.files.keys()]
+
+    for name, info in members.items():
+        if (digest := manifest.files.get(name)) is None:
+            continue
+
+        if digest.size != info.file_size or digest.crc32 != info.CRC:
+            problems.append(f"{name} differs from manifest")
+
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    # largest members spread over workers round robin
+    names = [info.filename for info in sorted(infos, key=lambda info: info.file_size, reverse=True)]
+    batches = [names[i::workers] for i in range(workers) if names[i::workers]]
+
+    with ThreadPoolExecutor(workers) as pool:
+        for batch_problems in pool.map(_read_members, [archive] * len(batches), batches):
+            problems += batch_problems
+
+    return sorted(problems)
@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import argparse
 import collections
+import contextlib
 import datetime
 import logging
 import queue
@@ -15,11 +16,14 @@ import time
 
 from logging import handlers
 from pathlib import Path
-from typing import Any, ClassVar, Optional
-
-import requests
+from typing import TYPE_CHECKING, Any, ClassVar, Optional
 
+from .batching import MessageBatcher
 from .config import Config
+from .events import EventLog, set_event_log
+
+if TYPE_CHECKING:
+    import requests
 
 log = logging.getLogger("usautobuild")
 
@@ -46,18 +50,27 @@ class LogLevel:
 
 
 class Logger:
-    """Simple logger context. NOTE: it is not reusable despite being context"""
+    """
+    Simple logger context. NOTE: it is not reusable despite being context
+
+    Stream and file output happens in a background listener thread so logging calls only pay for putting record into
+    queue. Everything queued is written out on exit.
+    """
 
     __logger_initialized = False
 
     __slots__ = (
         "_level",
         "_discord_handler",
+        "_listener",
+        "_event_log",
     )
 
     def __init__(self, level: int) -> None:
         self._level = level
         self._discord_handler: Optional[BufferedDiscordHandler] = None
+        self._listener: Optional[handlers.QueueListener] = None
+        self._event_log: Optional[EventLog] = None
 
     def __enter__(self) -> Logger:
         if Logger.__logger_initialized:
@@ -71,7 +84,6 @@ class Logger:
 
         sh = logging.StreamHandler(sys.stdout)
         sh.setFormatter(fmt)
-        log.addHandler(sh)
 
         log_path = Path("logs")
         log_path.mkdir(exist_ok=True)
@@ -82,14 +94,46 @@ class Logger:
             backupCount=7,
         )
         fh.setFormatter(fmt)
-        log.addHandler(fh)
+
+        records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+        log.addHandler(handlers.QueueHandler(records))
+
+        self._listener = handlers.QueueListener(records, sh, fh, respect_handler_level=True)
+        self._listener.start()
 
         return self
 
     def __exit__(self, *_args: Any) -> None:
+        if (event_log := self._event_log) is not None:
+            set_event_log(None)
+            event_log.close()
+
+        # discord handler might log something on stop, listener has to outlive it
         if (discord_logger := self._discord_handler) is not None:
             discord_logger.stop()
 
+        if (listener := self._listener) is not None:
+            # processes everything left in queue before returning
+            listener.stop()
+
+            for handler in listener.handlers:
+                handler.close()
+
+    def start_run(self, config: Config) -> None:
+        """Start event log of a new run, closing log of previous one"""
+
+        if (event_log := self._event_log) is not None:
+            event_log.close()
+
+        self._event_log = EventLog(
+            config.events_dir,
+            f"{config.build_number}-{datetime.datetime.now():%y%m%d%H%M%S}",
+            build_number=config.build_number,
+            branch=config.git_branch,
+        )
+        set_event_log(self._event_log)
+        log.debug("Recording events to %s", self._event_log.path)
+
     def configure(self, config: Config) -> None:
         """Configure complex loggers requiring config"""
 
@@ -198,104 +242,125 @@ class DicordFormatter(logging.Formatter):
 
 class BufferedDiscordHandler(logging.Handler):
     """
-    Sends messages to discord webhook respecting interval and trying to group messages of the same type within buffer
-    grace interval to reduce amount of requests.
+    Sends messages to discord webhook respecting rate limits and trying to group messages of the same type within
+    buffer grace interval to reduce amount of requests. Batches keep filling while waiting for rate limit.
+
+    Emitting never blocks: queue is bounded and records that do not fit are dropped and counted. With coalesce
+    overflow policy a single notice about skipped messages is sent in their place, after records queued before them.
     """
 
-    # minimum time between 2 webhooks
+    # time between 2 webhooks when discord does not send rate limit headers
     MIN_SEND_INTERVAL = 0.5
     # wait this long for additional messages to merge into one batch
     BUFFER_GRACE_TIME = 0.2
+    # records waiting to be sent, anything above is handled according to overflow policy
+    QUEUE_SIZE = 1000
+    # give up on message after being rate limited this many times in a row
+    MAX_RATE_LIMIT_RETRIES = 5
 
     DISCORD_MESSAGE_LEN_LIMIT = 2000
 
-    def __init__(self, url: str):
+    OVERFLOW_DROP = "drop"
+    OVERFLOW_COALESCE = "coalesce"
+
+    def __init__(self, url: str, overflow: str = OVERFLOW_COALESCE, queue_size: int = QUEUE_SIZE):
         super().__init__()
 
-        self._url = url
+        if overflow not in (self.OVERFLOW_DROP, self.OVERFLOW_COALESCE):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
 
-        self._queue: queue.SimpleQueue[Optional[logging.LogRecord]] = queue.SimpleQueue()
+        self._url = url
+        self._overflow = overflow
+        # keep-alive connection pool, only used from handler thread
+        # slow to import and only needed when discord is configured
+        import requests
+
+        self._session = requests.Session()
+        # earliest time next webhook can be sent according to rate limits
+        self._next_send_at = 0.0
+
+        self._overflow_lock = threading.Lock()
+        # total amount of dropped records
+        self.dropped = 0
+        # number of last queued record, emit runs under handler lock
+        self._queued = 0
+        # runs of dropped records not yet reported to discord: number of record they follow and their amount
+        self._drops: collections.deque[list[int]] = collections.deque()
+
+        self._queue: queue.Queue[Optional[tuple[int, logging.LogRecord]]] = queue.Queue(maxsize=queue_size)
         self._thread = threading.Thread(target=self._handler_loop, daemon=True)
         self._thread.start()
 
+    def _take_drops(self, after: Optional[int] = None) -> int:
+        """Amount of records dropped before record number after was handled, all if None"""
+
+        skipped = 0
+
+        with self._overflow_lock:
+            while self._drops and (after is None or self._drops[0][0] <= after):
+                skipped += self._drops.popleft()[1]
+
+        return skipped
+
     def _handler_loop(self) -> None:
+        batcher = MessageBatcher(self.DISCORD_MESSAGE_LEN_LIMIT, self.BUFFER_GRACE_TIME)
+
         # indicating magic value was consumed and we are exiting
         flushing = False
+        # for error reporting only
+        last_record: Optional[logging.LogRecord] = None
 
-        pending_sends: collections.deque[tuple[str, bool]] = collections.deque()
+        while True:
+            if flushing:
+                batcher.seal()
+            else:
+                batcher.seal_due()
 
-        pop_timeout: Optional[float] = None
-        last_pop = time.time()
+            now = time.monotonic()
+
+            if now >= self._next_send_at and (ready := batcher.pop_ready()) is not None:
+                message, malf = ready
+
+                try:
+                    self.send_message(message, malf=malf)
+                except Exception:
+                    if last_record is not None:
+                        self.handleError(last_record)
+                    # else:
+                    #     pray()
+                    self._next_send_at = time.monotonic() + self.MIN_SEND_INTERVAL
+
+                continue
+
+            if flushing:
+                if not batcher:
+                    break
+
+                time.sleep(max(0.0, self._next_send_at - now))
+                continue
+
+            # nothing to send yet: wait for more records until either rate limit or batch age allows sending
+            if batcher.has_ready:
+                pop_timeout: Optional[float] = max(0.0, self._next_send_at - now)
+            else:
+                # wait forever if there is nothing pending
+                pop_timeout = batcher.time_until_due()
 
-        while True:
             try:
-                if flushing:
-                    time.sleep(pop_timeout or 0)
-                else:
-                    record = self._queue.get(timeout=pop_timeout)
+                item = self._queue.get(timeout=pop_timeout)
             except queue.Empty:
-                # did not get anything during buffer grace period / send interval
-                if not pending_sends:
-                    continue
-            else:
-                # magic thread exit sentinel
-                if record is None:
-                    if not pending_sends:
-                        break
+                continue
 
-                    flushing = True
-                else:
-                    last_pop = time.time()
-                    pending_sends.append(
-                        (
-                            self.format(record),
-                            record.levelno >= logging.ERROR,
-                        )
-                    )
-            finally:
-                # wait forever by default
-                pop_timeout = None
-
-            message, malf = pending_sends.popleft()
-
-            # a hatch indicating current chunk is at message length limit or next chunk has other type
-            # if we do not send it we risk drowning in continuous log spam
-            must_send = False
-
-            # grab chunk of message if it exceeds message limit and put remaining part back
-            if len(message) > 2000:
-                must_send = True
-
-                pending_sends.appendleft((message[self.DISCORD_MESSAGE_LEN_LIMIT :], malf))
-                message = message[: self.DISCORD_MESSAGE_LEN_LIMIT]
+            # magic thread exit sentinel
+            if item is None:
+                flushing = True
+                number = None
             else:
-                # try merging messages until we hit differet type or length limit
-                while pending_sends:
-                    next_message, next_malf = pending_sends.popleft()
-                    # cannot merge because of different type or exceeded length, put back without modification
-                    if next_malf != malf or len(message) + len(next_message) + 1 > self.DISCORD_MESSAGE_LEN_LIMIT:
-                        must_send = True
-
-                        pending_sends.appendleft((next_message, next_malf))
-                        break
-
-                    message = f"{message}\n{next_message}"
-
-            # not forced to send yet and within buffer grace period -- pack things up and try one more time
-            if not must_send and (remaining_buffer_grace := self.BUFFER_GRACE_TIME - (time.time() - last_pop)) > 0:
-                pending_sends.appendleft((message, malf))
-                pop_timeout = remaining_buffer_grace
-                continue
+                number, last_record = item
+                batcher.add(self.format(last_record), last_record.levelno >= logging.ERROR)
 
-            try:
-                self.send_message(message, malf=malf)
-            except Exception:
-                if record is not None:
-                    self.handleError(record)
-                # else:
-                #     pray()
-            finally:
-                pop_timeout = self.MIN_SEND_INTERVAL
+            if skipped := self._take_drops(number):
+                batcher.add(f"\N{WARNING SIGN} skipped {skipped} messages because of log flood")
 
     def send_message(self, message: str, malf: bool = False) -> bool:
         wh_data = {
@@ -309,13 +374,60 @@ class BufferedDiscordHandler(logging.Handler):
         else:
             wh_data["avatar_url"] = "https://i.redd.it/xomd902beh311.png"
 
-        resp = requests.post(self._url, json=wh_data, timeout=10)
+        for _ in range(self.MAX_RATE_LIMIT_RETRIES + 1):
+            resp = self._session.post(self._url, json=wh_data, timeout=10)
+            self._next_send_at = time.monotonic() + self.rate_limit_delay(resp)
+
+            if resp.status_code != 429:
+                return resp.status_code == 204
+
+            time.sleep(max(0.0, self._next_send_at - time.monotonic()))
+
+        return False
+
+    @classmethod
+    def rate_limit_delay(cls, resp: requests.Response) -> float:
+        """How long to wait before next request according to response"""
 
-        return resp.status_code == 204
+        if resp.status_code == 429:
+            retry_after: Any = resp.headers.get("Retry-After", cls.MIN_SEND_INTERVAL)
+            # body value is more precise, header is rounded up to seconds
+            with contextlib.suppress(ValueError, AttributeError):
+                retry_after = resp.json().get("retry_after", retry_after)
+
+            return float(retry_after)
+
+        remaining = resp.headers.get("X-RateLimit-Remaining")
+        reset_after = resp.headers.get("X-RateLimit-Reset-After")
+
+        if remaining is None or reset_after is None:
+            return cls.MIN_SEND_INTERVAL
+
+        # spread remaining requests evenly over the rest of the bucket window
+        return float(reset_after) / (int(remaining) + 1)
 
     def emit(self, record: logging.LogRecord) -> None:
-        self._queue.put(record)
+        try:
+            self._queue.put_nowait((self._queued + 1, record))
+            self._queued += 1
+        except queue.Full:
+            with self._overflow_lock:
+                self.dropped += 1
+
+                if self._overflow != self.OVERFLOW_COALESCE:
+                    return
+                if self._drops and self._drops[-1][0] == self._queued:
+                    self._drops[-1][1] += 1
+                else:
+                    self._drops.append([self._queued, 1])
 
     def stop(self) -> None:
+        # handler thread keeps draining queue so this blocks only until there is room for sentinel
         self._queue.put(None)
         self._thread.join()
+        self._session.close()
+
+        if self.dropped:
+            log.warning(
+                "Discord handler dropped %s messages because of log flood", self.dropped, extra={"discord": False}
+            )
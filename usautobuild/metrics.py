@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import re
+
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from .events import BuildEvent
+from .utils import atomic_write
+
+__all__ = (
+    "MetricsRegistry",
+    "metrics_from_events",
+    "write_textfile",
+)
+
+_PREFIX = "usautobuild"
+
+Labels = tuple[tuple[str, str], ...]
+
+# name{label="value",...} value
+_SAMPLE_LINE = re.compile(r"^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(?P<labels>.*)\})? (?P<value>\S+)$")
+_LABEL_PAIR = re.compile(r'(?P<key>[a-zA-Z_][a-zA-Z0-9_]*)="(?P<value>(?:[^"\\]|\\.)*)"')
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\(.)", lambda m: "\n" if m[1] == "n" else m[1], value)
+
+
+@dataclass
+class _Family:
+    type: str
+    help: str
+    samples: dict[Labels, float] = field(default_factory=dict)
+
+
+class MetricsRegistry:
+    """Metric families with labelled samples rendered in prometheus text format"""
+
+    def __init__(self) -> None:
+        self._families: dict[str, _Family] = {}
+
+    def declare(self, name: str, type_: str, help_: str) -> None:
+        if name not in self._families:
+            self._families[name] = _Family(type_, help_)
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        self._families[name].samples[self._labels(labels)] = value
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        samples = self._families[name].samples
+        key = self._labels(labels)
+        samples[key] = samples.get(key, 0) + value
+
+    def get(self, name: str, **labels: str) -> Optional[float]:
+        return self._families[name].samples.get(self._labels(labels))
+
+    @staticmethod
+    def _labels(labels: dict[str, str]) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def load_counters(self, text: str) -> None:
+        """Continue declared counters from previously rendered file, textfile has to be the only storage for them"""
+
+        for line in text.splitlines():
+            if (match := _SAMPLE_LINE.match(line)) is None:
+                continue
+
+            if (family := self._families.get(match["name"])) is None or family.type != "counter":
+                continue
+
+            labels = {pair["key"]: _unescape(pair["value"]) for pair in _LABEL_PAIR.finditer(match["labels"] or "")}
+            try:
+                self.inc(match["name"], float(match["value"]), **labels)
+            except ValueError:
+                continue
+
+    def render(self) -> str:
+        lines = []
+
+        for name, family in self._families.items():
+            if not family.samples:
+                continue
+
+            lines.append(f"# HELP {name} {family.help}")
+            lines.append(f"# TYPE {name} {family.type}")
+
+            for labels, value in family.samples.items():
+                if labels:
+                    rendered_labels = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                    lines.append(f"{name}{{{rendered_labels}}} {value:g}")
+                else:
+                    lines.append(f"{name} {value:g}")
+
+        return "".join(f"{line}\n" for line in lines)
+
+
+def _declare_build_metrics(registry: MetricsRegistry) -> None:
+    for name, type_, help_ in (
+        ("runs_total", "counter", "Finished runs by outcome"),
+        ("run_success", "gauge", "Whether last run succeeded"),
+        ("run_timestamp_seconds", "gauge", "When last run finished"),
+        ("build_number", "gauge", "Build number of last run"),
+        ("stage_duration_seconds", "gauge", "Duration of pipeline stages in last run"),
+        ("stage_failures_total", "counter", "Failed pipeline stages"),
+        ("build_phase_duration_seconds", "gauge", "Unity editor phase durations parsed from build log"),
+        ("build_size_bytes", "gauge", "Player build size reported by unity"),
+        ("archive_size_bytes", "gauge", "Size of build archives"),
+        ("upload_bytes", "gauge", "Bytes uploaded to CDN in last run"),
+        ("upload_duration_seconds", "gauge", "Time spent uploading to CDN in last run"),
+        ("upload_throughput_bytes_per_second", "gauge", "Average CDN upload throughput in last run"),
+        ("upload_connection_throughput_bytes_per_second", "gauge", "Average upload throughput of CDN connection"),
+        ("cache_hit_ratio", "gauge", "Share of cache lookups that were hits in last run"),
+        ("docker_image_size_bytes", "gauge", "Uncompressed local size of docker images pushed in last run"),
+        ("process_cpu_seconds", "gauge", "User and system CPU time of external commands in last run"),
+        ("process_peak_rss_bytes", "gauge", "Peak resident memory of external commands in last run"),
+    ):
+        registry.declare(f"{_PREFIX}_{name}", type_, help_)
+
+
+def metrics_from_events(events: Iterable[BuildEvent], previous: str = "") -> MetricsRegistry:
+    """
+    Aggregate events of a single run into metrics. Counters continue from previous textfile contents if given.
+    """
+
+    registry = MetricsRegistry()
+    _declare_build_metrics(registry)
+    registry.load_counters(previous)
+
+    def name(metric: str) -> str:
+        return f"{_PREFIX}_{metric}"
+
+    # totals summed over the run before being turned into samples
+    uploads: dict[str, list[float]] = {}
+    connections: dict[str, list[float]] = {}
+    cache_lookups: dict[str, list[float]] = {}
+    # all events of a run share branch
+    branch = ""
+
+    for event in events:
+        branch = event.branch or ""
+        target = event.target or ""
+
+        if event.build_number is not None:
+            registry.set(name("build_number"), event.build_number, branch=branch)
+
+        if event.event == "stage_end" and event.duration is not None:
+            if event.stage == "run":
+                success = event.status == "ok"
+                registry.inc(name("runs_total"), branch=branch, status=event.status or "")
+                registry.set(name("run_success"), float(success), branch=branch)
+                registry.set(name("run_timestamp_seconds"), event.ts, branch=branch)
+
+            registry.set(
+                name("stage_duration_seconds"), event.duration, branch=branch, stage=event.stage or "", target=target
+            )
+            if event.status != "ok":
+                registry.inc(name("stage_failures_total"), branch=branch, stage=event.stage or "", target=target)
+
+        elif event.event == "build_phases":
+            for phase, timing in event.data.get("phases", {}).items():
+                registry.set(
+                    name("build_phase_duration_seconds"), timing["duration"], branch=branch, target=target, phase=phase
+                )
+            if (build_size := event.data.get("build_size")) is not None:
+                registry.set(name("build_size_bytes"), build_size, branch=branch, target=target)
+
+        elif event.event == "archive":
+            registry.set(name("archive_size_bytes"), event.data["bytes"], branch=branch, target=target)
+
+        elif event.event == "upload":
+            totals = uploads.setdefault(target, [0.0, 0.0])
+            totals[0] += event.data.get("bytes", 0)
+            totals[1] += event.duration or 0.0
+
+            if (connection := event.data.get("connection")) is not None:
+                totals = connections.setdefault(str(connection), [0.0, 0.0])
+                totals[0] += event.data.get("bytes", 0)
+                totals[1] += event.duration or 0.0
+
+        elif event.event == "cache":
+            counts = cache_lookups.setdefault(event.data["cache"], [0.0, 0.0])
+            counts[0] += event.data.get("hits", 0)
+            counts[1] += event.data.get("lookups", 0)
+
+        elif event.event == "docker_image":
+            registry.set(name("docker_image_size_bytes"), event.data["bytes"], branch=branch, tag=str(event.data["tag"]))
+
+        elif event.event == "process":
+            label = str(event.data.get("label", ""))
+            cpu = event.data.get("user_time", 0) + event.data.get("system_time", 0)
+            registry.set(name("process_cpu_seconds"), cpu, branch=branch, command=label)
+            registry.set(name("process_peak_rss_bytes"), event.data.get("peak_rss", 0), branch=branch, command=label)
+
+    for target, (uploaded, duration) in uploads.items():
+        registry.set(name("upload_bytes"), uploaded, branch=branch, target=target)
+        registry.set(name("upload_duration_seconds"), duration, branch=branch, target=target)
+        if duration > 0:
+            registry.set(name("upload_throughput_bytes_per_second"), uploaded / duration, branch=branch, target=target)
+
+    for connection, (uploaded, duration) in connections.items():
+        if duration > 0:
+            registry.set(
+                name("upload_connection_throughput_bytes_per_second"),
+                uploaded / duration,
+                branch=branch,
+                connection=connection,
+            )
+
+    for cache, (hits, lookups) in cache_lookups.items():
+        if lookups:
+            registry.set(name("cache_hit_ratio"), hits / lookups, branch=branch, cache=cache)
+
+    return registry
+
+
+def write_textfile(path: Path, registry: MetricsRegistry) -> None:
+    """Atomically replace textfile so node_exporter never reads half written file"""
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # textfile collector runs as different user
+    with atomic_write(path, permissions=0o644) as f:
+        f.write(registry.render())
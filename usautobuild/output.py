@@ -0,0 +1,170 @@
+import codecs
+import collections
+import logging
+import tempfile
+
+from pathlib import Path
+from typing import IO, Optional
+
+__all__ = (
+    "BoundedCapture",
+    "LineSplitter",
+    "is_level_handled",
+)
+
+
+class LineSplitter:
+    """
+    Incrementally turns raw byte chunks into decoded lines.
+
+    Bytes are buffered until a newline arrives so multibyte characters split between chunks are never decoded
+    halfway. Invalid bytes are replaced instead of raising because process output is not under our control.
+    """
+
+    __slots__ = (
+        "_buffer",
+        "_decoder",
+    )
+
+    def __init__(self, encoding: str = "utf-8", errors: str = "replace") -> None:
+        self._buffer = bytearray()
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+
+    def feed(self, data: bytes) -> list[str]:
+        """Add chunk to buffer and return all complete lines"""
+
+        self._buffer += data
+
+        if (end := self._buffer.rfind(b"\n")) == -1:
+            return []
+
+        text = self._decoder.decode(self._buffer[:end])
+        del self._buffer[: end + 1]
+
+        return text.split("\n")
+
+    def flush(self) -> list[str]:
+        """Return whatever is left in buffer as a final line, if anything"""
+
+        text = self._decoder.decode(self._buffer, final=True)
+        self._buffer.clear()
+
+        return [text] if text else []
+
+
+class BoundedCapture:
+    """
+    Keeps tail of a line stream in memory limited by both line count and total characters.
+
+    Once anything has to be evicted full stream is spilled to a temporary file (if enabled) starting with lines still
+    in memory, so nothing is lost while memory usage stays flat. File is kept on disk after close for inspection,
+    discard removes it.
+    """
+
+    __slots__ = (
+        "max_lines",
+        "max_chars",
+        "dropped",
+        "spill_path",
+        "_lines",
+        "_chars",
+        "_spill",
+        "_spill_file",
+    )
+
+    def __init__(self, max_lines: int = 200, max_chars: int = 64 * 1024, spill: bool = True) -> None:
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self.dropped = 0
+        self.spill_path: Optional[Path] = None
+
+        self._lines: collections.deque[str] = collections.deque()
+        self._chars = 0
+        self._spill = spill
+        self._spill_file: Optional[IO[str]] = None
+
+    def append(self, line: str) -> None:
+        if self._spill_file is not None:
+            self._spill_file.write(f"{line}\n")
+
+        self._lines.append(line)
+        self._chars += len(line)
+
+        while len(self._lines) > self.max_lines or (self._chars > self.max_chars and len(self._lines) > 1):
+            if self._spill and self._spill_file is None:
+                self._start_spill()
+
+            self._chars -= len(self._lines.popleft())
+            self.dropped += 1
+
+    def extend(self, lines: list[str]) -> None:
+        for line in lines:
+            self.append(line)
+
+    def _start_spill(self) -> None:
+        self._spill_file = tempfile.NamedTemporaryFile(
+            "w",
+            prefix="usautobuild-",
+            suffix=".log",
+            encoding="utf-8",
+            delete=False,
+        )
+        self.spill_path = Path(self._spill_file.name)
+
+        for line in self._lines:
+            self._spill_file.write(f"{line}\n")
+
+    @property
+    def lines(self) -> list[str]:
+        return list(self._lines)
+
+    def close(self) -> None:
+        """Finish writing spill file, keeping it on disk"""
+
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def discard(self) -> None:
+        """Close and remove spill file along with memory buffer"""
+
+        self.close()
+
+        if self.spill_path is not None:
+            self.spill_path.unlink(missing_ok=True)
+            self.spill_path = None
+
+        self._lines.clear()
+        self._chars = 0
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+
+def is_level_handled(logger: logging.Logger, level: int) -> bool:
+    """
+    Check if any handler will accept record of given level.
+
+    Cheaper alternative to formatting records nobody is going to see. Mirrors Logger.callHandlers traversal.
+    """
+
+    if not logger.isEnabledFor(level):
+        return False
+
+    found_handlers = False
+    current: Optional[logging.Logger] = logger
+    while current is not None:
+        for handler in current.handlers:
+            found_handlers = True
+            if level >= handler.level:
+                return True
+
+        if not current.propagate:
+            break
+
+        current = current.parent
+
+    if found_handlers:
+        return False
+
+    return logging.lastResort is not None and level >= logging.lastResort.level
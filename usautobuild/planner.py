@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import heapq
+import statistics
+
+from collections import defaultdict
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from .config import Config
+from .events import BuildEvent, list_runs, read_events
+from .formatting import format_seconds, format_table
+
+__all__ = (
+    "CACHES",
+    "RESOURCES",
+    "History",
+    "PlanStage",
+    "Schedule",
+    "build_plan",
+    "default_limits",
+    "format_plan",
+    "simulate",
+)
+
+# stages of the same resource compete for its concurrency limit
+RESOURCES = ("git", "build", "verify", "good_files", "archive", "upload", "docker", "api")
+# docker_pull: image is not pulled before build, good_files: good files of the tag were already uploaded
+CACHES = ("docker_pull", "good_files")
+
+# seconds, used for stages never seen in history
+_DEFAULT_ESTIMATES = {
+    "gitting": 60.0,
+    "build": 900.0,
+    "pull": 120.0,
+    "verify": 20.0,
+    "good_files": 300.0,
+    "archive": 60.0,
+    "upload": 120.0,
+    "dockering": 300.0,
+    "changelog": 10.0,
+}
+_IL2CPP_FACTOR = 2.0
+
+
+@dataclass(frozen=True)
+class PlanStage:
+    """Node of pipeline DAG with expected duration under cache assumptions"""
+
+    name: str
+    resource: str
+    duration: float
+    target: Optional[str] = None
+    deps: tuple[str, ...] = ()
+    # where estimate came from: history or default
+    source: str = "default"
+
+    @property
+    def key(self) -> str:
+        return self.name if self.target is None else f"{self.name} {self.target}"
+
+
+@dataclass
+class History:
+    """Durations of stages and cache hit rates of recorded runs"""
+
+    runs: int = 0
+    durations: dict[tuple[str, Optional[str]], list[float]] = field(default_factory=lambda: defaultdict(list))
+    cache_hits: dict[str, list[int]] = field(default_factory=lambda: defaultdict(lambda: [0, 0]))
+
+    @classmethod
+    def load(cls, events_dir: Path, limit: int) -> History:
+        """History of last limit runs, runs without any finished stage do not count"""
+
+        history = cls()
+        for path in list_runs(events_dir)[-limit:]:
+            history.add_run(read_events(path))
+
+        return history
+
+    def add_run(self, events: Iterable[BuildEvent]) -> None:
+        found = False
+
+        for event in events:
+            if (key := self._duration_key(event)) is not None and event.duration is not None:
+                self.durations[key].append(event.duration)
+                found = True
+            elif event.event == "cache" and (cache := event.data.get("cache")) in CACHES:
+                counts = self.cache_hits[cache]
+                counts[0] += int(event.data.get("hits", 0))
+                counts[1] += int(event.data.get("lookups", 0))
+
+        self.runs += found
+
+    @staticmethod
+    def _duration_key(event: BuildEvent) -> Optional[tuple[str, Optional[str]]]:
+        if event.event == "stage_end" and event.status == "ok" and event.stage is not None:
+            return event.stage, event.target
+
+        # per target verification, archives and uploads happen inside of verifying and uploading stages
+        per_target = event.event in ("verify", "archive", "upload") and event.target is not None
+        if per_target and "good_files" not in event.data:
+            return event.event, event.target
+
+        label = str(event.data.get("label", ""))
+        if event.event == "process" and event.status == "0" and label.startswith("pull "):
+            return "pull", label.removeprefix("pull ")
+
+        return None
+
+    def estimate(self, name: str, target: Optional[str] = None) -> Optional[float]:
+        """Median duration of stage of target, falls back to other targets"""
+
+        if samples := self.durations.get((name, target)):
+            return statistics.median(samples)
+
+        if samples := [sample for (stage, _), samples in self.durations.items() if stage == name for sample in samples]:
+            return statistics.median(samples)
+
+        return None
+
+    def hit_rate(self, cache: str) -> Optional[float]:
+        hits, lookups = self.cache_hits.get(cache, (0, 0))
+
+        return hits / lookups if lookups else None
+
+
+def build_plan(config: Config, history: History, cache_hits: Mapping[str, float]) -> list[PlanStage]:
+    """Stages _run_pipeline executes for config in the order it executes them"""
+
+    def estimate(name: str, target: Optional[str] = None) -> tuple[float, str]:
+        if (value := history.estimate(name, target)) is not None:
+            return value, "history"
+
+        default = _DEFAULT_ESTIMATES[name]
+        if name == "build" and target == "linuxserver":
+            default *= _IL2CPP_FACTOR
+
+        return default, "default"
+
+    targets = list(config.target_platforms)
+    upload = not config.dry_run
+    duration, source = estimate("gitting")
+    stages = [PlanStage("gitting", "git", duration, source=source)]
+
+    pull_miss = 1 - cache_hits.get("docker_pull", 0.0)
+    for target in targets:
+        build, source = estimate("build", target)
+        # recorded builds include pull with hit rate of their time, estimate is adjusted to the assumed one
+        pull, _ = estimate("pull", target)
+        recorded_miss = 1 - (history.hit_rate("docker_pull") or 0.0) if source == "history" else 1.0
+        editor = max(0.0, build - recorded_miss * pull)
+
+        stages.append(PlanStage("build", "build", editor + pull_miss * pull, target, ("gitting",), source))
+
+    for target in targets:
+        duration, source = estimate("verify", target)
+        stages.append(PlanStage("verify", "verify", duration, target, (f"build {target}",), source))
+
+    if config.do_good_files:
+        duration, source = estimate("good_files")
+        deps = tuple(f"verify {target}" for target in targets if target != "linuxserver")
+        duration *= 1 - cache_hits.get("good_files", 0.0)
+        stages.append(PlanStage("good_files", "good_files", duration, None, deps or ("gitting",), source))
+
+    if upload:
+        for target in targets:
+            duration, source = estimate("archive", target)
+            stages.append(PlanStage("archive", "archive", duration, target, (f"verify {target}",), source))
+        for target in targets:
+            duration, source = estimate("upload", target)
+            stages.append(PlanStage("upload", "upload", duration, target, (f"archive {target}",), source))
+
+        if "linuxserver" in targets:
+            duration, source = estimate("dockering")
+            stages.append(PlanStage("dockering", "docker", duration, None, ("verify linuxserver",), source))
+
+    if config.release:
+        deps = tuple(stage.key for stage in stages if stage.name in ("upload", "dockering")) or ("gitting",)
+        duration, source = estimate("changelog")
+        stages.append(PlanStage("changelog", "api", duration, None, deps, source))
+
+    return stages
+
+
+def default_limits(config: Config) -> dict[str, int]:
+    """Concurrency the pipeline could use without new hardware, one build per worker or a single local one"""
+
+    return {"build": max(1, len(config.build_workers)), "archive": 1, "upload": 1}
+
+
+@dataclass
+class Schedule:
+    """Simulated start and finish of every stage"""
+
+    start: dict[str, float]
+    finish: dict[str, float]
+    # stage whose finish let the stage start, either dependency or holder of its resource
+    blocker: dict[str, Optional[str]]
+
+    @property
+    def wall_time(self) -> float:
+        return max(self.finish.values(), default=0.0)
+
+    def critical_path(self) -> list[str]:
+        if not self.finish:
+            return []
+
+        path = [max(self.finish, key=lambda key: self.finish[key])]
+        while (blocker := self.blocker[path[-1]]) is not None:
+            path.append(blocker)
+
+        return path[::-1]
+
+
+def simulate(stages: list[PlanStage], limits: Mapping[str, int], serial: bool = False) -> Schedule:
+    """
+    List schedule stages respecting dependencies and concurrency limit of every resource, unlimited if not given.
+
+    Ready stages with longest path to the end start first. Serial runs stages one by one in plan order the way
+    _run_pipeline runs them now.
+    """
+
+    by_key = {stage.key: stage for stage in stages}
+    order = {stage.key: i for i, stage in enumerate(stages)}
+
+    dependants: dict[str, list[str]] = defaultdict(list)
+    for stage in stages:
+        for dep in stage.deps:
+            dependants[dep].append(stage.key)
+
+    # longest remaining path including stage itself
+    rank: dict[str, float] = {}
+    for stage in reversed(stages):
+        rank[stage.key] = stage.duration + max((rank[key] for key in dependants[stage.key]), default=0.0)
+
+    def lane(stage: PlanStage) -> str:
+        return "serial" if serial else stage.resource
+
+    def limit(resource: str) -> Optional[int]:
+        return 1 if serial else limits.get(resource)
+
+    def priority(key: str) -> tuple[float, int]:
+        return (order[key], 0) if serial else (-rank[key], order[key])
+
+    remaining = {stage.key: len(stage.deps) for stage in stages}
+    ready_since: dict[str, tuple[float, Optional[str]]] = {stage.key: (0.0, None) for stage in stages if not stage.deps}
+    running: list[tuple[float, int, str]] = []
+    busy: dict[str, int] = defaultdict(int)
+    last_released: dict[str, Optional[str]] = {}
+
+    schedule = Schedule({}, {}, {})
+    now = 0.0
+
+    while ready_since or running:
+        for key in sorted(ready_since, key=priority):
+            resource = lane(by_key[key])
+            if (cap := limit(resource)) is not None and busy[resource] >= cap:
+                continue
+
+            became_ready, readied_by = ready_since.pop(key)
+            busy[resource] += 1
+            schedule.start[key] = now
+            # waited for resource longer than for its dependencies
+            schedule.blocker[key] = last_released.get(resource) if now > became_ready else readied_by
+            heapq.heappush(running, (now + by_key[key].duration, order[key], key))
+
+        if not running:
+            break
+
+        now, _, key = heapq.heappop(running)
+        finished = [key]
+        while running and running[0][0] == now:
+            finished.append(heapq.heappop(running)[2])
+
+        for key in finished:
+            schedule.finish[key] = now
+            resource = lane(by_key[key])
+            busy[resource] -= 1
+            last_released[resource] = key
+
+            for dependant in dependants[key]:
+                remaining[dependant] -= 1
+                if not remaining[dependant]:
+                    ready_since[dependant] = (now, key)
+
+    return schedule
+
+
+def format_plan(
+    stages: list[PlanStage],
+    history: History,
+    cache_hits: Mapping[str, float],
+    limits: Mapping[str, int],
+) -> str:
+    """Plain text plan with estimates, simulated wall times and critical path suitable for logging"""
+
+    serial = simulate(stages, limits, serial=True)
+    parallel = simulate(stages, limits)
+    by_key = {stage.key: stage for stage in stages}
+
+    rows = [("stage", "resource", "estimate", "source", "start", "finish")]
+    for stage in stages:
+        rows.append(
+            (
+                stage.key,
+                stage.resource,
+                format_seconds(stage.duration),
+                stage.source,
+                format_seconds(parallel.start[stage.key]),
+                format_seconds(parallel.finish[stage.key]),
+            )
+        )
+
+    table = format_table(rows)
+
+    def describe(values: Mapping[str, float], names: Iterable[str], unlimited: str) -> str:
+        return ", ".join(f"{name} {values[name]:g}" if name in values else f"{name} {unlimited}" for name in names)
+
+    critical = " -> ".join(f"{key} ({format_seconds(by_key[key].duration)})" for key in parallel.critical_path())
+
+    return "\n".join(
+        (
+            f"Estimates from {history.runs} recorded runs",
+            table,
+            f"Cache hit rates: {describe(cache_hits, CACHES, 'unknown')}",
+            f"Concurrency limits: {describe(limits, sorted({stage.resource for stage in stages}), 'unlimited')}",
+            f"Serial wall time (current pipeline): {format_seconds(serial.wall_time)}",
+            f"Simulated wall time: {format_seconds(parallel.wall_time)}",
+            f"Critical path: {critical}",
+        )
+    )
@@ -0,0 +1,26 @@
+__all__ = (
+    "exec_name",
+    "platform_image",
+    "platform_subtarget",
+)
+
+exec_name = {
+    "linuxserver": "Unitystation",
+    "StandaloneLinux64": "Unitystation",
+    "StandaloneWindows64": "Unitystation.exe",
+    "StandaloneOSX": "Unitystation.app",
+}
+
+platform_image = {
+    "linuxserver": "-linux-il2cpp-3.2.0",
+    "StandaloneLinux64": "-base-3.2.0",
+    "StandaloneWindows64": "-windows-mono-3.2.0",
+    "StandaloneOSX": "-mac-mono-3.2.0",
+}
+
+platform_subtarget = {
+    "linuxserver": "Server",
+    "StandaloneLinux64": "Player",
+    "StandaloneWindows64": "Player",
+    "StandaloneOSX": "Player",
+}
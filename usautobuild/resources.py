@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import logging
+import os
+import subprocess
+import sys
+import threading
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from .formatting import format_seconds, format_size, format_table
+
+__all__ = (
+    "ContainerSampler",
+    "ContainerUsage",
+    "ProcessUsage",
+    "UsageRecorder",
+    "format_usage_table",
+    "recorder",
+)
+
+log = logging.getLogger("usautobuild")
+
+# rusage block counters are in 512 byte units on linux
+_BLOCK_SIZE = 512
+
+# candidate cgroup locations for docker containers: systemd cgroup driver (v2), cgroupfs driver (v2) and v1 layouts
+_CGROUP_V2_DIRS = (
+    "/sys/fs/cgroup/system.slice/docker-{id}.scope",
+    "/sys/fs/cgroup/docker/{id}",
+)
+_CGROUP_V1_DIRS = (
+    ("memory", "/sys/fs/cgroup/memory/docker/{id}"),
+    ("cpuacct", "/sys/fs/cgroup/cpuacct/docker/{id}"),
+    ("blkio", "/sys/fs/cgroup/blkio/docker/{id}"),
+)
+
+
+@dataclass
+class ContainerUsage:
+    """Last known cgroup statistics of a container"""
+
+    cpu_time: float = 0.0
+    peak_memory: int = 0
+    read_bytes: int = 0
+    written_bytes: int = 0
+
+
+@dataclass
+class ProcessUsage:
+    """Resources consumed by one external command and all of its reaped children"""
+
+    label: str
+    wall_time: float
+    returncode: int
+    user_time: float = 0.0
+    system_time: float = 0.0
+    # in bytes
+    peak_rss: int = 0
+    read_bytes: int = 0
+    written_bytes: int = 0
+    container: Optional[ContainerUsage] = field(default=None)
+
+    @classmethod
+    def from_rusage(cls, label: str, wall_time: float, returncode: int, rusage: Any) -> ProcessUsage:
+        # linux reports maxrss in kilobytes, macos in bytes
+        rss_scale = 1 if sys.platform == "darwin" else 1024
+
+        return cls(
+            label=label,
+            wall_time=wall_time,
+            returncode=returncode,
+            user_time=rusage.ru_utime,
+            system_time=rusage.ru_stime,
+            peak_rss=rusage.ru_maxrss * rss_scale,
+            read_bytes=rusage.ru_inblock * _BLOCK_SIZE,
+            written_bytes=rusage.ru_oublock * _BLOCK_SIZE,
+        )
+
+
+def wait_with_rusage(cmd: subprocess.Popen[bytes]) -> Optional[Any]:
+    """
+    Reap process with wait4 to get its resource usage, filling returncode like Popen.wait would.
+
+    Returns None where wait4 is not available, process is waited normally in that case.
+    """
+
+    if not hasattr(os, "wait4"):
+        cmd.wait()
+
+        return None
+
+    _, status, rusage = os.wait4(cmd.pid, 0)
+    cmd.returncode = os.waitstatus_to_exitcode(status)
+
+    return rusage
+
+
+class ContainerSampler:
+    """
+    Periodically reads cgroup statistics of a docker container identified by --cidfile.
+
+    Container cgroup disappears together with container (especially with --rm) so values have to be sampled while it
+    is running, last successful sample is kept.
+    """
+
+    SAMPLE_INTERVAL = 5.0
+
+    def __init__(self, cidfile: Path) -> None:
+        self._cidfile = cidfile
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+
+        self.usage: Optional[ContainerUsage] = None
+
+    def start(self) -> ContainerSampler:
+        self._thread.start()
+
+        return self
+
+    def stop(self) -> Optional[ContainerUsage]:
+        self._stop.set()
+        self._thread.join()
+
+        return self.usage
+
+    def _sample_loop(self) -> None:
+        container_id: Optional[str] = None
+
+        while True:
+            if container_id is None:
+                container_id = self._read_container_id()
+
+            if container_id is not None:
+                try:
+                    self._sample(container_id)
+                except (OSError, ValueError) as e:
+                    log.debug("Failed to sample cgroup of container %s: %s", container_id, e)
+
+            if self._stop.wait(self.SAMPLE_INTERVAL):
+                break
+
+    def _read_container_id(self) -> Optional[str]:
+        try:
+            return self._cidfile.read_text().strip() or None
+        except OSError:
+            return None
+
+    def _sample(self, container_id: str) -> None:
+        for template in _CGROUP_V2_DIRS:
+            if (path := Path(template.format(id=container_id))).is_dir():
+                self._merge(self._read_v2(path))
+                return
+
+        memory, cpuacct, blkio = (Path(template.format(id=container_id)) for _, template in _CGROUP_V1_DIRS)
+        if memory.is_dir():
+            self._merge(self._read_v1(memory, cpuacct, blkio))
+
+    def _merge(self, sample: ContainerUsage) -> None:
+        # counters only grow while container lives, peak is kept in case kernel does not track it
+        if (previous := self.usage) is not None:
+            sample.peak_memory = max(sample.peak_memory, previous.peak_memory)
+
+        self.usage = sample
+
+    @staticmethod
+    def _read_v2(path: Path) -> ContainerUsage:
+        usage = ContainerUsage()
+
+        for line in (path / "cpu.stat").read_text().splitlines():
+            key, value = line.split()
+            if key == "usage_usec":
+                usage.cpu_time = int(value) / 1_000_000
+
+        # memory.peak only exists on newer kernels
+        peak_file = path / "memory.peak"
+        if not peak_file.is_file():
+            peak_file = path / "memory.current"
+        usage.peak_memory = int(peak_file.read_text())
+
+        if (io_file := path / "io.stat").is_file():
+            for line in io_file.read_text().splitlines():
+                for pair in line.split()[1:]:
+                    key, value = pair.split("=")
+                    if key == "rbytes":
+                        usage.read_bytes += int(value)
+                    elif key == "wbytes":
+                        usage.written_bytes += int(value)
+
+        return usage
+
+    @staticmethod
+    def _read_v1(memory: Path, cpuacct: Path, blkio: Path) -> ContainerUsage:
+        usage = ContainerUsage(peak_memory=int((memory / "memory.max_usage_in_bytes").read_text()))
+
+        if (cpu_file := cpuacct / "cpuacct.usage").is_file():
+            usage.cpu_time = int(cpu_file.read_text()) / 1_000_000_000
+
+        if (io_file := blkio / "blkio.throttle.io_service_bytes").is_file():
+            for line in io_file.read_text().splitlines():
+                parts = line.split()
+                if len(parts) != 3:
+                    continue
+
+                if parts[1] == "Read":
+                    usage.read_bytes += int(parts[2])
+                elif parts[1] == "Write":
+                    usage.written_bytes += int(parts[2])
+
+        return usage
+
+
+class UsageRecorder:
+    """Thread safe collection of finished process usages for the whole run"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._usages: list[ProcessUsage] = []
+
+    def record(self, usage: ProcessUsage) -> None:
+        with self._lock:
+            self._usages.append(usage)
+
+    @property
+    def usages(self) -> list[ProcessUsage]:
+        with self._lock:
+            return list(self._usages)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._usages.clear()
+
+
+recorder = UsageRecorder()
+
+
+def format_usage_table(usages: list[ProcessUsage]) -> str:
+    """Render usages as plain text table suitable for logging"""
+
+    header = ("command", "status", "wall", "user", "sys", "peak rss", "read", "written", "ctr cpu", "ctr mem", "ctr io")
+    rows = [header]
+
+    for usage in usages:
+        if (container := usage.container) is not None:
+            container_columns = (
+                format_seconds(container.cpu_time),
+                format_size(container.peak_memory),
+                f"{format_size(container.read_bytes)} / {format_size(container.written_bytes)}",
+            )
+        else:
+            container_columns = ("-", "-", "-")
+
+        rows.append(
+            (
+                usage.label,
+                str(usage.returncode),
+                format_seconds(usage.wall_time),
+                format_seconds(usage.user_time),
+                format_seconds(usage.system_time),
+                format_size(usage.peak_rss),
+                format_size(usage.read_bytes),
+                format_size(usage.written_bytes),
+                *container_columns,
+            )
+        )
+
+    return format_table(rows)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional, ParamSpec, TypeVar
+
+__all__ = (
+    "Span",
+    "Tracer",
+    "span",
+    "traced",
+    "tracer",
+)
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+@dataclass
+class Span:
+    id: int
+    name: str
+    parent_id: Optional[int]
+    thread_id: int
+    thread_name: str
+    # nanoseconds since tracer creation
+    start: int
+    end: Optional[int] = None
+    args: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Seconds, None if span is still open"""
+
+        if self.end is None:
+            return None
+
+        return (self.end - self.start) / 1e9
+
+
+class Tracer:
+    """
+    Collects nested timed spans of the run and exports them in chrome trace event format.
+
+    Parent span is tracked per context, so spans opened in other threads start their own trees unless context is
+    copied. Resulting file can be opened in chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self) -> None:
+        self._origin = time.perf_counter_ns()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._spans: list[Span] = []
+        self._current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[Span]:
+        parent = self._current.get()
+        thread = threading.current_thread()
+
+        current = Span(
+            id=next(self._ids),
+            name=name,
+            parent_id=None if parent is None else parent.id,
+            thread_id=threading.get_native_id(),
+            thread_name=thread.name,
+            start=time.perf_counter_ns() - self._origin,
+            args=args,
+        )
+
+        with self._lock:
+            self._spans.append(current)
+
+        token = self._current.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.args["error"] = repr(e)
+            raise
+        finally:
+            current.end = time.perf_counter_ns() - self._origin
+            self._current.reset(token)
+
+    def traced(self, name: Optional[str] = None) -> Callable[[Callable[P, R]], Callable[P, R]]:
+        """Decorator wrapping every call of function in a span, named after function by default"""
+
+        def decorator(func: Callable[P, R]) -> Callable[P, R]:
+            span_name = func.__qualname__ if name is None else name
+
+            @functools.wraps(func)
+            def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def reset(self) -> None:
+        """Forget finished spans, for processes doing several runs"""
+
+        with self._lock:
+            self._spans = [current for current in self._spans if current.end is None]
+
+    @property
+    def spans(self) -> list[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def chrome_trace(self) -> dict[str, Any]:
+        pid = os.getpid()
+        now = time.perf_counter_ns() - self._origin
+
+        trace_events: list[dict[str, Any]] = []
+        thread_names: dict[int, str] = {}
+
+        for current in self.spans:
+            thread_names[current.thread_id] = current.thread_name
+
+            # spans still open at export time are cut at export time
+            end = current.end if current.end is not None else now
+
+            trace_events.append(
+                {
+                    "name": current.name,
+                    "ph": "X",
+                    # microseconds
+                    "ts": current.start / 1000,
+                    "dur": (end - current.start) / 1000,
+                    "pid": pid,
+                    "tid": current.thread_id,
+                    "args": {
+                        **current.args,
+                        "span_id": current.id,
+                        "parent_id": current.parent_id,
+                    },
+                }
+            )
+
+        for thread_id, thread_name in thread_names.items():
+            trace_events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": thread_id,
+                    "args": {"name": thread_name},
+                }
+            )
+
+        return {
+            "traceEvents": trace_events,
+            "displayTimeUnit": "ms",
+        }
+
+    def export_chrome_trace(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with path.open("w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, default=str)
+
+
+tracer = Tracer()
+
+span = tracer.span
+traced = tracer.traced
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from .output import LineSplitter
+
+__all__ = (
+    "BuildLogMetrics",
+    "LogTailer",
+    "PhaseTiming",
+    "UnityLogParser",
+)
+
+log = logging.getLogger("usautobuild")
+
+_SIZE_UNITS = {
+    "b": 1,
+    "kb": 1024,
+    "mb": 1024**2,
+    "gb": 1024**3,
+}
+
+# phases reporting their own duration
+_DURATION_PATTERNS = (
+    ("domain_reload", re.compile(r"- Completed reload, in\s+(?P<seconds>[\d.]+) seconds")),
+    ("script_compilation", re.compile(r"- Finished script compilation in (?P<seconds>[\d.]+) seconds")),
+    ("asset_import", re.compile(r"Asset Pipeline Refresh: Total: (?P<seconds>[\d.]+) seconds")),
+)
+
+# phases without summary line, timed between first and last line mentioning them as they are read
+_SPAN_PATTERNS = (
+    ("shader_compilation", re.compile(r"^Compiling shader |^Compiled shader |Compiling shader variants")),
+    # il2cpp is mentioned all over editor log (package paths, player settings, caches), only count build steps:
+    # older editors invoke il2cpp directly, newer ones run it as bee build graph nodes printed as "[ 3/12  5s] Node"
+    (
+        "il2cpp",
+        re.compile(r"^Invoking il2cpp with arguments|^\[\s*\d+/\s*\d+\s+\d+s\]\s+(?:IL2CPP_CodeGen|C_\w+|Link_\w+)\s"),
+    ),
+)
+
+_BUILD_REPORT_START = "Uncompressed usage by category"
+_BUILD_SIZE = re.compile(r"^Complete build size\s+(?P<size>[\d.]+) (?P<unit>[kmg]?b)\b", re.IGNORECASE)
+_CATEGORY_SIZE = re.compile(r"^(?P<category>[A-Z][\w ]*?)\s+(?P<size>[\d.]+) (?P<unit>[kmg]?b)\s+[\d.]+%", re.IGNORECASE)
+_BUILD_RESULT = re.compile(r"Build Finished, Result: (?P<result>\w+)")
+
+
+def _parse_size(size: str, unit: str) -> int:
+    return int(float(size) * _SIZE_UNITS[unit.lower()])
+
+
+@dataclass
+class PhaseTiming:
+    duration: float = 0.0
+    # how many times phase happened, some of them run multiple times per build
+    count: int = 0
+    first_seen: Optional[float] = None
+    last_seen: Optional[float] = None
+
+
+@dataclass
+class BuildLogMetrics:
+    phases: dict[str, PhaseTiming] = field(default_factory=dict)
+    # in bytes, from player build report
+    build_size: Optional[int] = None
+    size_by_category: dict[str, int] = field(default_factory=dict)
+    result: Optional[str] = None
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "phases": {name: {"duration": phase.duration, "count": phase.count} for name, phase in self.phases.items()},
+            "build_size": self.build_size,
+            "size_by_category": dict(self.size_by_category),
+            "result": self.result,
+        }
+
+    def summary(self) -> str:
+        parts = [f"{name} {phase.duration:.1f}s" for name, phase in self.phases.items()]
+        if self.build_size is not None:
+            parts.append(f"size {self.build_size / _SIZE_UNITS['mb']:.1f} MiB")
+
+        return ", ".join(parts) or "no phases found"
+
+
+class UnityLogParser:
+    """Extracts phase timings and build report from unity editor log fed line by line"""
+
+    def __init__(self) -> None:
+        self.metrics = BuildLogMetrics()
+        self._in_build_report = False
+
+    def _phase(self, name: str) -> PhaseTiming:
+        if (phase := self.metrics.phases.get(name)) is None:
+            phase = self.metrics.phases[name] = PhaseTiming()
+
+        return phase
+
+    def feed(self, line: str, timestamp: Optional[float] = None) -> None:
+        if timestamp is None:
+            timestamp = time.time()
+
+        line = line.strip()
+
+        for name, pattern in _DURATION_PATTERNS:
+            if (match := pattern.search(line)) is not None:
+                phase = self._phase(name)
+                phase.duration += float(match["seconds"])
+                phase.count += 1
+                phase.first_seen = phase.first_seen or timestamp
+                phase.last_seen = timestamp
+
+                return
+
+        for name, pattern in _SPAN_PATTERNS:
+            if pattern.search(line) is not None:
+                phase = self._phase(name)
+                if phase.first_seen is None:
+                    phase.first_seen = timestamp
+                    phase.count = 1
+                phase.last_seen = timestamp
+                phase.duration = timestamp - phase.first_seen
+
+                return
+
+        if (match := _BUILD_RESULT.search(line)) is not None:
+            self.metrics.result = match["result"]
+            return
+
+        if line.startswith(_BUILD_REPORT_START):
+            self._in_build_report = True
+            return
+
+        if (match := _BUILD_SIZE.match(line)) is not None:
+            self.metrics.build_size = _parse_size(match["size"], match["unit"])
+            self._in_build_report = False
+            return
+
+        if self._in_build_report and (match := _CATEGORY_SIZE.match(line)) is not None:
+            self.metrics.size_by_category[match["category"]] = _parse_size(match["size"], match["unit"])
+
+
+class LogTailer:
+    """
+    Follows a log file in background thread feeding new lines to parser, like tail -F.
+
+    File does not have to exist when tailer starts and is reopened if truncated.
+    """
+
+    POLL_INTERVAL = 1.0
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, path: Path, parser: Optional[UnityLogParser] = None) -> None:
+        self.path = path
+        self.parser = parser or UnityLogParser()
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._tail_loop, daemon=True)
+
+    def start(self) -> LogTailer:
+        self._thread.start()
+
+        return self
+
+    def stop(self) -> BuildLogMetrics:
+        """Read whatever is left in file and stop following it"""
+
+        self._stop.set()
+        self._thread.join()
+
+        return self.parser.metrics
+
+    def _tail_loop(self) -> None:
+        position = 0
+        splitter = LineSplitter()
+
+        while True:
+            # grab stop flag before reading so last read happens after process finished writing
+            stopping = self._stop.is_set()
+
+            try:
+                if self.path.stat().st_size < position:
+                    log.debug("%s was truncated, reading from start", self.path)
+                    position = 0
+                    splitter = LineSplitter()
+
+                with self.path.open("rb") as f:
+                    f.seek(position)
+                    while data := f.read(self.CHUNK_SIZE):
+                        now = time.time()
+                        for line in splitter.feed(data):
+                            self.parser.feed(line, now)
+                    position = f.tell()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log.debug("Failed reading %s: %s", self.path, e)
+
+            if stopping:
+                for line in splitter.flush():
+                    self.parser.feed(line)
+
+                break
+
+            self._stop.wait(self.POLL_INTERVAL)
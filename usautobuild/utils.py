@@ -1,57 +1,185 @@
+import contextlib
+import dataclasses
 import io
 import logging
+import os
 import selectors
+import signal
 import subprocess
 import sys
+import tempfile
+import time
 
+from collections.abc import Mapping
 from datetime import datetime
 from pathlib import Path
-from typing import Iterator, Optional
+from typing import Iterator, Optional, TextIO
 
-import humanize
-
-from git import Repo
+from . import events, tracing
+from .exceptions import ProcessTimeoutError
+from .output import BoundedCapture, LineSplitter, is_level_handled
+from .resources import ContainerSampler, ProcessUsage, recorder, wait_with_rusage
+from .watchdog import Watchdog
 
 __all__ = (
+    "atomic_write",
     "run_process_shell",
+    "iterate_chunks",
     "iterate_output",
+    "terminate_process_group",
     "git_version",
 )
 
 log = logging.getLogger("usautobuild")
 
 
-def run_process_shell(command: str, stderr_on_failure: bool = False) -> int:
-    """A simple helper function to run shell program to completion logging output and returning status"""
+def run_process_shell(
+    command: str,
+    stderr_on_failure: bool = False,
+    tee: Optional[Path] = None,
+    label: Optional[str] = None,
+    cidfile: Optional[Path] = None,
+    watchdog: Optional[Watchdog] = None,
+    env: Optional[Mapping[str, str]] = None,
+) -> int:
+    """
+    A simple helper function to run shell program to completion logging output and returning status.
+
+    Raw output of both streams is appended to tee file if it is given. Stdout is only split into lines when debug
+    records are going to be handled by anyone, otherwise it is drained as is. Stderr held back until failure only
+    keeps a bounded tail in memory, the rest is spilled to a temporary file.
+
+    Resource usage of every command is recorded under label (command itself by default). If command runs a docker
+    container with --cidfile, pass the same path to also sample container cgroup statistics.
 
-    stderr = []
+    With watchdog command runs in its own process group which is terminated once watchdog considers it hung, then
+    ProcessTimeoutError is raised. Cleaning up anything command started outside of its process group (like docker
+    containers) is up to the caller.
 
-    with subprocess.Popen(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        # there is no user input
-        shell=True,  # noqa: S602
-    ) as cmd:
-        for line, is_stdout in iterate_output(cmd):
-            if is_stdout:
+    Variables in env are added on top of process environment.
+    """
+
+    if label is None:
+        label = command if len(command) <= 60 else f"{command[:57]}..."
+
+    stderr = BoundedCapture()
+
+    def handle_stderr(lines: list[str]) -> None:
+        if stderr_on_failure:
+            stderr.extend(lines)
+        else:
+            for line in lines:
+                log.error(line)
+
+    stdout_lines = LineSplitter() if is_level_handled(log, logging.DEBUG) else None
+    stderr_lines = LineSplitter()
+
+    sampler = None if cidfile is None else ContainerSampler(cidfile).start()
+    start = time.monotonic()
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(tracing.span(label, command=command))
+        stack.callback(stderr.close)
+
+        if sampler is not None:
+            stack.callback(sampler.stop)
+
+        tee_file = None if tee is None else stack.enter_context(tee.open("ab"))
+
+        cmd = stack.enter_context(
+            subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                # there is no user input
+                shell=True,  # noqa: S602
+                # separate group lets us kill shell together with everything it spawned
+                start_new_session=watchdog is not None,
+                env=None if env is None else {**os.environ, **env},
+            )
+        )
+
+        try:
+            for data, is_stdout in iterate_chunks(cmd, watchdog):
+                if tee_file is not None:
+                    tee_file.write(data)
+
+                if not is_stdout:
+                    handle_stderr(stderr_lines.feed(data))
+                elif stdout_lines is not None:
+                    for line in stdout_lines.feed(data):
+                        log.debug(line)
+        except BaseException as e:
+            # process group is detached from our terminal, it would not receive ctrl+c on its own
+            if watchdog is not None:
+                log.error("Stopping %s: %s", label, e)
+                terminate_process_group(cmd)
+                recorder.record(ProcessUsage(label, time.monotonic() - start, cmd.returncode))
+
+            raise
+
+        if stdout_lines is not None:
+            for line in stdout_lines.flush():
                 log.debug(line)
-            else:
-                if stderr_on_failure:
-                    stderr.append(line)
-                else:
-                    log.error(line)
 
-    if cmd.returncode:
-        for line in stderr:
-            log.error(line)
+        handle_stderr(stderr_lines.flush())
+
+        rusage = wait_with_rusage(cmd)
+
+    wall_time = time.monotonic() - start
+
+    if rusage is not None:
+        usage = ProcessUsage.from_rusage(label, wall_time, cmd.returncode, rusage)
+    else:
+        usage = ProcessUsage(label, wall_time, cmd.returncode)
+
+    if sampler is not None:
+        usage.container = sampler.usage
+
+    recorder.record(usage)
+    events.emit("process", duration=wall_time, status=str(cmd.returncode), **dataclasses.asdict(usage))
+
+    if not cmd.returncode:
+        stderr.discard()
+
+        return cmd.returncode
+
+    if stderr.dropped:
+        if stderr.spill_path is not None:
+            log.error("Omitted %s earlier stderr lines, full output saved to %s", stderr.dropped, stderr.spill_path)
+        else:
+            log.error("Omitted %s earlier stderr lines", stderr.dropped)
+
+    for line in stderr.lines:
+        log.error(line)
 
     return cmd.returncode
 
 
-def iterate_output(cmd: subprocess.Popen[bytes]) -> Iterator[tuple[str, bool]]:
+def terminate_process_group(cmd: subprocess.Popen[bytes], grace_period: float = 30.0) -> None:
+    """Politely terminate process group started with start_new_session, kill it if it does not exit in time"""
+
+    try:
+        os.killpg(cmd.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+
+    try:
+        cmd.wait(timeout=grace_period)
+    except subprocess.TimeoutExpired:
+        log.warning("Process group %s did not terminate in %ss, killing", cmd.pid, grace_period)
+
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(cmd.pid, signal.SIGKILL)
+
+        cmd.wait()
+
+
+def iterate_chunks(cmd: subprocess.Popen[bytes], watchdog: Optional[Watchdog] = None) -> Iterator[tuple[bytes, bool]]:
     """
-    Iterates process stdout and stderr at the same time yielding lines and is_stdout boolean
+    Iterates process stdout and stderr at the same time yielding raw chunks of bytes and is_stdout boolean
+
+    Output counts as progress for watchdog, ProcessTimeoutError is raised if watchdog decides process is hung.
     """
 
     stdout: io.BufferedReader = cmd.stdout  # type: ignore[assignment]
@@ -61,57 +189,94 @@ def iterate_output(cmd: subprocess.Popen[bytes]) -> Iterator[tuple[str, bool]]:
     # https://docs.python.org/3/library/select.html
     # emulate old sequential behaviour: all stdout then all stderr
     if sys.platform in ("win32", "cygwin"):
-        for win_line in stdout:
-            yield win_line.decode(), True
+        while data := stdout.read1():
+            yield data, True
 
-        for win_line in stderr:
-            yield win_line.decode(), False
+        while data := stderr.read1():
+            yield data, False
 
         return
 
-    sel = selectors.DefaultSelector()
+    poll_interval = None if watchdog is None else watchdog.poll_interval
+    last_check = time.monotonic()
+
+    with selectors.DefaultSelector() as sel:
+        sel.register(stdout, selectors.EVENT_READ)
+        sel.register(stderr, selectors.EVENT_READ)
+
+        # keep reading until both streams are closed, one of them can finish much earlier
+        while sel.get_map():
+            for key, _ in sel.select(poll_interval):
+                fileobj: io.BufferedReader = key.fileobj  # type: ignore[assignment]
+
+                if not (data := fileobj.read1()):
+                    sel.unregister(fileobj)
+                    continue
+
+                if watchdog is not None:
+                    watchdog.progress()
+
+                yield data, fileobj is stdout
+
+            # select does not time out while process keeps printing, so checks are throttled separately
+            if watchdog is not None and (now := time.monotonic()) - last_check >= watchdog.poll_interval:
+                last_check = now
 
-    sel.register(stdout, selectors.EVENT_READ)
-    sel.register(stderr, selectors.EVENT_READ)
+                if (reason := watchdog.check()) is not None:
+                    raise ProcessTimeoutError(reason)
+
+
+def iterate_output(cmd: subprocess.Popen[bytes]) -> Iterator[tuple[str, bool]]:
+    """
+    Iterates process stdout and stderr at the same time yielding lines and is_stdout boolean
+    """
 
     # list for perfomance reasons (untested), dict makes more sense here
-    stream_buffers = ["", ""]
-
-    not_eof = True
-    while not_eof:
-        for key, _ in sel.select():
-            fileobj: io.BufferedReader = key.fileobj  # type: ignore[assignment]
-
-            if not (data := fileobj.read1()):
-                not_eof = False
-                break
-
-            # yield in the following steps:
-            #   - merge buffer with new data
-            #   - split data at newlines
-            #   - buffer last line (empty string in case of complete line)
-            #   - yield everything except buffered last line
-            is_stdout = fileobj is stdout
-            # TODO: make decode optional?
-            lines = (stream_buffers[is_stdout] + data.decode()).split("\n")
-            stream_buffers[is_stdout] = lines[-1]
-
-            for line in lines[:-1]:
-                yield line, is_stdout
+    splitters = [LineSplitter(), LineSplitter()]
+
+    for data, is_stdout in iterate_chunks(cmd):
+        for line in splitters[is_stdout].feed(data):
+            yield line, is_stdout
 
     # force flush buffers
-    is_stdout = True
-    if stream_buffers[is_stdout]:
-        yield stream_buffers[is_stdout], is_stdout
+    for is_stdout in (True, False):
+        for line in splitters[is_stdout].flush():
+            yield line, is_stdout
+
+
+@contextlib.contextmanager
+def atomic_write(path: Path, permissions: Optional[int] = None) -> Iterator[TextIO]:
+    """
+    Write text file under temporary name next to path, replacing path with it once block finishes without error.
+
+    Readers never see half written file and crash mid write keeps previous contents. Temporary file is only readable
+    by owner unless permissions are given.
+    """
 
-    is_stdout = False
-    if stream_buffers[is_stdout]:
-        yield stream_buffers[is_stdout], is_stdout
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    tmp = Path(tmp_name)
+
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            yield f
+
+        if permissions is not None:
+            tmp.chmod(permissions)
+
+        tmp.replace(path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
 
 
 def git_version(directory: Optional[Path] = None, brief: bool = True) -> str:
     """Get repository version for given folder in human readable format. Single line"""
 
+    # slow to import, most of the commands never need them
+    import humanize
+
+    from git import Repo
+
     if directory is None:
         directory = Path.cwd()
 
@@ -0,0 +1,70 @@
+import time
+
+from collections.abc import Callable, Sequence
+from pathlib import Path
+from typing import Optional
+
+__all__ = ("Watchdog",)
+
+
+class Watchdog:
+    """
+    Decides when a running process should be considered hung.
+
+    Process is hung when it either runs longer than timeout or shows no progress for inactivity_timeout. Progress is
+    any output reported via progress() or change in size of any watched file, which covers programs like unity editor
+    that write everything to a log file instead of stdout.
+    """
+
+    # upper bound on how often check() should be called
+    MAX_POLL_INTERVAL = 5.0
+
+    def __init__(
+        self,
+        timeout: Optional[float] = None,
+        inactivity_timeout: Optional[float] = None,
+        watch_files: Sequence[Path] = (),
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.timeout = timeout
+        self.inactivity_timeout = inactivity_timeout
+        self.watch_files = tuple(watch_files)
+
+        self._clock = clock
+        self._started = clock()
+        self._last_progress = self._started
+        self._file_sizes: dict[Path, Optional[int]] = {path: self._file_size(path) for path in self.watch_files}
+
+    @property
+    def poll_interval(self) -> float:
+        limits = [limit for limit in (self.timeout, self.inactivity_timeout) if limit is not None]
+
+        return min([self.MAX_POLL_INTERVAL, *(limit / 2 for limit in limits)])
+
+    def progress(self) -> None:
+        self._last_progress = self._clock()
+
+    def check(self) -> Optional[str]:
+        """Return reason why process should be killed or None if it is fine"""
+
+        now = self._clock()
+
+        if self.timeout is not None and now - self._started > self.timeout:
+            return f"exceeded timeout of {self.timeout:.0f}s"
+
+        for path, last_size in self._file_sizes.items():
+            if (size := self._file_size(path)) != last_size:
+                self._file_sizes[path] = size
+                self._last_progress = now
+
+        if self.inactivity_timeout is not None and now - self._last_progress > self.inactivity_timeout:
+            return f"no progress for {now - self._last_progress:.0f}s"
+
+        return None
+
+    @staticmethod
+    def _file_size(path: Path) -> Optional[int]:
+        try:
+            return path.stat().st_size
+        except OSError:
+            return None
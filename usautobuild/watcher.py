@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import re
+import subprocess
+import time
+
+from collections.abc import Callable, Sequence
+from logging import getLogger
+from typing import Optional
+
+from .daemon import BuildJob
+
+__all__ = (
+    "RefWatcher",
+    "ls_remote",
+    "parse_ls_remote",
+)
+
+log = getLogger("usautobuild")
+
+_PR_REF = re.compile(r"^refs/pull/(?P<number>\d+)/head$")
+_BRANCH_PREFIX = "refs/heads/"
+
+
+def parse_ls_remote(output: str) -> dict[str, str]:
+    """Map of ref name to commit from git ls-remote output"""
+
+    refs = {}
+
+    for line in output.splitlines():
+        commit, _, ref = line.partition("\t")
+        if ref:
+            refs[ref] = commit
+
+    return refs
+
+
+def ls_remote(url: str, patterns: Sequence[str], timeout: float = 60.0) -> dict[str, str]:
+    """Heads of remote refs, only ref advertisement is transferred so this is cheap compared to fetch"""
+
+    output = subprocess.check_output(
+        ["git", "ls-remote", url, *patterns],  # noqa: S603, S607
+        stderr=subprocess.PIPE,
+        timeout=timeout,
+        text=True,
+    )
+
+    return parse_ls_remote(output)
+
+
+class RefWatcher:
+    """
+    Polls remote branch and optionally PR heads, producing build jobs for refs that moved.
+
+    First poll only remembers current heads. A moved ref is built once it stayed at the same commit for debounce
+    seconds, so a series of quick pushes results in a single build of the last one.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        branch: str,
+        include_prs: bool = False,
+        interval: float = 60.0,
+        debounce: float = 120.0,
+        release: bool = False,
+        dry_run: bool = False,
+        clock: Callable[[], float] = time.monotonic,
+        list_refs: Callable[[str, Sequence[str]], dict[str, str]] = ls_remote,
+    ) -> None:
+        self.url = url
+        self.patterns = [f"{_BRANCH_PREFIX}{branch}"]
+        if include_prs:
+            self.patterns.append("refs/pull/*/head")
+
+        self.interval = interval
+        self.debounce = debounce
+        self.release = release
+        self.dry_run = dry_run
+
+        self._clock = clock
+        self._list_refs = list_refs
+        self._next_check = 0.0
+        self._known: Optional[dict[str, str]] = None
+        # ref -> (commit, when it was first seen there)
+        self._pending: dict[str, tuple[str, float]] = {}
+
+    def poll(self) -> list[BuildJob]:
+        """Check remote if interval passed, returns jobs for refs that settled"""
+
+        now = self._clock()
+        if now < self._next_check:
+            return []
+
+        self._next_check = now + self.interval
+
+        try:
+            refs = self._list_refs(self.url, self.patterns)
+        except (OSError, subprocess.SubprocessError) as e:
+            log.warning("Failed listing remote refs: %s", e)
+            return []
+
+        if self._known is None:
+            log.debug("Watching %s refs of %s", len(refs), self.url)
+            self._known = refs
+            return []
+
+        for ref, commit in refs.items():
+            if self._known.get(ref) == commit:
+                continue
+
+            if (pending := self._pending.get(ref)) is None or pending[0] != commit:
+                log.info("%s moved to %s", ref, commit[:10])
+                self._pending[ref] = (commit, now)
+
+        self._known = refs
+
+        jobs = []
+        for ref, (commit, changed) in list(self._pending.items()):
+            if now - changed < self.debounce:
+                continue
+
+            del self._pending[ref]
+            if (job := self._job(ref)) is not None:
+                log.info("Scheduling build of %s at %s", ref, commit[:10])
+                jobs.append(job)
+
+        return jobs
+
+    def _job(self, ref: str) -> Optional[BuildJob]:
+        if ref.startswith(_BRANCH_PREFIX):
+            return BuildJob(branch=ref.removeprefix(_BRANCH_PREFIX), release=self.release, dry_run=self.dry_run)
+
+        if (match := _PR_REF.match(ref)) is not None:
+            return BuildJob(pr=int(match["number"]), release=self.release, dry_run=self.dry_run)
+
+        return None